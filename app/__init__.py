@@ -15,6 +15,14 @@ def create_app():
     db.init_app(app)
     migrate.init_app(app, db)
 
+    # طابور المهام الخلفية (مزامنة البصمة، الرواتب...)
+    from app.jobs import job_queue
+    job_queue.init_app(app)
+
+    # طابور الكتابة المؤجلة لتسجيلات الدخول (يعمل فقط مع CHECKIN_WRITE_BEHIND)
+    from app.checkin_buffer import checkin_buffer
+    checkin_buffer.init_app(app)
+
     # Register CLI commands (Moved after db init to avoid circular imports)
     from app.commands import (
         reset_db,
@@ -26,7 +34,8 @@ def create_app():
         clear_table,
         seed_db,
         check_connection,
-        test_users
+        test_users,
+        index_advisor
     )
 
     app.cli.add_command(reset_db)
@@ -39,6 +48,7 @@ def create_app():
     app.cli.add_command(seed_db)
     app.cli.add_command(check_connection)
     app.cli.add_command(test_users)
+    app.cli.add_command(index_advisor)
 
     # Register blueprints
     from app.routes.auth import auth_routes
@@ -64,6 +74,7 @@ def create_app():
     from app.routes.transaction_routes import transaction_bp
     from app.routes.leave_routes import leave_bp
     from app.routes.id_card import id_card_bp
+    from app.routes.jobs import job_bp
 
 
     app.register_blueprint(auth_routes)
@@ -89,6 +100,7 @@ def create_app():
     app.register_blueprint(transaction_bp)
     app.register_blueprint(leave_bp)
     app.register_blueprint(id_card_bp)
+    app.register_blueprint(job_bp)
 
 
 
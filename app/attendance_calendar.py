@@ -0,0 +1,82 @@
+# app/attendance_calendar.py
+"""
+فهرس تقويم الحضور لفترة محددة:
+- جميع العطل النشطة في الفترة من تقويم العطل (holiday_calendar)
+- جميع الإجازات النشطة للموظفين المحددين باستعلام واحد (لكل دفعة موظفين)
+ثم الإجابة عن "هل الموظف في عطلة/إجازة في اليوم D ولماذا" من قواميس في الذاكرة
+بدلاً من Holiday.is_holiday و Leave.get_employee_leaves_for_date لكل موظف ولكل يوم
+"""
+from datetime import timedelta
+from app import db
+
+# SQL Server لا يقبل أكثر من 2100 معامل في الاستعلام الواحد
+IN_BATCH_SIZE = 1000
+
+
+class AttendanceCalendar:
+    """
+    فهرس العطل والإجازات لفترة ومجموعة موظفين - يُبنى مرة واحدة لكل طلب
+    """
+
+    def __init__(self, start_date, end_date, employee_ids):
+        self.start_date = start_date
+        self.end_date = end_date
+        self._holidays_by_date = {}
+        self._leaves_by_employee_date = {}
+        self._load_holidays()
+        self._load_leaves(list(employee_ids))
+
+    def _load_holidays(self):
+        from app.holiday_calendar import holiday_calendar
+
+        # من تقويم العطل في الذاكرة بدلاً من استعلام لكل طلب
+        for holiday in holiday_calendar.get_holidays_in_period(self.start_date, self.end_date):
+            self._holidays_by_date.setdefault(holiday.date, []).append(holiday)
+
+    def _load_leaves(self, employee_ids):
+        from app.models.leave import Leave
+
+        for start in range(0, len(employee_ids), IN_BATCH_SIZE):
+            chunk = employee_ids[start:start + IN_BATCH_SIZE]
+            leaves = Leave.query.filter(
+                Leave.employee_id.in_(chunk),
+                Leave.status == 'active',
+                Leave.start_date <= self.end_date,
+                db.or_(
+                    Leave.end_date >= self.start_date,
+                    Leave.end_date.is_(None)
+                )
+            ).order_by(Leave.id).all()
+
+            for leave in leaves:
+                # نفس شرط get_employee_leaves_for_date: start_date <= D <= end_date (أو بدون نهاية)
+                current = max(leave.start_date, self.start_date)
+                last = min(leave.end_date, self.end_date) if leave.end_date else self.end_date
+                while current <= last:
+                    self._leaves_by_employee_date.setdefault((leave.employee_id, current), []).append(leave)
+                    current += timedelta(days=1)
+
+    def get_holiday(self, target_date, branch_id=None, department_id=None):
+        """
+        مكافئ Holiday.is_holiday: أول عطلة تنطبق على الفرع/القسم أو None
+        """
+        from app.holiday_calendar import applies_to
+
+        for holiday in self._holidays_by_date.get(target_date, ()):
+            if applies_to(holiday, branch_id, department_id):
+                return holiday
+        return None
+
+    def get_employee_holiday(self, employee, target_date):
+        """العطلة الرسمية التي تنطبق على الموظف في التاريخ المحدد"""
+        return self.get_holiday(
+            target_date,
+            getattr(employee, 'branch_id', None),
+            getattr(employee, 'department_id', None)
+        )
+
+    def get_leaves(self, employee_id, target_date):
+        """
+        مكافئ Leave.get_employee_leaves_for_date
+        """
+        return self._leaves_by_employee_date.get((employee_id, target_date), [])
@@ -0,0 +1,172 @@
+# app/attendance_engine.py
+"""
+محرك تقييم أيام الحضور:
+- المدخلات أعمدة لفترة كاملة ولعدة موظفين: employee_id, day, check_in, check_out
+  (الأوقات بالثواني منذ منتصف الليل و NaN للقيمة الفارغة، واليوم رقم ترتيبي date.toordinal)
+- جدول الوردية مجمّع مسبقاً (ShiftCalendar.week_seconds) كمصفوفة 7 أيام لكل موظف
+- العمل والاستراحة والتأخير والخروج المبكر والإضافي تُحسب بعمليات pandas/NumPy على الأعمدة
+  بدلاً من حلقات datetime لكل سجل، ويقرأ منها ملخص الحضور والتقرير الشهري والرواتب نفس القيم
+"""
+from datetime import date as date_type, datetime
+import numpy as np
+import pandas as pd
+from app.shift_calendar import SLOT_ACTIVE, SLOT_END, SLOT_GRACE_IN, SLOT_GRACE_OUT, SLOT_START
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+def time_to_seconds(t):
+    """تحويل كائن الوقت إلى ثوان منذ منتصف الليل"""
+    if t is None:
+        return 0
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def time_to_minutes(t):
+    """تحويل كائن الوقت إلى دقائق منذ منتصف الليل"""
+    return t.hour * 60 + t.minute
+
+
+def shift_week(shift):
+    """
+    مصفوفة (7, 5) لجدول الوردية بالثواني من التقويم المجمّع - صف لكل يوم حسب date.weekday()
+    اليوم غير النشط أو بدون أوقات صالحة صفه أصفار
+    """
+    return shift.compiled_calendar().week_seconds
+
+
+def _day_of(attendance):
+    day = attendance.createdAt
+    return day.date() if isinstance(day, datetime) else day
+
+
+def _seconds_or_nan(t):
+    if t is None:
+        return np.nan
+    if isinstance(t, datetime):
+        t = t.time()
+    return time_to_seconds(t)
+
+
+def punches_from_attendances(attendances):
+    """تحويل سجلات Attendance إلى أعمدة المحرك"""
+    count = len(attendances)
+    return {
+        'employee_id': np.fromiter((a.empId for a in attendances), dtype=np.int64, count=count),
+        'day': np.fromiter((_day_of(a).toordinal() for a in attendances), dtype=np.int64, count=count),
+        'check_in': np.fromiter((_seconds_or_nan(a.checkInTime) for a in attendances), dtype=np.float64, count=count),
+        'check_out': np.fromiter((_seconds_or_nan(a.checkOutTime) for a in attendances), dtype=np.float64, count=count)
+    }
+
+
+def evaluate_days(punches, weeks):
+    """
+    تقييم كل (موظف، يوم) في الأعمدة المعطاة - DataFrame مفهرس بـ (employee_id, day)
+    weeks: {employee_id: shift_week(...)} والموظف بدون وردية يُعامل كيوم غير عمل
+
+    الأعمدة بالثواني:
+    - first_in / last_out: أول دخول وآخر خروج (NaN إن لم يوجد)
+    - worked: مجموع الفترات المكتملة الموجبة، span: من أول دخول إلى آخر خروج
+    - break_time: الفجوات الموجبة بين خروج فترة مكتملة والدخول التالي في نفس اليوم
+    - scheduled: مدة الوردية (مع الورديات الممتدة لليوم التالي)
+    - late / early: كامل التأخير أو الخروج المبكر إذا تجاوز السماح
+    - late_excess / early_excess: الجزء الزائد عن السماح فقط
+    - overtime: العمل الفعلي الزائد عن مدة الوردية، inside_shift: التداخل بين الحضور والوردية
+    """
+    frame = pd.DataFrame(punches)
+    frame = frame.sort_values(['employee_id', 'day', 'check_in'], kind='mergesort', na_position='last')
+
+    check_in = frame['check_in']
+    check_out = frame['check_out']
+    complete = check_in.notna() & check_out.notna()
+    frame['worked'] = (check_out - check_in).where(complete).clip(lower=0).fillna(0)
+
+    same_day = (
+        (frame['employee_id'].shift(-1) == frame['employee_id']) &
+        (frame['day'].shift(-1) == frame['day'])
+    )
+    gap = check_in.shift(-1) - check_out
+    frame['break_time'] = gap.where(complete & same_day).clip(lower=0).fillna(0)
+
+    days = frame.groupby(['employee_id', 'day'], sort=True).agg(
+        first_in=('check_in', 'min'),
+        last_out=('check_out', 'max'),
+        worked=('worked', 'sum'),
+        break_time=('break_time', 'sum'),
+        periods=('check_in', 'size')
+    )
+
+    # جدول الوردية لكل صف بفهرسة مصفوفة الأسابيع بدلاً من قراءة JSON
+    employee_ids = days.index.get_level_values('employee_id').to_numpy()
+    weekdays = (days.index.get_level_values('day').to_numpy() - 1) % 7
+    schedule = np.zeros((len(days), 5), dtype=np.float64)
+    if weeks:
+        keys = list(weeks)
+        positions = pd.Index(keys).get_indexer(employee_ids)
+        known = positions >= 0
+        stacked = np.stack([weeks[key] for key in keys])
+        schedule[known] = stacked[positions[known], weekdays[known]]
+
+    active = schedule[:, SLOT_ACTIVE] > 0
+    start = schedule[:, SLOT_START]
+    end = schedule[:, SLOT_END]
+    grace_in = schedule[:, SLOT_GRACE_IN]
+    grace_out = schedule[:, SLOT_GRACE_OUT]
+
+    first_in = days['first_in'].to_numpy()
+    last_out = days['last_out'].to_numpy()
+    worked = days['worked'].to_numpy()
+
+    scheduled = np.where(end < start, end + SECONDS_PER_DAY - start, end - start)
+    scheduled = np.where(active, scheduled, 0)
+
+    with np.errstate(invalid='ignore'):
+        late_by = np.nan_to_num(first_in - start, nan=0)
+        early_by = np.nan_to_num(end - last_out, nan=0)
+        is_late = active & (late_by > grace_in)
+        is_early = active & (early_by > grace_out)
+
+        inside = np.minimum(last_out, end) - np.maximum(first_in, start)
+        inside = np.where(active, np.nan_to_num(inside, nan=0).clip(min=0), 0)
+
+    days['span'] = np.nan_to_num(last_out - first_in, nan=0)
+    days['is_working'] = active
+    days['scheduled_start'] = np.where(active, start, np.nan)
+    days['scheduled_end'] = np.where(active, end, np.nan)
+    days['scheduled'] = scheduled
+    days['late'] = np.where(is_late, late_by, 0)
+    days['late_excess'] = np.where(active, late_by - grace_in, 0).clip(min=0)
+    days['early'] = np.where(is_early, early_by, 0)
+    days['early_excess'] = np.where(active, early_by - grace_out, 0).clip(min=0)
+    days['overtime'] = np.where(active, worked - scheduled, 0).clip(min=0)
+    days['inside_shift'] = inside
+    return days
+
+
+def evaluate_attendances(attendances, weeks):
+    """
+    تقييم سجلات Attendance مباشرة: {(employee_id, date): {metric: value}}
+    القيم بالثواني كما في evaluate_days
+    """
+    if not attendances:
+        return {}
+    days = evaluate_days(punches_from_attendances(attendances), weeks)
+    return {
+        (employee_id, date_type.fromordinal(day)): metrics
+        for (employee_id, day), metrics in days.to_dict('index').items()
+    }
+
+
+def overtime_seconds(day, leave_seconds=0):
+    """الإضافي بعد احتساب ساعات الإجازة المعتمدة كعمل - نفس قاعدة evaluate_days"""
+    if not day['is_working']:
+        return 0
+    return max(0, day['worked'] + leave_seconds - day['scheduled'])
+
+
+def seconds_to_minutes(seconds):
+    """تحويل الثواني إلى دقائق صحيحة (None للقيمة الفارغة)"""
+    if seconds is None or np.isnan(seconds):
+        return None
+    return int(seconds // 60)
+
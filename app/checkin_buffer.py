@@ -0,0 +1,313 @@
+# app/checkin_buffer.py
+"""
+طابور كتابة مؤجلة لتسجيلات الدخول في ذروة بداية الوردية (اختياري - CHECKIN_WRITE_BEHIND):
+- تسجيل الدخول يُكتب في ملف SQLite محلي بوضع WAL ويُرد على العميل فوراً (202)
+- خيط خلفي ينقل الدفعات إلى جدول attendances كل CHECKIN_FLUSH_INTERVAL_MS مع commit واحد للدفعة
+  وكل تسجيل يُدخل بنفس شرط المسار المباشر (Attendance.insert_if_no_record_for_day)
+- الدفعة تُحجز قبل النقل، والحجز الذي مضى عليه CHECKIN_CLAIM_STALE_SECONDS يُعاد (بعد توقف العملية)
+- كل تسجيل في savepoint خاص: تسجيل مرفوض (موظف محذوف، قيد) لا يُفشل الدفعة، ويُعاد لاحقاً
+  وبعد CHECKIN_MAX_ATTEMPTS محاولة يبقى في الملف كـ dead letter بدون أن يوقف ما بعده
+- النقل يستخدم جلسة مستقلة فلا يمس معاملة الطلب الذي استدعاه
+- القراءة بعد الكتابة: حضور اليوم والانصراف يريان التسجيلات التي لم تُنقل بعد
+  (الملف مشترك بين عمليات نفس الخادم فقط)
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, time as dt_time
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+from app import db
+
+DEFAULT_FLUSH_INTERVAL_MS = 200
+DEFAULT_FLUSH_BATCH = 500
+DEFAULT_CLAIM_STALE_SECONDS = 60
+DEFAULT_MAX_ATTEMPTS = 5
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pending_checkins (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    emp_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    check_in TEXT NOT NULL,
+    reason TEXT,
+    status TEXT NOT NULL,
+    open_only INTEGER NOT NULL DEFAULT 0,
+    queued_at TEXT NOT NULL,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_pending_checkins_emp_day ON pending_checkins (emp_id, day);
+'''
+
+# أعمدة أضيفت بعد إنشاء ملفات موجودة
+_ADDED_COLUMNS = (
+    ('attempts', 'INTEGER NOT NULL DEFAULT 0'),
+    ('dead', 'INTEGER NOT NULL DEFAULT 0'),
+    ('last_error', 'TEXT'),
+)
+
+# أخطاء خاصة بالتسجيل نفسه (تُحسب كمحاولة فاشلة له) - غيرها (انقطاع الاتصال) يعيد الدفعة كما هي
+_ROW_ERRORS = (IntegrityError, DataError)
+
+
+class CheckinBuffer:
+    """
+    طابور تسجيلات الدخول المحلي مع ناقل خلفي إلى قاعدة البيانات
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.path = None
+        self.enabled = False
+        self._stop = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = bool(app.config.get('CHECKIN_WRITE_BEHIND', False))
+        app.extensions['checkin_buffer'] = self
+        if not self.enabled:
+            return
+
+        self.path = app.config.get('CHECKIN_BUFFER_PATH') or os.path.join(app.instance_path, 'checkin_buffer.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(_SCHEMA)
+            existing = {row['name'] for row in connection.execute('PRAGMA table_info(pending_checkins)')}
+            for name, definition in _ADDED_COLUMNS:
+                if name not in existing:
+                    connection.execute(f'ALTER TABLE pending_checkins ADD COLUMN {name} {definition}')
+        finally:
+            connection.close()
+
+        self._thread = threading.Thread(target=self._run, name='hr-checkin-flusher', daemon=True)
+        self._thread.start()
+
+    # ==================== الطابور المحلي ====================
+
+    def _connect(self):
+        # synchronous=FULL: التسجيل محفوظ على القرص قبل الرد على العميل
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA synchronous=FULL')
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def enqueue(self, emp_id, day, check_in_time, reason=None, status='approved', open_only=False):
+        """إضافة تسجيل دخول للطابور - يعيد رقمه في الطابور"""
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                'INSERT INTO pending_checkins (emp_id, day, check_in, reason, status, open_only, queued_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (emp_id, day.isoformat(), check_in_time.isoformat(), reason, status,
+                 1 if open_only else 0, datetime.now().isoformat())
+            )
+            return cursor.lastrowid
+        finally:
+            connection.close()
+
+    def pending_for(self, emp_id, day=None):
+        """تسجيلات الموظف التي لم تُنقل بعد لليوم (قائمة قواميس مرتبة بالأقدم)"""
+        if not self.enabled:
+            return []
+        day = day or date.today()
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                'SELECT id, emp_id, day, check_in, reason, status, queued_at FROM pending_checkins '
+                'WHERE emp_id = ? AND day = ? AND dead = 0 ORDER BY id',
+                (emp_id, day.isoformat())
+            ).fetchall()
+        finally:
+            connection.close()
+        return [
+            {
+                'queue_id': row['id'],
+                'empId': row['emp_id'],
+                'date': row['day'],
+                'checkInTime': row['check_in'],
+                'checkInReason': row['reason'],
+                'status': row['status'],
+                'queuedAt': row['queued_at']
+            }
+            for row in rows
+        ]
+
+    def pending_count(self):
+        if not self.enabled:
+            return 0
+        connection = self._connect()
+        try:
+            return connection.execute('SELECT COUNT(*) FROM pending_checkins WHERE dead = 0').fetchone()[0]
+        finally:
+            connection.close()
+
+    def _claim(self, limit, emp_id=None, day=None):
+        """
+        حجز دفعة بشكل ذري (BEGIN IMMEDIATE يمنع عمليتين من حجز نفس التسجيلات)
+        emp_id/day: حجز تسجيلات موظف واحد فقط (النقل الفوري قبل الانصراف)
+        """
+        now = time.time()
+        stale_before = now - self.app.config.get('CHECKIN_CLAIM_STALE_SECONDS', DEFAULT_CLAIM_STALE_SECONDS)
+        conditions = 'dead = 0 AND (claimed_at IS NULL OR claimed_at < ?)'
+        params = [stale_before]
+        if emp_id is not None:
+            conditions += ' AND emp_id = ? AND day = ?'
+            params += [emp_id, (day or date.today()).isoformat()]
+
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            rows = connection.execute(
+                f'SELECT * FROM pending_checkins WHERE {conditions} ORDER BY id LIMIT ?',
+                params + [limit]
+            ).fetchall()
+            if rows:
+                connection.executemany(
+                    'UPDATE pending_checkins SET claimed_at = ? WHERE id = ?',
+                    [(now, row['id']) for row in rows]
+                )
+            connection.execute('COMMIT')
+            return rows
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+    def _write(self, statement, params):
+        """تنفيذ جملة على عدة تسجيلات في معاملة SQLite واحدة"""
+        if not params:
+            return
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(statement, params)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+    def _finish(self, ids, release=False):
+        """حذف التسجيلات المنقولة أو إعادتها للطابور بعد فشل النقل"""
+        statement = (
+            'UPDATE pending_checkins SET claimed_at = NULL WHERE id = ?' if release
+            else 'DELETE FROM pending_checkins WHERE id = ?'
+        )
+        self._write(statement, [(i,) for i in ids])
+
+    def _fail(self, failures):
+        """
+        تسجيل فشل تسجيلات بعينها: تُعاد للطابور مع زيادة المحاولات
+        وبعد CHECKIN_MAX_ATTEMPTS تبقى كـ dead letter لا تُحجز مرة أخرى
+        failures: [(row, error)]
+        """
+        max_attempts = self.app.config.get('CHECKIN_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+        self._write(
+            'UPDATE pending_checkins SET claimed_at = NULL, attempts = attempts + 1, '
+            'dead = CASE WHEN attempts + 1 >= ? THEN 1 ELSE 0 END, last_error = ? WHERE id = ?',
+            [(max_attempts, str(error)[:1000], row['id']) for row, error in failures]
+        )
+        for row, error in failures:
+            if row['attempts'] + 1 >= max_attempts:
+                print(f"⚠️  تسجيل دخول مؤجل {row['id']} للموظف {row['emp_id']} نُقل إلى dead letter: {str(error)}")
+
+    # ==================== النقل إلى قاعدة البيانات ====================
+
+    def flush(self, emp_id=None, day=None):
+        """
+        نقل دفعة واحدة إلى attendances في معاملة واحدة - يعيد (المُدخلة، المتكررة)
+        emp_id/day: نقل تسجيلات موظف واحد فقط
+        يستخدم جلسة مستقلة (لا يمس db.session) - يجب استدعاؤها داخل سياق التطبيق
+        """
+        from app.models import Attendance
+
+        if not self.enabled:
+            return 0, 0
+        rows = self._claim(self.app.config.get('CHECKIN_FLUSH_BATCH', DEFAULT_FLUSH_BATCH), emp_id, day)
+        if not rows:
+            return 0, 0
+
+        inserted = duplicates = 0
+        done = []
+        failures = []
+        try:
+            with Session(db.engine) as session:
+                for row in rows:
+                    try:
+                        # savepoint لكل تسجيل: رفض تسجيل واحد لا يلغي باقي الدفعة
+                        with session.begin_nested():
+                            attendance_id = Attendance.insert_if_no_record_for_day(
+                                open_only=bool(row['open_only']),
+                                session=session,
+                                empId=row['emp_id'],
+                                createdAt=date.fromisoformat(row['day']),
+                                checkInTime=dt_time.fromisoformat(row['check_in']),
+                                checkInReason=row['reason'],
+                                status=row['status']
+                            )
+                    except _ROW_ERRORS as e:
+                        failures.append((row, e))
+                        continue
+                    done.append(row['id'])
+                    if attendance_id is None:
+                        duplicates += 1
+                    else:
+                        inserted += 1
+                session.commit()
+        except Exception as e:
+            # فشل عام (الاتصال، commit) - الدفعة كاملة تعود للطابور بدون احتسابها كمحاولة
+            self._finish([row['id'] for row in rows], release=True)
+            print(f"⚠️  تعذر نقل تسجيلات الدخول المؤجلة: {str(e)}")
+            return 0, 0
+
+        self._finish(done)
+        self._fail(failures)
+        if duplicates:
+            print(f"⚠️  تم تجاهل {duplicates} تسجيل دخول مؤجل لوجود سجل حضور مسبق")
+        return inserted, duplicates
+
+    def flush_employee(self, emp_id, day=None, timeout=2):
+        """
+        نقل فوري لتسجيلات الموظف المعلقة فقط (قبل الانصراف حتى يجد سجل الدخول)
+        محاولة واحدة فقط من الطلب - ما بقي (محجوز لدى الناقل الخلفي أو فشل) ننتظر الناقل حتى تنتهي المهلة
+        """
+        if not self.pending_for(emp_id, day):
+            return
+        deadline = time.monotonic() + timeout
+        self.flush(emp_id, day)
+        while self.pending_for(emp_id, day) and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def _run(self):
+        """حلقة الناقل الخلفي: دفعة كل CHECKIN_FLUSH_INTERVAL_MS، وبدون انتظار ما دام الطابور ممتلئاً"""
+        interval = self.app.config.get('CHECKIN_FLUSH_INTERVAL_MS', DEFAULT_FLUSH_INTERVAL_MS) / 1000
+        batch = self.app.config.get('CHECKIN_FLUSH_BATCH', DEFAULT_FLUSH_BATCH)
+        while not self._stop.is_set():
+            moved = 0
+            with self.app.app_context():
+                try:
+                    inserted, duplicates = self.flush()
+                    moved = inserted + duplicates
+                except Exception as e:
+                    print(f"⚠️  خطأ في ناقل تسجيلات الدخول: {str(e)}")
+                finally:
+                    db.session.remove()
+            if moved < batch:
+                self._stop.wait(interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+checkin_buffer = CheckinBuffer()
@@ -1153,4 +1153,162 @@ def seed_db():
         click.echo(f'❌ حدث خطأ أثناء إضافة البيانات التجريبية: {str(e)}', err=True)
         import traceback
         click.echo(f'التفاصيل: {traceback.format_exc()}', err=True)
-        return
\ No newline at end of file
+        return
+
+def _index_advisor_queries(start_date, end_date, employee_id):
+    """استعلامات تمثيلية لأكثر المسارات استخداماً (الحضور، الرواتب، الإجازات، العطل)"""
+    from app.models import Attendance, ProductionMonitoring, Holiday
+    from app.models.leave import Leave
+
+    return [
+        ('حضور موظف لفترة (الملخص، الرواتب، التقرير الشهري)', db.select(
+            Attendance.id, Attendance.checkInTime, Attendance.checkOutTime, Attendance.status
+        ).where(
+            Attendance.empId == employee_id,
+            Attendance.createdAt >= start_date,
+            Attendance.createdAt <= end_date
+        )),
+        ('الحضور المعلق للاعتماد', db.select(Attendance.id, Attendance.empId).where(
+            Attendance.status == 'pending',
+            Attendance.createdAt >= start_date
+        )),
+        ('إنتاج موظف لفترة', db.select(
+            ProductionMonitoring.id, ProductionMonitoring.quantity, ProductionMonitoring.piece_id
+        ).where(
+            ProductionMonitoring.employee_id == employee_id,
+            ProductionMonitoring.date >= start_date,
+            ProductionMonitoring.date <= end_date
+        )),
+        ('إجازات الموظف النشطة', db.select(Leave.id, Leave.start_date, Leave.end_date).where(
+            Leave.employee_id == employee_id,
+            Leave.status == 'active',
+            Leave.start_date <= end_date
+        )),
+        ('العطل النشطة في الفترة', db.select(Holiday.id, Holiday.branch_id, Holiday.department_id).where(
+            Holiday.date >= start_date,
+            Holiday.date <= end_date,
+            Holiday.is_active == True
+        )),
+    ]
+
+
+@click.command('index-advisor')
+@click.option('--create', is_flag=True, help='إنشاء الفهارس المعرفة في النماذج والناقصة في قاعدة البيانات')
+@click.option('--top', default=10, show_default=True, help='عدد الاقتراحات/الاستعلامات البطيئة المعروضة')
+@with_appcontext
+def index_advisor(create, top):
+    """تقرير الفهارس الناقصة وخطط تنفيذ الاستعلامات الأكثر استخداماً"""
+    import time
+    from sqlalchemy import inspect
+    from app.models import Employee
+
+    engine = db.engine
+    dialect = engine.dialect.name
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    # ==================== 1. الفهارس المعرفة في النماذج ====================
+    click.echo('🔍 مقارنة فهارس النماذج مع قاعدة البيانات...')
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if not table.indexes or table.name not in existing_tables:
+            continue
+        existing_names = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_names:
+                missing.append(index)
+                click.echo(f'  ⚠️  {table.name}.{index.name} ({", ".join(c.name for c in index.columns)}) غير موجود')
+
+    if not missing:
+        click.echo('  ✅ جميع الفهارس المعرفة موجودة')
+    elif create:
+        for index in missing:
+            try:
+                index.create(bind=engine, checkfirst=True)
+                click.echo(f'  ✅ تم إنشاء {index.name}')
+            except Exception as e:
+                click.echo(f'  ❌ تعذر إنشاء {index.name}: {str(e)}', err=True)
+    else:
+        click.echo('  💡 شغّل الأمر مع --create لإنشائها')
+
+    # ==================== 2. اقتراحات SQL Server ====================
+    if dialect == 'mssql':
+        click.echo('\n📋 اقتراحات الفهارس من SQL Server (sys.dm_db_missing_index_*):')
+        try:
+            rows = db.session.execute(text(f"""
+                SELECT TOP {int(top)}
+                    d.statement, d.equality_columns, d.inequality_columns, d.included_columns,
+                    s.user_seeks + s.user_scans AS uses,
+                    s.avg_user_impact
+                FROM sys.dm_db_missing_index_details d
+                JOIN sys.dm_db_missing_index_groups g ON g.index_handle = d.index_handle
+                JOIN sys.dm_db_missing_index_group_stats s ON s.group_handle = g.index_group_handle
+                WHERE d.database_id = DB_ID()
+                ORDER BY s.avg_total_user_cost * s.avg_user_impact * (s.user_seeks + s.user_scans) DESC
+            """)).fetchall()
+            for row in rows:
+                click.echo(
+                    f'  - {row.statement}: = ({row.equality_columns or ""}) '
+                    f'> ({row.inequality_columns or ""}) include ({row.included_columns or ""}) '
+                    f'| استخدام {row.uses} | تحسين متوقع {row.avg_user_impact}%'
+                )
+            if not rows:
+                click.echo('  ✅ لا توجد اقتراحات')
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f'  ⚠️  تعذر قراءة الاقتراحات (تحتاج صلاحية VIEW SERVER STATE): {str(e)}')
+
+        click.echo('\n🐢 أبطأ الاستعلامات حسب متوسط زمن التنفيذ (sys.dm_exec_query_stats):')
+        try:
+            rows = db.session.execute(text(f"""
+                SELECT TOP {int(top)}
+                    qs.execution_count,
+                    qs.total_elapsed_time / qs.execution_count / 1000.0 AS avg_ms,
+                    qs.total_logical_reads / qs.execution_count AS avg_reads,
+                    SUBSTRING(st.text, 1, 200) AS query_text
+                FROM sys.dm_exec_query_stats qs
+                CROSS APPLY sys.dm_exec_sql_text(qs.sql_handle) st
+                WHERE st.dbid = DB_ID()
+                ORDER BY qs.total_elapsed_time / qs.execution_count DESC
+            """)).fetchall()
+            for row in rows:
+                query_text = ' '.join(row.query_text.split())
+                click.echo(f'  - {row.avg_ms:.1f}ms × {row.execution_count} | {row.avg_reads} قراءة | {query_text}')
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f'  ⚠️  تعذر قراءة إحصائيات الاستعلامات: {str(e)}')
+
+    # ==================== 3. خطط الاستعلامات الأكثر استخداماً ====================
+    click.echo('\n🧭 خطط تنفيذ الاستعلامات الأكثر استخداماً:')
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=30)
+    employee_id = db.session.query(db.func.min(Employee.id)).scalar() or 0
+
+    for label, statement in _index_advisor_queries(start_date, end_date, employee_id):
+        sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+        try:
+            started = time.perf_counter()
+            db.session.execute(statement).fetchall()
+            elapsed = (time.perf_counter() - started) * 1000
+
+            scans = []
+            if dialect == 'mssql':
+                # SHOWPLAN_ALL يعيد الخطة المقدرة بدلاً من تنفيذ الاستعلام
+                with engine.connect() as conn:
+                    conn.exec_driver_sql('SET SHOWPLAN_ALL ON')
+                    try:
+                        plan = conn.exec_driver_sql(sql).fetchall()
+                    finally:
+                        conn.exec_driver_sql('SET SHOWPLAN_ALL OFF')
+                scans = [row.StmtText.strip() for row in plan if row.PhysicalOp in ('Table Scan', 'Clustered Index Scan', 'Index Scan')]
+            elif dialect == 'sqlite':
+                plan = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).fetchall()
+                scans = [row[-1] for row in plan if str(row[-1]).startswith('SCAN')]
+
+            status = '⚠️ ' if scans else '✅'
+            click.echo(f'  {status} {label}: {elapsed:.1f}ms')
+            for scan in scans:
+                click.echo(f'      مسح كامل: {scan[:150]}')
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f'  ❌ {label}: {str(e)}')
@@ -1,8 +1,28 @@
 from flask import request, jsonify
 from datetime import datetime, date, timedelta
+import numpy as np
+from sqlalchemy.exc import IntegrityError
 from app import db
+from app.date_ranges import date_range, on_date
+from app.reference_cache import reference_cache
+from app.shift_calendar import SLOT_ACTIVE
 from app.models import Employee, User, Shift, AbsenceTransaction, TransactionHistory, Attendance, AbsenceQuestion
 
+# SQL Server لا يقبل أكثر من 2100 معامل في الاستعلام الواحد
+IN_BATCH_SIZE = 1000
+
+
+def _chunks(items, size=IN_BATCH_SIZE):
+    """تقسيم قائمة إلى دفعات بحجم محدد"""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
 class AbsenceTransactionController:
     
     @staticmethod
@@ -276,10 +296,16 @@ class AbsenceTransactionController:
             return {"error": f"خطأ أثناء استرجاع معاملات الغياب المعتمدة: {str(e)}"}, 500
 
     @staticmethod
-    def generate_absence_transactions_for_last_month(user_id):
+    def generate_absence_transactions_for_last_month(user_id, retry_on_conflict=True):
         """
         إنشاء معاملات غياب تلقائية للموظفين الغائبين خلال الشهر الماضي بناءً على سجلات الحضور
         للموظفين الذين يمكن للمستخدم إدارتهم
+
+        بدلاً من فحص كل (موظف، يوم) باستعلامات منفصلة:
+        - أيام العمل المتوقعة من تقويم الوردية المجمّع لكل موظف
+        - أيام الحضور ومعاملات الغياب الموجودة تُحمّل باستعلام واحد لكل دفعة موظفين
+        - الأيام المتبقية تُضاف كمعاملات وسجلات تاريخ دفعة واحدة في flush واحد
+        - عند تعارض رقم معاملة أو معاملة مع تنفيذ متزامن يُعاد التوليد مرة واحدة بالكامل
         """
         try:
             # التحقق من وجود المستخدم
@@ -295,38 +321,148 @@ class AbsenceTransactionController:
             # تحديد نطاق الشهر الماضي (من اليوم إلى 30 يومًا للوراء)
             today = date.today()
             start_date = today - timedelta(days=30)
-            date_range = [start_date + timedelta(days=x) for x in range((today - start_date).days + 1)]
+
+            # تخطي الموظفين غير النشطين إذا كان الحقل موجودًا
+            employees = [
+                employee for employee in employees
+                if hasattr(employee, 'is_active') and employee.is_active
+            ]
+
+            expected_days = AbsenceTransactionController._expected_working_days(employees, start_date, today)
+            employee_ids = list({employee_id for employee_id, _ in expected_days})
+            attended_days = AbsenceTransactionController._attended_days(employee_ids, start_date, today)
+            existing_days = AbsenceTransactionController._existing_absence_days(employee_ids, start_date, today)
+
+            absent_days = sorted(expected_days - attended_days - existing_days)
+            employees_by_id = {employee.id: employee for employee in employees}
 
             created_transactions = []
-            for employee in employees:
-                if not hasattr(employee, 'is_active') or not employee.is_active:
-                    continue  # تخطي الموظفين غير النشطين إذا كان الحقل موجودًا
-                for check_date in date_range:
-                    # التحقق من غياب الموظف في التاريخ الحالي
-                    is_absent = AbsenceTransactionController.is_employee_absent(employee, check_date)
-                    
-                    if is_absent:
-                        # إنشاء معاملة غياب جديدة
-                        result, status = AbsenceTransactionController.create_absence_transaction(
-                            employee_id=employee.id,
-                            absence_date=check_date,
-                            shift_id=employee.shift_id,
-                            created_by=user_id  # استخدام user_id بدلاً من 1
-                        )
-                        
-                        if status == 201:
-                            created_transactions.append(result['transaction'])
+            if absent_days:
+                # رقم المعاملة بنفس صيغة generate_transaction_number يبدأ بعد أكبر رقم لليوم
+                date_str = datetime.now().strftime('%Y%m%d')
+                numbered = AbsenceTransactionController._last_transaction_sequence(date_str)
+
+                transactions = []
+                for offset, (employee_id, absence_date) in enumerate(absent_days, start=1):
+                    transactions.append(AbsenceTransaction(
+                        employee_id=employee_id,
+                        absence_date=absence_date,
+                        shift_id=employees_by_id[employee_id].shift_id,
+                        created_by=user_id,
+                        transaction_number=f'ABS-{date_str}-{numbered + offset:04d}'
+                    ))
+                db.session.add_all(transactions)
+                db.session.flush()  # للحصول على المعرفات بإدخال مجمّع
+
+                db.session.add_all([
+                    TransactionHistory(
+                        transaction_id=transaction.id,
+                        action='created',
+                        new_status='pending',
+                        user_id=user_id or 1,  # 1 للنظام
+                        notes='تم إنشاء معاملة الغياب تلقائياً'
+                    )
+                    for transaction in transactions
+                ])
+
+                created_transactions = [
+                    {
+                        'id': transaction.id,
+                        'transaction_number': transaction.transaction_number,
+                        'employee_name': employees_by_id[transaction.employee_id].full_name,
+                        'absence_date': transaction.absence_date.isoformat(),
+                        'status': transaction.status
+                    }
+                    for transaction in transactions
+                ]
 
             db.session.commit()
             return {
                 "message": f"تم إنشاء {len(created_transactions)} معاملة غياب بنجاح",
+                "summary": {
+                    "employees_checked": len(employees),
+                    "expected_working_days": len(expected_days),
+                    "attended_days": len(expected_days & attended_days),
+                    "existing_transactions": len((expected_days - attended_days) & existing_days),
+                    "created_transactions": len(created_transactions)
+                },
                 "transactions": created_transactions
             }, 200
 
+        except IntegrityError as e:
+            db.session.rollback()
+            if retry_on_conflict:
+                print(f"⚠️  تعارض أثناء إنشاء معاملات الغياب - إعادة المحاولة: {str(e)}")
+                return AbsenceTransactionController.generate_absence_transactions_for_last_month(
+                    user_id, retry_on_conflict=False
+                )
+            return {"error": f"خطأ أثناء إنشاء معاملات الغياب: {str(e)}"}, 500
+
         except Exception as e:
             db.session.rollback()
             return {"error": f"خطأ أثناء إنشاء معاملات الغياب: {str(e)}"}, 500
 
+    @staticmethod
+    def _last_transaction_sequence(date_str):
+        """
+        أكبر تسلسل مستخدم في أرقام معاملات اليوم ABS-<date>-NNNN (صفر إذا لا يوجد)
+        UPDLOCK/HOLDLOCK في SQL Server يحجز النطاق حتى commit فلا يأخذ تنفيذ متزامن نفس الأرقام
+        الترتيب بالطول أولاً حتى يأتي 10000 بعد 9999
+        """
+        last = db.session.query(AbsenceTransaction.transaction_number).filter(
+            AbsenceTransaction.transaction_number.like(f'ABS-{date_str}-%')
+        ).with_hint(AbsenceTransaction, 'WITH (UPDLOCK, HOLDLOCK)', 'mssql').order_by(
+            db.func.char_length(AbsenceTransaction.transaction_number).desc(),
+            AbsenceTransaction.transaction_number.desc()
+        ).first()
+        if last is None:
+            return 0
+        try:
+            return int(last[0].rsplit('-', 1)[1])
+        except (ValueError, IndexError):
+            return 0
+
+    @staticmethod
+    def _expected_working_days(employees, start_date, end_date):
+        """
+        أيام العمل المتوقعة {(employee_id, date)} من تقويم الوردية المجمّع
+        (نفس شرط is_employee_absent: اليوم مفعّل في جدول الوردية)
+        """
+        shifts = reference_cache.get_many(Shift, {employee.shift_id for employee in employees if employee.shift_id})
+        expected = set()
+        for employee in employees:
+            shift = shifts.get(employee.shift_id)
+            if not shift:
+                continue
+            schedule = shift.compiled_calendar().expand(start_date, end_date)
+            for offset in np.flatnonzero(schedule[:, SLOT_ACTIVE] > 0):
+                expected.add((employee.id, start_date + timedelta(days=int(offset))))
+        return expected
+
+    @staticmethod
+    def _attended_days(employee_ids, start_date, end_date):
+        """أيام الحضور {(employee_id, date)} للموظفين في الفترة"""
+        attended = set()
+        for chunk in _chunks(employee_ids):
+            rows = db.session.query(Attendance.empId, Attendance.createdAt).filter(
+                Attendance.empId.in_(chunk),
+                date_range(Attendance.createdAt, start_date, end_date)
+            ).distinct().all()
+            attended.update((employee_id, _as_date(day)) for employee_id, day in rows)
+        return attended
+
+    @staticmethod
+    def _existing_absence_days(employee_ids, start_date, end_date):
+        """أيام معاملات الغياب الموجودة {(employee_id, date)} للموظفين في الفترة"""
+        existing = set()
+        for chunk in _chunks(employee_ids):
+            rows = db.session.query(AbsenceTransaction.employee_id, AbsenceTransaction.absence_date).filter(
+                AbsenceTransaction.employee_id.in_(chunk),
+                date_range(AbsenceTransaction.absence_date, start_date, end_date)
+            ).all()
+            existing.update((employee_id, _as_date(day)) for employee_id, day in rows)
+        return existing
+
     @staticmethod
     def is_employee_absent(employee, check_date):
         """
@@ -337,19 +473,18 @@ class AbsenceTransactionController:
             if not employee.shift_id:
                 return False
             
-            shift = Shift.query.get(employee.shift_id)
+            shift = reference_cache.get(Shift, employee.shift_id)
             if not shift:
                 return False
             
             # التحقق من كون اليوم يوم عمل في الوردية
-            day_name = check_date.strftime('%A').lower()  # الحصول على اسم اليوم بالإنجليزية بأحرف صغيرة
-            if not shift.is_working_day(day_name):
+            if not shift.compiled_calendar().is_active(check_date.weekday()):
                 return False  # ليس يوم عمل
             
             # التحقق من وجود سجل حضور للموظف في ذلك التاريخ
             attendance_exists = Attendance.query.filter(
                 Attendance.empId == employee.id,
-                db.func.date(Attendance.createdAt) == check_date
+                on_date(Attendance.createdAt, check_date)
             ).first()
             
             if attendance_exists:
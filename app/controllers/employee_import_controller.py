@@ -0,0 +1,500 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from flask import current_app
+from sqlalchemy import insert
+from app import db
+from app.models import Employee, EmployeeImport, JobTitle, Profession, Shift
+
+
+# حجم دفعة executemany وقوائم IN
+# (SQL Server لا يقبل أكثر من 2100 معامل في الاستعلام الواحد)
+DEFAULT_BATCH_SIZE = 500
+
+# حجم الدفعة الافتراضي لكل commit في الاستيراد على دفعات
+# (أقل من حد تصعيد الأقفال في SQL Server وهو 5000 قفل)
+DEFAULT_CHUNK_SIZE = 1000
+
+# الاستيراد العالق في running لأكثر من هذه المدة يمكن استئنافه
+DEFAULT_STALE_SECONDS = 300
+
+# أعمدة ملف Excel وما يقابلها في جدول الموظفين
+COLUMN_MAP = {
+    'رقم البصمة': 'fingerprint_id',
+    'الاسم الكامل': 'full_name',
+    'نوع الموظف': 'employee_type',
+    'المسمى الوظيفي': 'job_title_name',
+    'المهنة': 'profession_name',
+    'الشهادة': 'certificates',
+    'الراتب الأساسي': 'salary',
+    'نسبة السلفة': 'advancePercentage',
+    'تاريخ الميلاد': 'date_of_birth',
+    'مكان الميلاد': 'place_of_birth',
+    'رقم الهوية الوطنية': 'national_id',
+    'رقم هوية إضافي': 'id_card_number',
+    'نوع العقد': 'contract_type',
+    'العنوان': 'residence',
+    'رقم الجوال الأساسي': 'mobile_1',
+    'رقم جوال إضافي': 'mobile_2',
+    'رقم الطوارئ': 'mobile_3',
+    'نظام العمل': 'work_system',
+    'معرف الوردية': 'shift_id',
+    'قيمة التأمينات': 'insurance_deduction',
+    'البدلات': 'allowances',
+    'تاريخ بداية التأمين': 'insurance_start_date',
+    'تاريخ نهاية التأمين': 'insurance_end_date',
+    'ملاحظات': 'notes',
+    'مكان العمل': 'work_location',
+    'الدائرة / الشعبة': 'division_section'
+}
+
+REQUIRED_COLUMNS = ['fingerprint_id', 'full_name', 'employee_type']
+NUMERIC_COLUMNS = ['salary', 'advancePercentage', 'insurance_deduction', 'allowances']
+DATE_COLUMNS = ['date_of_birth', 'insurance_start_date', 'insurance_end_date']
+STRING_COLUMNS = [
+    'full_name', 'employee_type', 'job_title_name', 'profession_name',
+    'certificates', 'place_of_birth', 'national_id', 'id_card_number',
+    'contract_type', 'residence', 'mobile_1', 'mobile_2', 'mobile_3',
+    'work_system', 'notes', 'work_location', 'division_section'
+]
+
+# الأعمدة النصية الاختيارية: القيمة الفارغة تُحفظ NULL
+OPTIONAL_STRING_COLUMNS = [
+    'work_system', 'place_of_birth', 'national_id', 'id_card_number', 'residence',
+    'mobile_1', 'mobile_2', 'mobile_3', 'notes', 'certificates', 'work_location', 'division_section'
+]
+
+# أعمدة جدول employees التي تُكتب من الملف
+INSERT_COLUMNS = [
+    'fingerprint_id', 'full_name', 'employee_type', 'position', 'profession_id',
+    'salary', 'advancePercentage', 'work_system', 'date_of_birth', 'shift_id',
+    'insurance_deduction', 'allowances', 'insurance_start_date', 'insurance_end_date'
+] + [column for column in OPTIONAL_STRING_COLUMNS if column != 'work_system']
+
+
+def _chunks(items, size):
+    """تقسيم قائمة إلى دفعات بحجم محدد"""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _to_int(series):
+    """تحويل عمود إلى أعداد صحيحة (مع الاقتطاع مثل int(float(x))) - غير الصالح يصبح <NA>"""
+    values = pd.to_numeric(series, errors='coerce').astype('float64')
+    return np.trunc(values.where(np.isfinite(values))).astype('Int64')
+
+
+class EmployeeImportController:
+    """
+    استيراد الموظفين من ملف Excel بشكل مجمّع:
+    - التحقق والتحويل بعمليات pandas على الأعمدة كاملة بدلاً من كل صف على حدة
+    - كشف أرقام البصمة المكررة باستعلام واحد على كامل المجموعة
+    - الإدراج على دفعات executemany
+    - تقرير أخطاء لكل صف
+    """
+
+    @staticmethod
+    def get_batch_size():
+        return current_app.config.get('EMPLOYEE_IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    @staticmethod
+    def get_chunk_size(value=None):
+        """حجم الدفعة من الطلب أو من EMPLOYEE_IMPORT_CHUNK_SIZE"""
+        if value:
+            return max(int(value), 1)
+        return current_app.config.get('EMPLOYEE_IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+    @staticmethod
+    def read_file(file):
+        """قراءة ملف Excel وإعادة تسمية الأعمدة - يعيد (DataFrame، الأعمدة المطلوبة الناقصة)"""
+        df = pd.read_excel(file, dtype={
+            'رقم البصمة': 'Int64',
+            'الراتب الأساسي': float,
+            'نسبة السلفة': float,
+            'معرف الوردية': 'Int64',
+            'تاريخ الميلاد': 'datetime64[ns]',
+            'تاريخ بداية التأمين': 'datetime64[ns]',
+            'تاريخ نهاية التأمين': 'datetime64[ns]'
+        })
+        df.rename(columns=COLUMN_MAP, inplace=True)
+
+        missing_columns = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+        return df, missing_columns
+
+    @staticmethod
+    def prepare(df):
+        """
+        تنظيف وتحويل جميع الأعمدة دفعة واحدة
+        يعيد DataFrame بالقيم النهائية مع عمود row (رقم الصف في الملف بدءاً من 1)
+        """
+        df = df.reset_index(drop=True).copy()
+        for column in COLUMN_MAP.values():
+            if column not in df.columns:
+                df[column] = None
+
+        df['row'] = df.index + 1
+
+        for column in NUMERIC_COLUMNS:
+            df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0).astype(float)
+
+        df['fingerprint_id'] = _to_int(df['fingerprint_id'])
+        df['shift_id'] = _to_int(df['shift_id'])
+
+        for column in STRING_COLUMNS:
+            df[column] = df[column].fillna('').astype(str).str.strip()
+
+        dates = {column: pd.to_datetime(df[column], errors='coerce') for column in DATE_COLUMNS}
+
+        # تواريخ التأمين: تُحفظ فقط إذا وُجد التاريخان وكانت البداية قبل النهاية
+        valid_range = dates['insurance_start_date'] < dates['insurance_end_date']
+        for column in ('insurance_start_date', 'insurance_end_date'):
+            dates[column] = dates[column].where(valid_range)
+
+        for column, values in dates.items():
+            df[column] = values.dt.date.astype(object).where(values.notna(), None)
+
+        return df
+
+    @staticmethod
+    def validate(df, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        التحقق من الحقول المطلوبة وتكرار أرقام البصمة
+        يعيد (الصفوف الصالحة، أخطاء الصفوف) - كل خطأ {row, fingerprint_id, error}
+        """
+        errors = pd.Series(None, index=df.index, dtype=object)
+
+        def flag(mask, message):
+            mask = mask & errors.isna()
+            errors[mask] = message if isinstance(message, str) else message[mask]
+
+        fingerprint = df['fingerprint_id']
+        flag(fingerprint.isna() | (fingerprint == 0).fillna(False), 'Missing or invalid fingerprint_id')
+        flag(df['full_name'] == '', 'Missing full_name')
+        flag(df['employee_type'] == '', 'Missing employee_type')
+
+        # العمود في الجدول نصي - المقارنة تتم بالنص حتى يبقى الاستعلام على الفهرس
+        fingerprint_text = fingerprint.astype(str)
+        candidates = errors.isna()
+        existing = EmployeeImportController.load_existing_fingerprints(
+            fingerprint_text[candidates].unique().tolist(), batch_size
+        )
+        already_exists = 'Fingerprint ID ' + fingerprint_text + ' already exists'
+        flag(fingerprint_text.isin(list(existing)), already_exists)
+        # التكرار داخل الملف نفسه: يُقبل أول صف فقط
+        flag(errors.isna() & fingerprint_text.duplicated(keep='first'), already_exists)
+
+        failed = errors.notna()
+        row_errors = [
+            {
+                'row': int(row),
+                'fingerprint_id': None if pd.isna(fingerprint_id) else int(fingerprint_id),
+                'error': message
+            }
+            for row, fingerprint_id, message in zip(df['row'][failed], fingerprint[failed], errors[failed])
+        ]
+        return df[~failed], row_errors
+
+    @staticmethod
+    def load_existing_fingerprints(fingerprint_ids, batch_size=DEFAULT_BATCH_SIZE):
+        """أرقام البصمة الموجودة مسبقاً في جدول الموظفين"""
+        existing = set()
+        for chunk in _chunks(fingerprint_ids, batch_size):
+            rows = db.session.query(Employee.fingerprint_id).filter(Employee.fingerprint_id.in_(chunk)).all()
+            existing.update(str(row.fingerprint_id) for row in rows)
+        return existing
+
+    @staticmethod
+    def load_valid_shift_ids(shift_ids, batch_size=DEFAULT_BATCH_SIZE):
+        valid_shift_ids = set()
+        for chunk in _chunks(shift_ids, batch_size):
+            valid_shift_ids.update(row.id for row in db.session.query(Shift.id).filter(Shift.id.in_(chunk)).all())
+        return valid_shift_ids
+
+    @staticmethod
+    def resolve_references(names, model, name_column, batch_size=DEFAULT_BATCH_SIZE, create=True):
+        """
+        معرفات المسميات الوظيفية/المهن حسب الاسم باستعلام واحد لكل دفعة
+        الأسماء غير الموجودة تُنشأ (عند create) - يعيد ({الاسم: المعرف}، عدد الجديد)
+        """
+        ids = {}
+        for chunk in _chunks(names, batch_size):
+            rows = db.session.query(model.id, name_column).filter(name_column.in_(chunk)).order_by(model.id).all()
+            for row_id, name in rows:
+                ids.setdefault(name, row_id)
+
+        missing = [name for name in names if name not in ids]
+        if missing and create:
+            objects = [model(**{name_column.key: name}) for name in missing]
+            db.session.add_all(objects)
+            db.session.flush()
+            ids.update((name, obj.id) for name, obj in zip(missing, objects))
+        return ids, len(missing)
+
+    @staticmethod
+    def build_rows(df, job_title_ids, profession_ids, valid_shift_ids):
+        """تحويل الصفوف الصالحة إلى قواميس جاهزة لـ insert(Employee)"""
+        rows = pd.DataFrame({
+            'fingerprint_id': df['fingerprint_id'].astype(str),
+            'full_name': df['full_name'],
+            'employee_type': df['employee_type'],
+            'position': df['job_title_name'].map(job_title_ids),
+            'profession_id': df['profession_name'].map(profession_ids),
+            'shift_id': df['shift_id'].where(df['shift_id'].isin(list(valid_shift_ids))),
+        })
+        for column in NUMERIC_COLUMNS + DATE_COLUMNS:
+            rows[column] = df[column]
+        for column in OPTIONAL_STRING_COLUMNS:
+            rows[column] = df[column].where(df[column] != '', None)
+
+        rows = rows[INSERT_COLUMNS].astype(object)
+        rows = rows.where(rows.notna(), None)
+        records = rows.to_dict(orient='records')
+        for record in records:
+            for column in ('position', 'profession_id', 'shift_id'):
+                if record[column] is not None:
+                    record[column] = int(record[column])
+        return records
+
+    @staticmethod
+    def insert_rows(records, batch_size=DEFAULT_BATCH_SIZE):
+        """إدراج الموظفين على دفعات executemany - يعيد عدد الصفوف المدرجة"""
+        for chunk in _chunks(records, batch_size):
+            db.session.execute(insert(Employee), chunk)
+        return len(records)
+
+    @staticmethod
+    def plan(df, batch_size=DEFAULT_BATCH_SIZE, create_references=True):
+        """
+        تجهيز الاستيراد بدون إدراج الموظفين: التحقق، الورديات، المسميات الوظيفية والمهن
+        عند create_references=False (التجربة) لا يُكتب أي شيء ويُعاد عدد ما سيُنشأ فقط
+        """
+        df = EmployeeImportController.prepare(df)
+        valid, row_errors = EmployeeImportController.validate(df, batch_size)
+
+        all_shift_ids = {int(shift_id) for shift_id in df['shift_id'].dropna() if shift_id > 0}
+        valid_shift_ids = EmployeeImportController.load_valid_shift_ids(list(all_shift_ids), batch_size)
+        invalid_shift_ids = all_shift_ids - valid_shift_ids
+        if invalid_shift_ids:
+            print(f"⚠️  معرفات ورديات غير موجودة (ستُترك فارغة): {invalid_shift_ids}")
+
+        job_title_names = [name for name in valid['job_title_name'].unique() if name]
+        profession_names = [name for name in valid['profession_name'].unique() if name]
+        job_title_ids, new_job_titles = EmployeeImportController.resolve_references(
+            job_title_names, JobTitle, JobTitle.title_name, batch_size, create_references
+        )
+        profession_ids, new_professions = EmployeeImportController.resolve_references(
+            profession_names, Profession, Profession.name, batch_size, create_references
+        )
+
+        return {
+            'valid': valid,
+            'row_errors': row_errors,
+            'valid_shift_ids': valid_shift_ids,
+            'job_title_ids': job_title_ids,
+            'profession_ids': profession_ids,
+            'validation_info': {
+                'total_shift_ids_found': len(all_shift_ids),
+                'valid_shift_ids': list(valid_shift_ids),
+                'invalid_shift_ids': list(invalid_shift_ids),
+                'job_titles_created': len(job_title_ids) if create_references else new_job_titles,
+                'professions_created': len(profession_ids) if create_references else new_professions
+            }
+        }
+
+    @staticmethod
+    def import_file(file, dry_run=False, chunk_size=None, created_by=None):
+        """
+        تنفيذ الاستيراد - يعيد (الرد، رمز HTTP)
+        dry_run: التحقق من كامل الملف بدون كتابة أي شيء
+        chunk_size: commit كل N صف مع سجل استيراد قابل للاستئناف (EmployeeImport)
+        بدونهما: معاملة واحدة للملف كاملاً
+        """
+        batch_size = EmployeeImportController.get_batch_size()
+
+        if chunk_size and not dry_run:
+            return EmployeeImportController.start_chunked_import(file, chunk_size, created_by)
+
+        df, missing_columns = EmployeeImportController.read_file(file)
+        if missing_columns:
+            return {'message': f'Missing required columns: {", ".join(missing_columns)}'}, 400
+
+        plan = EmployeeImportController.plan(df, batch_size, create_references=not dry_run)
+        row_errors = plan['row_errors']
+
+        if dry_run:
+            return {
+                'message': f'Dry run: {len(plan["valid"])} employees would be imported, {len(row_errors)} would fail',
+                'dry_run': True,
+                'total_rows': len(df),
+                'successful': len(plan['valid']),
+                'failed': len(row_errors),
+                'errors': [f"Row {error['row']}: {error['error']}" for error in row_errors[:10]],
+                'row_errors': row_errors,
+                'validation_info': plan['validation_info']
+            }, 200
+
+        records = EmployeeImportController.build_rows(
+            plan['valid'], plan['job_title_ids'], plan['profession_ids'], plan['valid_shift_ids']
+        )
+        successful_imports = EmployeeImportController.insert_rows(records, batch_size)
+        db.session.commit()
+
+        response_message = f'Import completed: {successful_imports} employees imported successfully'
+        if row_errors:
+            response_message += f', {len(row_errors)} failed'
+
+        return {
+            'message': response_message,
+            'successful': successful_imports,
+            'failed': len(row_errors),
+            'errors': [f"Row {error['row']}: {error['error']}" for error in row_errors[:10]],  # عرض أول 10 أخطاء فقط
+            'row_errors': row_errors,
+            'validation_info': plan['validation_info']
+        }, 201
+
+    # ==================== الاستيراد على دفعات ====================
+
+    @staticmethod
+    def get_import_folder():
+        folder_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'imports')
+        if not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+        return folder_path
+
+    @staticmethod
+    def start_chunked_import(file, chunk_size, created_by=None):
+        """
+        حفظ نسخة من الملف وإنشاء سجل الاستيراد ثم التنفيذ على دفعات
+        """
+        import_id = str(uuid.uuid4())
+        extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'xlsx'
+        file_path = os.path.join(EmployeeImportController.get_import_folder(), f'{import_id}.{extension}')
+        file.save(file_path)
+
+        df, missing_columns = EmployeeImportController.read_file(file_path)
+        if missing_columns:
+            os.remove(file_path)
+            return {'message': f'Missing required columns: {", ".join(missing_columns)}'}, 400
+
+        import_job = EmployeeImport(
+            id=import_id,
+            filename=file.filename,
+            file_path=file_path,
+            status='running',
+            chunk_size=chunk_size,
+            total_rows=len(df),
+            created_by=created_by
+        )
+        db.session.add(import_job)
+        db.session.commit()
+
+        return EmployeeImportController.run_chunked_import(import_job, df)
+
+    @staticmethod
+    def resume_import(import_id):
+        """استئناف استيراد متوقف من بعد آخر صف تم تثبيته"""
+        import_job = EmployeeImport.query.get(import_id)
+        if not import_job:
+            return {'message': 'Import not found'}, 404
+        if import_job.status == 'completed':
+            return {'message': 'Import already completed', 'import': import_job.to_dict()}, 400
+        if not os.path.exists(import_job.file_path):
+            return {'message': 'Import file is no longer available'}, 410
+
+        # حجز ذري: الاستيراد المتوقف، أو العالق في running بعد توقف العملية التي كانت تنفذه
+        stale_before = datetime.now() - timedelta(
+            seconds=current_app.config.get('EMPLOYEE_IMPORT_STALE_SECONDS', DEFAULT_STALE_SECONDS)
+        )
+        claimed = EmployeeImport.query.filter(
+            EmployeeImport.id == import_id,
+            db.or_(
+                EmployeeImport.status == 'failed',
+                db.and_(EmployeeImport.status == 'running', EmployeeImport.updated_at < stale_before)
+            )
+        ).update({'status': 'running', 'error': None, 'updated_at': datetime.now()}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return {'message': 'Import is already running', 'import': import_job.to_dict()}, 409
+
+        df, _ = EmployeeImportController.read_file(import_job.file_path)
+        return EmployeeImportController.run_chunked_import(EmployeeImport.query.get(import_id), df)
+
+    @staticmethod
+    def run_chunked_import(import_job, df):
+        """
+        إدراج الصفوف المتبقية (بعد last_row) مع commit كل chunk_size صف
+        موضع التقدم وأخطاء الصفوف تُحدّث في نفس معاملة كل دفعة حتى يبقى الاستئناف دقيقاً
+        المعاملات القصيرة تُبقي أقفال employees قليلة (بدون تصعيد إلى قفل الجدول)
+        فلا تتعطل عمليات الحضور المتزامنة التي تقرأ جدول الموظفين
+        """
+        batch_size = EmployeeImportController.get_batch_size()
+        import_id = import_job.id
+        chunk_size = import_job.chunk_size
+        offset = import_job.last_row
+
+        try:
+            plan = EmployeeImportController.plan(df.iloc[offset:], batch_size)
+            # أرقام الصفوف نسبةً إلى الملف الأصلي
+            valid = plan['valid']
+            valid_rows = valid['row'] + offset
+            row_errors = plan['row_errors']
+            for error in row_errors:
+                error['row'] += offset
+            # المسميات الوظيفية والمهن الجديدة تُثبت في معاملة مستقلة قصيرة
+            db.session.commit()
+
+            for first_row in range(offset + 1, len(df) + 1, chunk_size):
+                last_row = min(first_row + chunk_size - 1, len(df))
+                chunk_valid = valid[(valid_rows >= first_row) & (valid_rows <= last_row)]
+                chunk_errors = [error for error in row_errors if first_row <= error['row'] <= last_row]
+
+                records = EmployeeImportController.build_rows(
+                    chunk_valid, plan['job_title_ids'], plan['profession_ids'], plan['valid_shift_ids']
+                )
+                EmployeeImportController.insert_rows(records, batch_size)
+
+                import_job.last_row = last_row
+                import_job.imported_count += len(records)
+                import_job.failed_count += len(chunk_errors)
+                if chunk_errors:
+                    import_job.row_errors = (import_job.row_errors or []) + chunk_errors
+                db.session.commit()
+                print(f"✓ استيراد {import_id}: تم تثبيت الصفوف حتى {last_row}/{len(df)}")
+
+            import_job.status = 'completed'
+            import_job.finished_at = datetime.now()
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️  توقف الاستيراد {import_id}: {str(e)}")
+            import_job = EmployeeImport.query.get(import_id)
+            import_job.status = 'failed'
+            import_job.error = str(e)
+            db.session.commit()
+            return {
+                'message': 'Import stopped, it can be resumed from the last committed row',
+                'import': import_job.to_dict()
+            }, 500
+
+        try:
+            os.remove(import_job.file_path)
+        except OSError:
+            pass
+
+        row_errors = import_job.row_errors or []
+        response_message = f'Import completed: {import_job.imported_count} employees imported successfully'
+        if import_job.failed_count:
+            response_message += f', {import_job.failed_count} failed'
+
+        return {
+            'message': response_message,
+            'successful': import_job.imported_count,
+            'failed': import_job.failed_count,
+            'errors': [f"Row {error['row']}: {error['error']}" for error in row_errors[:10]],
+            'validation_info': plan['validation_info'],
+            'import': import_job.to_dict()
+        }, 201
@@ -0,0 +1,488 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Attendance, Employee, FingerprintPunch
+
+
+# حجم الدفعة الافتراضي لعمليات executemany وقوائم IN
+# (SQL Server لا يقبل أكثر من 2100 معامل في الاستعلام الواحد)
+DEFAULT_BATCH_SIZE = 500
+
+
+def _chunks(items, size):
+    """تقسيم قائمة إلى دفعات بحجم محدد"""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _to_int_or_none(value):
+    """تحويل قيمة الجهاز إلى رقم صحيح إن أمكن"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class FingerprintSyncController:
+    """
+    محرك المزامنة المجمّعة لسجلات البصمة:
+    - جلب جميع الموظفين المطلوبين باستعلام واحد
+    - جلب سجلات الحضور لكل (موظف، يوم) باستعلام نطاق واحد
+    - كتابة الإضافات والتحديثات على دفعات executemany
+    - سجل خام للبصمات (fingerprint_punches) بحيث لا تُطبق إلا البصمات الجديدة
+    القواعد (دخول / دخول أبكر / خروج بعد 5 دقائق) مطابقة لـ sync_fingerprint_records
+    """
+
+    @staticmethod
+    def get_batch_size():
+        return current_app.config.get('FINGERPRINT_SYNC_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    @staticmethod
+    def load_employees_by_fingerprint(fingerprint_ids, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        جلب الموظفين حسب أرقام البصمة دفعة واحدة
+        عند تكرار رقم البصمة يؤخذ الموظف صاحب أصغر معرف (مثل filter_by().first())
+        """
+        employees = {}
+        for chunk in _chunks(set(fingerprint_ids), batch_size):
+            rows = db.session.query(
+                Employee.id, Employee.fingerprint_id, Employee.full_name
+            ).filter(Employee.fingerprint_id.in_(chunk)).all()
+            for row in rows:
+                current = employees.get(row.fingerprint_id)
+                if current is None or row.id < current['id']:
+                    employees[row.fingerprint_id] = {
+                        'id': row.id,
+                        'full_name': row.full_name
+                    }
+        return employees
+
+    @staticmethod
+    def load_day_attendances(employee_ids, start_date, end_date, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        جلب أول سجل حضور لكل (موظف، يوم) في الفترة باستعلام نطاق واحد لكل دفعة موظفين
+        يعيد قاموس {(empId, date): حالة السجل}
+        """
+        states = {}
+        for chunk in _chunks(employee_ids, batch_size):
+            rows = db.session.query(
+                Attendance.id,
+                Attendance.empId,
+                Attendance.createdAt,
+                Attendance.checkInTime,
+                Attendance.checkOutTime
+            ).filter(
+                Attendance.empId.in_(chunk),
+                Attendance.createdAt >= start_date,
+                Attendance.createdAt < end_date + timedelta(days=1)
+            ).order_by(Attendance.id).all()
+
+            for row in rows:
+                key = (row.empId, row.createdAt)
+                if key in states:
+                    continue
+                states[key] = {
+                    'id': row.id,
+                    'checkInTime': row.checkInTime,
+                    'checkOutTime': row.checkOutTime,
+                    'changes': {}
+                }
+        return states
+
+    @staticmethod
+    def apply_punch(state, employee, fingerprint_id, record_date, date_key, record_time, results):
+        """
+        تطبيق بصمة واحدة على حالة سجل اليوم (نفس قواعد المزامنة العادية)
+        state: None إذا لم يوجد سجل بعد، ويعاد السجل الجديد في هذه الحالة
+        """
+        base_detail = {
+            'employee_id': employee['id'],
+            'employee_name': employee['full_name'],
+            'fingerprint_id': fingerprint_id,
+            'date': date_key
+        }
+        time_str = record_time.strftime("%H:%M:%S")
+
+        if state is None:
+            # لا يوجد سجل اليوم → إنشاء سجل دخول جديد
+            state = {
+                'id': None,
+                'checkInTime': record_time.time(),
+                'checkOutTime': None,
+                'changes': {
+                    'empId': employee['id'],
+                    'checkInTime': record_time.time(),
+                    'checkOutTime': None,
+                    'createdAt': record_time,
+                    'checkInReason': f'Fingerprint sync - Check-in at {time_str}',
+                    'checkOutReason': None
+                }
+            }
+            results['success'] += 1
+            results['details'].append({
+                **base_detail,
+                'action': 'created_check_in',
+                'time': time_str,
+                'status': 'success'
+            })
+            return state
+
+        existing_check_in_datetime = datetime.combine(record_date, state['checkInTime'])
+
+        if record_time < existing_check_in_datetime:
+            # البصمة أقدم من الدخول الحالي → تحديث الدخول
+            old_time = state['checkInTime'].strftime("%H:%M:%S")
+            state['checkInTime'] = record_time.time()
+            state['changes'].update({
+                'checkInTime': record_time.time(),
+                'createdAt': record_time,
+                'checkInReason': 'Fingerprint sync - Check-in updated to earlier time'
+            })
+            results['updated'] += 1
+            results['details'].append({
+                **base_detail,
+                'action': 'updated_check_in_earlier',
+                'old_time': old_time,
+                'new_time': time_str,
+                'status': 'success'
+            })
+            return state
+
+        time_diff = (record_time - existing_check_in_datetime).total_seconds()
+
+        if time_diff <= 300:
+            # الفرق أقل من 5 دقائق → بصمة متكررة
+            results['skipped'] += 1
+            results['details'].append({
+                **base_detail,
+                'action': 'skipped_duplicate',
+                'time': time_str,
+                'reason': 'Too close to check-in time (< 5 min)',
+                'status': 'skipped'
+            })
+            return state
+
+        if state['checkOutTime'] is None:
+            # يوجد دخول فقط → إضافة خروج
+            state['checkOutTime'] = record_time.time()
+            state['changes'].update({
+                'checkOutTime': record_time.time(),
+                'checkOutReason': f'Fingerprint sync - Check-out at {time_str}'
+            })
+            results['updated'] += 1
+            results['details'].append({
+                **base_detail,
+                'action': 'added_check_out',
+                'time': time_str,
+                'status': 'success'
+            })
+            return state
+
+        existing_check_out_datetime = datetime.combine(record_date, state['checkOutTime'])
+
+        if record_time > existing_check_out_datetime:
+            # يوجد دخول وخروج → تحديث الخروج للأحدث
+            old_time = state['checkOutTime'].strftime("%H:%M:%S")
+            state['checkOutTime'] = record_time.time()
+            state['changes'].update({
+                'checkOutTime': record_time.time(),
+                'checkOutReason': 'Fingerprint sync - Check-out updated to later time'
+            })
+            results['updated'] += 1
+            results['details'].append({
+                **base_detail,
+                'action': 'updated_check_out_later',
+                'old_time': old_time,
+                'new_time': time_str,
+                'status': 'success'
+            })
+        else:
+            results['skipped'] += 1
+            results['details'].append({
+                **base_detail,
+                'action': 'skipped_older_checkout',
+                'time': time_str,
+                'reason': 'Older than existing checkout',
+                'status': 'skipped'
+            })
+        return state
+
+    @staticmethod
+    def write_changes(states, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        كتابة السجلات الجديدة والمعدلة على دفعات executemany
+        يعيد (عدد الإضافات، عدد التحديثات)
+        """
+        inserts = []
+        updates = {}
+        for state in states.values():
+            if not state['changes']:
+                continue
+            if state['id'] is None:
+                inserts.append(state['changes'])
+            else:
+                # تجميع التحديثات حسب الأعمدة المعدلة حتى تكون كل دفعة executemany متجانسة
+                columns = tuple(sorted(state['changes']))
+                updates.setdefault(columns, []).append({'id': state['id'], **state['changes']})
+
+        for chunk in _chunks(inserts, batch_size):
+            db.session.execute(insert(Attendance), chunk)
+
+        updated_count = 0
+        for rows in updates.values():
+            for chunk in _chunks(rows, batch_size):
+                db.session.execute(update(Attendance), chunk)
+                updated_count += len(chunk)
+
+        return len(inserts), updated_count
+
+    @staticmethod
+    def filter_new_punches(punches, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        الجزء الأول من insert-or-ignore على السجل الخام:
+        - حذف التكرار داخل الدفعة نفسها
+        - جلب المفاتيح الموجودة مسبقاً باستعلام نطاق واحد لكل دفعة أرقام بصمة
+        يعيد البصمات الجديدة فقط (وهي وحدها التي تُطبق على جدول الحضور)
+        """
+        unique_punches = {}
+        for punch in punches:
+            key = (punch['fingerprint_id'], punch['time'], punch['device_name'])
+            unique_punches.setdefault(key, punch)
+
+        if not unique_punches:
+            return []
+
+        times = [key[1] for key in unique_punches]
+        start_time, end_time = min(times), max(times)
+
+        existing_keys = set()
+        fingerprint_ids = {key[0] for key in unique_punches}
+        for chunk in _chunks(fingerprint_ids, batch_size):
+            rows = db.session.query(
+                FingerprintPunch.fingerprint_id,
+                FingerprintPunch.punch_time,
+                FingerprintPunch.device_name
+            ).filter(
+                FingerprintPunch.fingerprint_id.in_(chunk),
+                FingerprintPunch.punch_time >= start_time,
+                FingerprintPunch.punch_time <= end_time
+            ).all()
+            existing_keys.update((row.fingerprint_id, row.punch_time, row.device_name) for row in rows)
+
+        return [punch for key, punch in unique_punches.items() if key not in existing_keys]
+
+    @staticmethod
+    def write_journal(punches, batch_size=DEFAULT_BATCH_SIZE):
+        """كتابة البصمات الجديدة في السجل الخام على دفعات executemany"""
+        rows = [{
+            'fingerprint_id': punch['fingerprint_id'],
+            'punch_time': punch['time'],
+            'device_name': punch['device_name'],
+            'employee_id': punch['employee']['id'],
+            'status': punch['status'],
+            'punch': punch['punch'],
+            'created_at': datetime.now()
+        } for punch in punches]
+
+        for chunk in _chunks(rows, batch_size):
+            db.session.execute(insert(FingerprintPunch), chunk)
+
+    @staticmethod
+    def sync_records(records, use_journal=None, retry_on_conflict=True):
+        """
+        مزامنة مجمّعة لقائمة سجلات البصمة
+        use_journal: تفعيل سجل البصمات الخام (افتراضياً من FINGERPRINT_PUNCH_JOURNAL)
+        """
+        batch_size = FingerprintSyncController.get_batch_size()
+        if use_journal is None:
+            use_journal = current_app.config.get('FINGERPRINT_PUNCH_JOURNAL', True)
+        results = {
+            'success': 0,
+            'updated': 0,
+            'failed': 0,
+            'skipped': 0,
+            'employees_processed': 0,
+            'details': []
+        }
+
+        # المرحلة 1: جلب جميع الموظفين المطلوبين باستعلام واحد
+        fingerprint_ids = set()
+        for record in records:
+            try:
+                if all(k in record for k in ('fingerprint_id', 'timestamp')):
+                    fingerprint_ids.add(str(record['fingerprint_id']).strip())
+            except Exception:
+                # سيتم تسجيل الخطأ بترتيبه في المرحلة التالية
+                pass
+
+        employees = FingerprintSyncController.load_employees_by_fingerprint(fingerprint_ids, batch_size)
+
+        # المرحلة 2: التحقق من السجلات وتحويل الطوابع الزمنية
+        punches = []
+        for i, record in enumerate(records):
+            try:
+                if not all(k in record for k in ('fingerprint_id', 'timestamp')):
+                    results['failed'] += 1
+                    results['details'].append({
+                        'record_index': i,
+                        'record': record,
+                        'status': 'failed',
+                        'reason': 'Missing required fields (fingerprint_id, timestamp)'
+                    })
+                    continue
+
+                fingerprint_id = str(record['fingerprint_id']).strip()
+                employee = employees.get(fingerprint_id)
+                if not employee:
+                    results['failed'] += 1
+                    results['details'].append({
+                        'record_index': i,
+                        'fingerprint_id': fingerprint_id,
+                        'status': 'failed',
+                        'reason': f'No employee found with fingerprint ID: {fingerprint_id}'
+                    })
+                    continue
+
+                try:
+                    if isinstance(record['timestamp'], str):
+                        record_time = datetime.strptime(record['timestamp'], "%Y-%m-%d %H:%M:%S")
+                    else:
+                        record_time = record['timestamp']
+                    record_date = record_time.date()
+                    date_key = record_date.isoformat()
+                except (ValueError, TypeError) as e:
+                    results['failed'] += 1
+                    results['details'].append({
+                        'record_index': i,
+                        'fingerprint_id': fingerprint_id,
+                        'status': 'failed',
+                        'reason': f'Invalid timestamp format: {record["timestamp"]} - {str(e)}'
+                    })
+                    continue
+
+                punches.append({
+                    'employee': employee,
+                    'fingerprint_id': fingerprint_id,
+                    'time': record_time,
+                    'date': record_date,
+                    'date_key': date_key,
+                    'device_name': str(record.get('device_name') or 'Unknown')[:100],
+                    'status': _to_int_or_none(record.get('status', 0)),
+                    'punch': _to_int_or_none(record.get('punch', 0))
+                })
+
+            except Exception as e:
+                results['failed'] += 1
+                results['details'].append({
+                    'record_index': i,
+                    'status': 'error',
+                    'reason': f'Processing error: {str(e)}'
+                })
+
+        # المرحلة 3: حفظ البصمات في السجل الخام وتجاهل ما تمت مزامنته سابقاً
+        if use_journal:
+            new_punches = FingerprintSyncController.filter_new_punches(punches, batch_size)
+            results['already_synced'] = len(punches) - len(new_punches)
+            punches = new_punches
+
+        employee_date_records = {}
+        for punch in punches:
+            employee = punch['employee']
+            day_data = employee_date_records.setdefault(employee['id'], {}).setdefault(punch['date_key'], {
+                'employee': employee,
+                'date': punch['date'],
+                'fingerprint_id': punch['fingerprint_id'],
+                'timestamps': []
+            })
+            day_data['timestamps'].append(punch['time'])
+
+        if employee_date_records:
+            all_dates = [
+                day_data['date']
+                for date_records in employee_date_records.values()
+                for day_data in date_records.values()
+            ]
+            states = FingerprintSyncController.load_day_attendances(
+                list(employee_date_records.keys()), min(all_dates), max(all_dates), batch_size
+            )
+        else:
+            states = {}
+
+        # المرحلة 4: تطبيق القواعد على الحالات في الذاكرة
+        # اليوم الذي فشل لا يُكتب ولا تُسجل بصماته في السجل الخام حتى تُعالج عند إعادة الإرسال
+        failed_days = set()
+        for emp_id, date_records in employee_date_records.items():
+            employee_name = None
+            for date_key, day_data in date_records.items():
+                key = (emp_id, day_data['date'])
+                try:
+                    employee = day_data['employee']
+                    employee_name = employee['full_name']
+                    record_date = day_data['date']
+
+                    for record_time in sorted(day_data['timestamps']):
+                        states[key] = FingerprintSyncController.apply_punch(
+                            states.get(key), employee, day_data['fingerprint_id'],
+                            record_date, date_key, record_time, results
+                        )
+                except Exception as e:
+                    states.pop(key, None)  # قد تكون الحالة عُدلت جزئياً
+                    failed_days.add(key)
+                    error_msg = f"خطأ في معالجة الموظف {employee_name or emp_id} في التاريخ {date_key}: {str(e)}"
+                    results['failed'] += 1
+                    results['details'].append({
+                        'employee_id': emp_id,
+                        'date': date_key,
+                        'status': 'error',
+                        'reason': error_msg
+                    })
+
+        results['employees_processed'] = len(employee_date_records)
+
+        # المرحلة 5: الكتابة المجمّعة (السجل الخام + الحضور في نفس المعاملة)
+        try:
+            if use_journal:
+                FingerprintSyncController.write_journal([
+                    punch for punch in punches
+                    if (punch['employee']['id'], punch['date']) not in failed_days
+                ], batch_size)
+            inserted, updated = FingerprintSyncController.write_changes(states, batch_size)
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if use_journal and retry_on_conflict:
+                # مزامنة متزامنة أضافت نفس البصمات → إعادة المحاولة مرة واحدة
+                return FingerprintSyncController.sync_records(records, use_journal, retry_on_conflict=False)
+            print(f"✗ خطأ في حفظ المزامنة المجمّعة: {str(e)}")
+            return {
+                'status': 'error',
+                'message': f'Database commit failed: {str(e)}',
+                'partial_results': results
+            }, 500
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ خطأ في حفظ المزامنة المجمّعة: {str(e)}")
+            return {
+                'status': 'error',
+                'message': f'Database commit failed: {str(e)}',
+                'partial_results': results
+            }, 500
+
+        print(f"✓ مزامنة مجمّعة: {len(records)} بصمة، {inserted} سجل جديد، {updated} سجل محدث")
+
+        success_message = f'تمت معالجة سجلات الحضور: '
+        success_message += f'{results["success"]} سجل جديد، '
+        success_message += f'{results["updated"]} سجل محدث، '
+        success_message += f'{results["skipped"]} سجل تم تجاهله، '
+        success_message += f'{results["failed"]} فشل'
+        if use_journal:
+            success_message += f'، {results["already_synced"]} بصمة تمت مزامنتها سابقاً'
+
+        return {
+            'status': 'success',
+            'message': success_message,
+            'results': results
+        }, 200
@@ -0,0 +1,199 @@
+import hashlib
+import json
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.date_ranges import date_range
+from app.reference_cache import reference_cache
+from app.models import (
+    Advance, Attendance, MonthlyAttendance, PayrollSnapshot, ProductionMonitoring, ProductionPiece, Shift
+)
+from app.models.leave import Leave
+
+
+# SQL Server لا يقبل أكثر من 2100 معامل في الاستعلام الواحد
+IN_BATCH_SIZE = 1000
+
+# يُزاد عند تغيير منطق حساب الرواتب حتى تُعاد جميع اللقطات
+# 2: حضور الساعات والورديات يُحدد بتاريخ السجل (createdAt) بدلاً من date(checkInTime)
+# 3: أيام الورديات تُقيّم بمحرك الحضور (attendance_engine) بالثواني ومع الورديات الممتدة لليوم التالي
+CALCULATION_VERSION = 3
+
+
+def _chunks(items, size=IN_BATCH_SIZE):
+    """تقسيم قائمة إلى دفعات بحجم محدد"""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class PayrollSnapshotController:
+    """
+    لقطات الرواتب المحفوظة:
+    - كل لقطة تحمل بصمة مدخلاتها (عدد وآخر تعديل لسجلات الحضور والإنتاج والإجازات والسلف،
+      بالإضافة إلى بيانات الموظف والمسمى الوظيفي والمهنة والوردية)
+    - عند الطلب تُحسب البصمات باستعلامات تجميعية ويُعاد حساب الموظفين الذين تغيرت مدخلاتهم فقط
+    """
+
+    @staticmethod
+    def _aggregate(model, employee_column, updated_column, employee_ids, *conditions):
+        """عدد السجلات وآخر تعديل لكل موظف باستعلام GROUP BY واحد لكل دفعة"""
+        stats = {}
+        for chunk in _chunks(employee_ids):
+            rows = db.session.query(
+                employee_column,
+                db.func.count(model.id),
+                db.func.max(model.id),
+                db.func.max(updated_column)
+            ).filter(
+                employee_column.in_(chunk),
+                *conditions
+            ).group_by(employee_column).all()
+            for employee_id, count, max_id, last_update in rows:
+                stats[employee_id] = [count, max_id, last_update]
+        return stats
+
+    @staticmethod
+    def compute_fingerprints(employees, start_date, end_date):
+        """
+        بصمة مدخلات الحساب لكل موظف: {employee_id: sha256}
+        """
+        from app.payroll_inputs import load_reference_data
+
+        load_reference_data(employees)
+        employee_ids = [employee.id for employee in employees]
+        aggregate = PayrollSnapshotController._aggregate
+
+        sources = {
+            'attendances': aggregate(
+                Attendance, Attendance.empId, Attendance.updatedAt, employee_ids,
+                date_range(Attendance.createdAt, start_date, end_date)
+            ),
+            'monthly_attendance': aggregate(
+                MonthlyAttendance, MonthlyAttendance.employee_id, MonthlyAttendance.updated_at, employee_ids,
+                date_range(MonthlyAttendance.date, start_date, end_date)
+            ),
+            'production': aggregate(
+                ProductionMonitoring, ProductionMonitoring.employee_id, ProductionMonitoring.updated_at, employee_ids,
+                date_range(ProductionMonitoring.date, start_date, end_date)
+            ),
+            'production_prices': aggregate(
+                ProductionMonitoring, ProductionMonitoring.employee_id, ProductionPiece.updated_at, employee_ids,
+                ProductionMonitoring.piece_id == ProductionPiece.id,
+                date_range(ProductionMonitoring.date, start_date, end_date)
+            ),
+            'leaves': aggregate(
+                Leave, Leave.employee_id, Leave.updated_at, employee_ids,
+                Leave.start_date <= end_date,
+                db.or_(Leave.end_date >= start_date, Leave.end_date.is_(None))
+            ),
+            'advances': aggregate(
+                Advance, Advance.employee_id, Advance.updated_at, employee_ids,
+                date_range(Advance.date, start_date, end_date)
+            )
+        }
+
+        shifts = {}
+        shift_ids = {employee.shift_id for employee in employees if employee.shift_id}
+        for shift in reference_cache.get_many(Shift, shift_ids).values():
+            shifts[shift.id] = [
+                shift.start_time, shift.end_time, shift.daily_schedule,
+                shift.allowed_delay_minutes, shift.allowed_exit_minutes
+            ]
+
+        fingerprints = {}
+        for employee in employees:
+            job_title = employee.job_title
+            profession = employee.profession
+            parts = {
+                'version': CALCULATION_VERSION,
+                'employee': [employee.updated_at, employee.salary, employee.allowances, employee.shift_id],
+                'job_title': [
+                    job_title.id, job_title.month_system, job_title.production_system, job_title.shift_system,
+                    job_title.allowed_break_time, job_title.overtime_hour_value, job_title.delay_minute_value
+                ] if job_title else None,
+                'profession': [profession.id, profession.hourly_rate, profession.daily_rate] if profession else None,
+                'shift': shifts.get(employee.shift_id),
+                'sources': {name: stats.get(employee.id) for name, stats in sources.items()}
+            }
+            payload = json.dumps(parts, sort_keys=True, default=str)
+            fingerprints[employee.id] = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+        return fingerprints
+
+    @staticmethod
+    def get_salary_results(employees, start_date, end_date):
+        """
+        نتائج الرواتب لمجموعة موظفين: {employee_id: salary_result}
+        اللقطات السليمة تُعاد كما هي، والباقي يُحسب من مدخلات محملة مسبقاً ثم يُحفظ
+        """
+        from app.payroll_inputs import PayrollInputs
+        from app.routes.payroll import calculate_employee_salary_period
+
+        employees = list({employee.id: employee for employee in employees}.values())
+        if not employees:
+            return {}
+
+        fingerprints = PayrollSnapshotController.compute_fingerprints(employees, start_date, end_date)
+
+        snapshots = {}
+        for chunk in _chunks([employee.id for employee in employees]):
+            rows = PayrollSnapshot.query.filter(
+                PayrollSnapshot.employee_id.in_(chunk),
+                PayrollSnapshot.start_date == start_date,
+                PayrollSnapshot.end_date == end_date
+            ).all()
+            for snapshot in rows:
+                snapshots[snapshot.employee_id] = snapshot
+
+        results = {}
+        stale_employees = []
+        for employee in employees:
+            snapshot = snapshots.get(employee.id)
+            if snapshot and snapshot.input_fingerprint == fingerprints[employee.id]:
+                results[employee.id] = snapshot.salary_result
+            else:
+                stale_employees.append(employee)
+
+        if not stale_employees:
+            return results
+
+        inputs = PayrollInputs(stale_employees, start_date, end_date)
+        for employee in stale_employees:
+            salary_result = calculate_employee_salary_period(employee, start_date, end_date, inputs)
+            # تحويل النتيجة إلى JSON صالح للتخزين (Decimal...) بنفس شكل الرد
+            salary_result = json.loads(current_app.json.dumps(salary_result))
+            results[employee.id] = salary_result
+
+            # نتائج الخطأ (create_basic_result_period) لا تُحفظ حتى يُعاد حسابها في المرة القادمة
+            if 'system_type' not in salary_result:
+                continue
+
+            snapshot = snapshots.get(employee.id)
+            if snapshot:
+                snapshot.input_fingerprint = fingerprints[employee.id]
+                snapshot.salary_result = salary_result
+            else:
+                db.session.add(PayrollSnapshot(
+                    employee_id=employee.id,
+                    start_date=start_date,
+                    end_date=end_date,
+                    input_fingerprint=fingerprints[employee.id],
+                    salary_result=salary_result
+                ))
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # طلب آخر حفظ لقطة لنفس الفترة في نفس الوقت - النتائج المحسوبة صحيحة على أي حال
+            db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️  تعذر حفظ لقطات الرواتب: {str(e)}")
+
+        return results
+
+    @staticmethod
+    def get_salary_result(employee, start_date, end_date):
+        """نتيجة راتب موظف واحد من اللقطة أو بإعادة الحساب عند تغير المدخلات"""
+        return PayrollSnapshotController.get_salary_results([employee], start_date, end_date)[employee.id]
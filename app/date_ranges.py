@@ -0,0 +1,42 @@
+# app/date_ranges.py
+"""
+شروط نطاقات التاريخ القابلة لاستخدام الفهارس (sargable):
+- دائماً نطاق نصف مفتوح على العمود الخام: column >= start AND column < end + يوم
+- بدون تغليف العمود بدالة (date() / CAST) حتى يستخدم SQL Server فهرس seek بدلاً من scan
+- حدود النطاق تُمرر بنفس نوع العمود (Date أو DateTime) حتى لا يحوّل الخادم العمود ضمنياً
+"""
+from datetime import datetime, time, timedelta
+from app import db
+
+
+def _as_date(value):
+    """تحويل datetime أو date إلى date"""
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _bound(column, day):
+    """حد النطاق بنوع العمود: منتصف الليل لأعمدة DateTime، والتاريخ نفسه لأعمدة Date"""
+    if isinstance(column.type, db.DateTime):
+        return datetime.combine(day, time.min)
+    return day
+
+
+def date_range(column, start=None, end=None):
+    """
+    سجلات الأيام من start إلى end (شاملة لليوم الأخير) بشرط نصف مفتوح:
+    column >= start AND column < end + 1 يوم
+    أي حد None يُهمل
+    """
+    conditions = []
+    if start is not None:
+        conditions.append(column >= _bound(column, _as_date(start)))
+    if end is not None:
+        conditions.append(column < _bound(column, _as_date(end) + timedelta(days=1)))
+    return db.and_(*conditions) if conditions else db.true()
+
+
+def on_date(column, day):
+    """سجلات يوم واحد - بديل func.date(column) == day و cast(column, Date) == day"""
+    return date_range(column, day, day)
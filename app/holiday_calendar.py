@@ -0,0 +1,115 @@
+# app/holiday_calendar.py
+"""
+تقويم العطل الرسمية في الذاكرة:
+- العطل النشطة لكل سنة تُحمّل باستعلام واحد وتُحفظ كقاموس {تاريخ: (أعمدة العطلة، ...)}
+- السنة يُعاد بناؤها عند أول طلب بعد إنشاء أو تعديل أو حذف أو إنشاء جماعي للعطل
+  (رقم نسخة جدول holidays في reference_cache، ومع Redis يشمل ذلك العمليات الأخرى)
+- البحث عن يوم واحد أو فترة يتم من الذاكرة بنفس شروط الفرع/القسم في Holiday.is_holiday
+"""
+import threading
+import time
+from datetime import date
+from flask import current_app
+from sqlalchemy import inspect
+from app import db
+from app.reference_cache import attach_row, reference_cache
+
+DEFAULT_TTL_SECONDS = 300
+
+
+def applies_to(holiday, branch_id=None, department_id=None):
+    """
+    هل العطلة تنطبق على الفرع/القسم - نفس شرط Holiday.is_holiday:
+    العطلة الخاصة بفرع (أو قسم) آخر لا تنطبق، والعطلة بدون فرع (أو قسم) تنطبق على الجميع
+    holiday: كائن Holiday أو قاموس أعمدته
+    """
+    get = holiday.get if isinstance(holiday, dict) else lambda key: getattr(holiday, key)
+    if branch_id and get('branch_id') not in (branch_id, None):
+        return False
+    if department_id and get('department_id') not in (department_id, None):
+        return False
+    return True
+
+
+class HolidayCalendar:
+    """
+    العطل النشطة مجمعة حسب السنة والتاريخ
+    """
+
+    def __init__(self):
+        self._years = {}  # year -> (version, loaded_at, {date: (row, ...)})
+        self._lock = threading.Lock()
+
+    def _ttl(self):
+        return current_app.config.get('HOLIDAY_CALENDAR_TTL', DEFAULT_TTL_SECONDS)
+
+    def _year(self, year):
+        """عطل السنة {date: (row, ...)} من الذاكرة أو بإعادة البناء إذا تغيرت العطل"""
+        from app.models.holiday import Holiday
+
+        version = reference_cache.version(Holiday.__table__.name)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._years.get(year)
+        if entry is not None and entry[0] == version and now - entry[1] < self._ttl():
+            return entry[2]
+
+        columns = [column.key for column in inspect(Holiday).column_attrs]
+        rows = db.session.query(*[getattr(Holiday, key) for key in columns]).filter(
+            Holiday.date >= date(year, 1, 1),
+            Holiday.date < date(year + 1, 1, 1),
+            Holiday.is_active == True
+        ).order_by(Holiday.id).all()
+
+        by_date = {}
+        for values in rows:
+            data = dict(zip(columns, values))
+            by_date.setdefault(data['date'], []).append(data)
+        by_date = {day: tuple(items) for day, items in by_date.items()}
+
+        with self._lock:
+            self._years[year] = (version, now, by_date)
+        return by_date
+
+    def clear(self):
+        """مسح الذاكرة المحلية بالكامل"""
+        with self._lock:
+            self._years.clear()
+
+    # ==================== البحث ====================
+
+    def _rows_on(self, target_date):
+        return self._year(target_date.year).get(target_date, ())
+
+    def get_holiday(self, target_date, branch_id=None, department_id=None):
+        """أول عطلة تنطبق على الفرع/القسم في التاريخ أو None - مكافئ Holiday.is_holiday"""
+        from app.models.holiday import Holiday
+
+        for data in self._rows_on(target_date):
+            if applies_to(data, branch_id, department_id):
+                return attach_row(Holiday, data)
+        return None
+
+    def get_holidays_on(self, target_date):
+        """جميع العطل النشطة في التاريخ بدون فلترة الفرع/القسم"""
+        from app.models.holiday import Holiday
+
+        return [attach_row(Holiday, data) for data in self._rows_on(target_date)]
+
+    def get_holidays_in_period(self, start_date, end_date, branch_id=None, department_id=None):
+        """العطل في الفترة (شاملة) مرتبة بالتاريخ - مكافئ Holiday.get_holidays_in_period"""
+        from app.models.holiday import Holiday
+
+        holidays = []
+        for year in range(start_date.year, end_date.year + 1):
+            for day, items in sorted(self._year(year).items()):
+                if day < start_date or day > end_date:
+                    continue
+                holidays.extend(
+                    attach_row(Holiday, data) for data in items
+                    if applies_to(data, branch_id, department_id)
+                )
+        return holidays
+
+
+holiday_calendar = HolidayCalendar()
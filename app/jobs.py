@@ -0,0 +1,223 @@
+# app/jobs.py
+"""
+نظام المهام الخلفية:
+- المهام تُحفظ في جدول background_jobs (تستمر بعد إعادة التشغيل)
+- تُنفذ في مجموعة خيوط داخل العملية (ThreadPoolExecutor)
+- الطلبات الثقيلة تعيد رقم المهمة فوراً والعميل يستعلم عن الحالة والنتيجة
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app, request
+from app import db
+
+# معالجات المهام حسب النوع: handler(payload) -> (result, status)
+JOB_HANDLERS = {}
+
+
+def job_handler(job_type):
+    """تسجيل دالة كمعالج لنوع مهمة"""
+    def decorator(f):
+        JOB_HANDLERS[job_type] = f
+        return f
+    return decorator
+
+
+def is_async_request(data=None):
+    """هل طلب العميل التنفيذ في الخلفية؟ (?async=1 أو "async": true في الجسم)"""
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return bool(isinstance(data, dict) and data.get('async') is True)
+
+
+class JobQueue:
+    """
+    طابور المهام الخلفية المدعوم بقاعدة البيانات
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        self._recovered = False
+        self._last_sweep = 0
+        self._held = set()  # مهام أُرسلت لمنفذ هذه العملية ولم تنته بعد (في الانتظار أو قيد التنفيذ)
+        self._running = set()  # مهام قيد التنفيذ في هذه العملية (تُرسل نبضاتها)
+        self._lock = threading.Lock()
+        self._heartbeat_thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('JOB_WORKERS', 2),
+            thread_name_prefix='hr-job'
+        )
+        app.extensions['job_queue'] = self
+
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name='hr-job-heartbeat', daemon=True)
+        self._heartbeat_thread.start()
+
+        @app.before_request
+        def _recover_jobs_once():
+            # استعادة المهام غير المكتملة مرة واحدة عند أول طلب بعد التشغيل
+            if not self._recovered:
+                self._recovered = True
+                self.recover()
+
+    def enqueue(self, job_type, payload, created_by=None):
+        """إنشاء مهمة جديدة وإرسالها للتنفيذ - يعيد كائن المهمة"""
+        from app.models.background_job import BackgroundJob
+
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f'Unknown job type: {job_type}')
+
+        job = BackgroundJob(job_type=job_type, payload=payload, created_by=created_by, status='queued')
+        db.session.add(job)
+        db.session.commit()
+
+        self._submit(job.id)
+        return job
+
+    def _submit(self, job_id):
+        """إرسال مهمة للمنفذ مرة واحدة فقط ما دامت محجوزة في هذه العملية"""
+        with self._lock:
+            if job_id in self._held:
+                return False
+            self._held.add(job_id)
+        self.executor.submit(self._run, job_id)
+        return True
+
+    def recover(self):
+        """
+        إعادة جدولة المهام المعلقة بعد إعادة التشغيل:
+        - المهام في حالة running التي توقفت نبضاتها لأكثر من JOB_STALE_SECONDS تعود إلى queued
+          (المهمة السليمة تُرسل نبضة كل JOB_HEARTBEAT_SECONDS مهما طال تنفيذها)
+        - المهام التي تنفذها هذه العملية لا تُعاد أبداً
+        - المهام في حالة queued تُرسل للتنفيذ إذا لم تكن في منفذ هذه العملية (الحجز الذري يمنع التنفيذ المزدوج)
+        """
+        from app.models.background_job import BackgroundJob
+
+        try:
+            stale_before = datetime.now() - timedelta(seconds=self.app.config.get('JOB_STALE_SECONDS', 300))
+            with self._lock:
+                held = list(self._held)
+            stale = BackgroundJob.query.filter(
+                BackgroundJob.status == 'running',
+                db.func.coalesce(BackgroundJob.heartbeat_at, BackgroundJob.started_at) < stale_before
+            )
+            if held:
+                stale = stale.filter(~BackgroundJob.id.in_(held))
+            stale.update({'status': 'queued', 'started_at': None, 'heartbeat_at': None}, synchronize_session=False)
+            db.session.commit()
+
+            job_ids = [
+                row.id for row in db.session.query(BackgroundJob.id).filter(BackgroundJob.status == 'queued').all()
+                if self._submit(row.id)
+            ]
+            if job_ids:
+                print(f"✓ تمت إعادة جدولة {len(job_ids)} مهمة خلفية")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️  تعذر استعادة المهام الخلفية: {str(e)}")
+
+    def sweep(self):
+        """
+        إعادة المهام العالقة (توقف تنفيذها بدون إعادة تشغيل) - تُستدعى عند الاستعلام عن حالة المهام
+        مرة واحدة كل JOB_SWEEP_SECONDS ثانية على الأكثر
+        """
+        now = time.monotonic()
+        if now - self._last_sweep < self.app.config.get('JOB_SWEEP_SECONDS', 60):
+            return
+        self._last_sweep = now
+        self.recover()
+
+    def _heartbeat_loop(self):
+        """نبضة كل JOB_HEARTBEAT_SECONDS لجميع المهام قيد التنفيذ في هذه العملية"""
+        from app.models.background_job import BackgroundJob
+
+        while True:
+            time.sleep(self.app.config.get('JOB_HEARTBEAT_SECONDS', 30))
+            with self._lock:
+                running = list(self._running)
+            if not running:
+                continue
+            with self.app.app_context():
+                try:
+                    BackgroundJob.query.filter(
+                        BackgroundJob.id.in_(running),
+                        BackgroundJob.status == 'running'
+                    ).update({'heartbeat_at': datetime.now()}, synchronize_session=False)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠️  تعذر تحديث نبضات المهام الخلفية: {str(e)}")
+                finally:
+                    db.session.remove()
+
+    def _run(self, job_id):
+        """تنفيذ مهمة واحدة داخل سياق التطبيق"""
+        from app.models.background_job import BackgroundJob
+
+        with self.app.app_context():
+            try:
+                # حجز ذري: فقط عملية واحدة تنقل المهمة من queued إلى running
+                now = datetime.now()
+                claimed = BackgroundJob.query.filter_by(id=job_id, status='queued').update(
+                    {'status': 'running', 'started_at': now, 'heartbeat_at': now},
+                    synchronize_session=False
+                )
+                db.session.commit()
+                if not claimed:
+                    return
+                with self._lock:
+                    self._running.add(job_id)
+
+                job = BackgroundJob.query.get(job_id)
+                handler = JOB_HANDLERS.get(job.job_type)
+                if handler is None:
+                    raise ValueError(f'Unknown job type: {job.job_type}')
+
+                result, status = handler(job.payload or {})
+
+                # تحويل النتيجة إلى JSON صالح للتخزين (Decimal، التواريخ...)
+                job = BackgroundJob.query.get(job_id)
+                job.result = json.loads(current_app.json.dumps(result))
+                job.result_status = status
+                job.status = 'completed' if status < 400 else 'failed'
+                job.finished_at = datetime.now()
+                db.session.commit()
+
+            except Exception as e:
+                db.session.rollback()
+                print(f"✗ فشل تنفيذ المهمة {job_id}: {str(e)}")
+                try:
+                    job = BackgroundJob.query.get(job_id)
+                    if job:
+                        job.status = 'failed'
+                        job.error = str(e)
+                        job.finished_at = datetime.now()
+                        db.session.commit()
+                except Exception:
+                    db.session.rollback()
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+                    self._held.discard(job_id)
+                db.session.remove()
+
+
+job_queue = JobQueue()
+
+
+def job_accepted_response(job, status_url):
+    """رد موحد للطلبات التي تم تحويلها إلى مهمة خلفية"""
+    return {
+        'status': 'accepted',
+        'message': 'تمت جدولة المهمة وسيتم تنفيذها في الخلفية',
+        'job_id': job.id,
+        'job_status': job.status,
+        'status_url': status_url
+    }, 202
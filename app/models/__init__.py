@@ -25,6 +25,10 @@ from .absence_answer import AbsenceAnswer
 from .holiday import Holiday
 from .transaction import Transaction, TransactionApproval
 from .leave import Leave
+from .fingerprint_punch import FingerprintPunch
+from .background_job import BackgroundJob
+from .payroll_snapshot import PayrollSnapshot
+from .employee_import import EmployeeImport
 
 
 
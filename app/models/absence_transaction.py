@@ -47,6 +47,8 @@ class AbsenceTransaction(db.Model):
     # قيود
     __table_args__ = (
         CheckConstraint("status IN ('pending', 'approved', 'rejected')", name='check_status'),
+        # فحص المعاملات الموجودة لعدة موظفين في فترة (توليد الغياب التلقائي)
+        db.Index('ix_absence_transactions_employee_date', 'employee_id', 'absence_date'),
     )
     
     def __repr__(self):
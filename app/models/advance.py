@@ -12,6 +12,7 @@ class Advance(db.Model):
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     document_number = db.Column(db.String(50), nullable=False)
     notes = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
 
     # إضافة حقل جديد للربط مع نظام المعاملات
     transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=True)
@@ -1,6 +1,6 @@
 # app/models/attendance.py
 from app import db
-from datetime import date
+from datetime import date, datetime
 
 class Attendance(db.Model):
     __tablename__ = 'attendances'
@@ -19,5 +19,45 @@ class Attendance(db.Model):
     # ✅ الجديد
     status = db.Column(db.String(20), nullable=True, default="approved")  # pending / approved / rejected
 
+    # آخر تعديل على السجل (يُستخدم في بصمة مدخلات لقطات الرواتب)
+    updatedAt = db.Column(db.DateTime, nullable=True, default=datetime.now, onupdate=datetime.now)
+
+    # فهارس مسارات الوصول الأكثر استخداماً (موظف + تاريخ، الحالة + تاريخ)
+    # INCLUDE في SQL Server يجعل الفهرس يغطي الاستعلام بدون الرجوع للجدول
+    __table_args__ = (
+        db.Index(
+            'ix_attendances_emp_created', 'empId', 'createdAt',
+            mssql_include=['checkInTime', 'checkOutTime', 'status']
+        ),
+        db.Index('ix_attendances_status_created', 'status', 'createdAt', mssql_include=['empId']),
+    )
+
+    @classmethod
+    def insert_if_no_record_for_day(cls, open_only=False, session=None, **values):
+        """
+        إدخال سجل حضور فقط إذا لم يوجد سجل للموظف في نفس اليوم - في جملة واحدة ذرية:
+        INSERT ... OUTPUT inserted.id SELECT ... WHERE NOT EXISTS (...)
+        UPDLOCK/HOLDLOCK في SQL Server يمنع طلبين متزامنين من إدخال سجلين لنفس اليوم
+        open_only: يكفي عدم وجود سجل مفتوح بدون انصراف (تسجيل البصمة)
+        session: جلسة مستقلة (ناقل تسجيلات الدخول المؤجلة) بدلاً من جلسة الطلب
+        يعيد معرف السجل الجديد أو None إذا كان هناك سجل مسبق
+        """
+        values.setdefault('status', 'approved')
+        values.setdefault('updatedAt', datetime.now())
+        columns = list(values)
+
+        existing = db.select(cls.id).where(
+            cls.empId == values['empId'],
+            cls.createdAt == values['createdAt'],
+            cls.checkOutTime.is_(None) if open_only else db.true()
+        ).with_hint(cls, 'WITH (UPDLOCK, HOLDLOCK)', 'mssql')
+
+        source = db.select(*[
+            db.literal(value, type_=getattr(cls, column).type) for column, value in values.items()
+        ]).where(~existing.exists())
+
+        statement = db.insert(cls).from_select(columns, source).returning(cls.id)
+        return (session or db.session).execute(statement).scalar()
+
     def __repr__(self):
         return f"<Attendance {self.id}, Employee {self.empId}>"
@@ -0,0 +1,62 @@
+# app/models/background_job.py
+from app import db
+from datetime import datetime
+from sqlalchemy import CheckConstraint
+import uuid
+
+
+class BackgroundJob(db.Model):
+    """
+    المهام الخلفية (مزامنة البصمة، حساب الرواتب لفترة...)
+    تُحفظ في قاعدة البيانات حتى تستمر بعد إعادة تشغيل الخادم
+    """
+    __tablename__ = 'background_jobs'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+
+    # نوع المهمة: fingerprint_sync, payroll_period
+    job_type = db.Column(db.String(50), nullable=False)
+
+    # حالة المهمة
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+
+    payload = db.Column(db.JSON, nullable=True)  # مدخلات المهمة
+    result = db.Column(db.JSON, nullable=True)  # نتيجة المهمة
+    result_status = db.Column(db.Integer, nullable=True)  # رمز HTTP للنتيجة
+    error = db.Column(db.Text, nullable=True)  # رسالة الخطأ عند الفشل
+
+    # من أنشأ المهمة (null للأجهزة)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    # تواريخ
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # آخر نبضة من العملية التي تنفذ المهمة - المهمة تُعتبر عالقة فقط إذا توقفت نبضاتها
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+    # قيود
+    __table_args__ = (
+        CheckConstraint("status IN ('queued', 'running', 'completed', 'failed')", name='check_background_job_status'),
+    )
+
+    def __repr__(self):
+        return f"<BackgroundJob {self.id} {self.job_type} ({self.status})>"
+
+    def to_dict(self, include_result=False):
+        """تحويل البيانات إلى قاموس"""
+        data = {
+            'job_id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'error': self.error,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if include_result:
+            data['result'] = self.result
+            data['result_status'] = self.result_status
+        return data
@@ -0,0 +1,65 @@
+# app/models/employee_import.py
+from app import db
+from datetime import datetime
+from sqlalchemy import CheckConstraint
+import uuid
+
+
+class EmployeeImport(db.Model):
+    """
+    مهمة استيراد موظفين من ملف Excel على دفعات
+    تحفظ موضع آخر صف تم تثبيته حتى يُستأنف الاستيراد من بعده عند الفشل
+    """
+    __tablename__ = 'employee_imports'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+
+    filename = db.Column(db.String(255), nullable=True)  # اسم الملف الأصلي
+    file_path = db.Column(db.String(500), nullable=False)  # نسخة الملف المحفوظة للاستئناف
+
+    # حالة الاستيراد
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, completed, failed
+
+    chunk_size = db.Column(db.Integer, nullable=False)  # عدد الصفوف في كل commit
+    total_rows = db.Column(db.Integer, nullable=False, default=0)  # عدد صفوف الملف
+    last_row = db.Column(db.Integer, nullable=False, default=0)  # آخر صف في الملف تم تثبيته
+
+    imported_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+    row_errors = db.Column(db.JSON, nullable=True)  # [{row, fingerprint_id, error}]
+    error = db.Column(db.Text, nullable=True)  # سبب توقف الاستيراد
+
+    # من أنشأ الاستيراد
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    # تواريخ
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # قيود
+    __table_args__ = (
+        CheckConstraint("status IN ('running', 'completed', 'failed')", name='check_employee_import_status'),
+    )
+
+    def __repr__(self):
+        return f"<EmployeeImport {self.id} ({self.status}) {self.last_row}/{self.total_rows}>"
+
+    def to_dict(self):
+        """تحويل البيانات إلى قاموس"""
+        return {
+            'import_id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'chunk_size': self.chunk_size,
+            'total_rows': self.total_rows,
+            'last_row': self.last_row,
+            'imported_count': self.imported_count,
+            'failed_count': self.failed_count,
+            'row_errors': self.row_errors or [],
+            'error': self.error,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
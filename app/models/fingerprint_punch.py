@@ -0,0 +1,30 @@
+# app/models/fingerprint_punch.py
+from app import db
+from datetime import datetime
+
+
+class FingerprintPunch(db.Model):
+    """
+    سجل البصمات الخام القادمة من أجهزة البصمة (journal)
+    كل بصمة تُحفظ مرة واحدة فقط حسب (رقم البصمة، الوقت، الجهاز)
+    حتى لا تُعاد معالجة البصمات المكررة عند إعادة رفع ذاكرة الجهاز
+    """
+    __tablename__ = 'fingerprint_punches'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    fingerprint_id = db.Column(db.String(50), nullable=False)  # رقم الموظف على جهاز البصمة
+    punch_time = db.Column(db.DateTime, nullable=False)  # وقت البصمة
+    device_name = db.Column(db.String(100), nullable=False, default='Unknown')  # اسم الجهاز
+
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=True)
+    status = db.Column(db.Integer, nullable=True)  # حالة البصمة كما يرسلها الجهاز
+    punch = db.Column(db.Integer, nullable=True)  # نوع البصمة كما يرسلها الجهاز
+
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    __table_args__ = (
+        db.UniqueConstraint('fingerprint_id', 'punch_time', 'device_name', name='unique_fingerprint_punch'),
+    )
+
+    def __repr__(self):
+        return f"<FingerprintPunch {self.fingerprint_id} at {self.punch_time}>"
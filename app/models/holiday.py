@@ -34,13 +34,27 @@ class Holiday(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    # فهرس البحث عن العطل النشطة حسب التاريخ
+    __table_args__ = (
+        db.Index('ix_holidays_date_active', 'date', 'is_active', mssql_include=['branch_id', 'department_id']),
+    )
+
     def __repr__(self):
         return f"<Holiday {self.name} on {self.date}>"
     
     @classmethod
     def is_holiday(cls, date, branch_id=None, department_id=None):
         """
-        التحقق من كون التاريخ المحدد يوم عطلة
+        التحقق من كون التاريخ المحدد يوم عطلة (من تقويم العطل في الذاكرة)
+        """
+        from app.holiday_calendar import holiday_calendar
+        return holiday_calendar.get_holiday(date, branch_id, department_id)
+    
+    @classmethod
+    def find_existing(cls, date, branch_id=None, department_id=None):
+        """
+        نفس شرط is_holiday لكن من قاعدة البيانات مباشرة - لمسارات الكتابة (منع تكرار العطل)
+        حتى لا يعتمد التحقق على تقويم عملية أخرى لم يُبطل بعد
         """
         query = cls.query.filter(
             cls.date == date,
@@ -69,30 +83,10 @@ class Holiday(db.Model):
     @classmethod
     def get_holidays_in_period(cls, start_date, end_date, branch_id=None, department_id=None):
         """
-        الحصول على جميع العطل في فترة محددة
+        الحصول على جميع العطل في فترة محددة (من تقويم العطل في الذاكرة)
         """
-        query = cls.query.filter(
-            cls.date.between(start_date, end_date),
-            cls.is_active == True
-        )
-        
-        if branch_id:
-            query = query.filter(
-                db.or_(
-                    cls.branch_id == branch_id,
-                    cls.branch_id.is_(None)
-                )
-            )
-        
-        if department_id:
-            query = query.filter(
-                db.or_(
-                    cls.department_id == department_id,
-                    cls.department_id.is_(None)
-                )
-            )
-        
-        return query.order_by(cls.date).all()
+        from app.holiday_calendar import holiday_calendar
+        return holiday_calendar.get_holidays_in_period(start_date, end_date, branch_id, department_id)
     
     def to_dict(self):
         """تحويل البيانات إلى قاموس"""
@@ -64,6 +64,11 @@ class Leave(db.Model):
     __table_args__ = (
         CheckConstraint("leave_type IN ('hourly_leave', 'daily_leave')", name='check_leave_type'),
         CheckConstraint("status IN ('active', 'cancelled', 'expired')", name='check_leave_status'),
+        # فهرس إجازات الموظف النشطة حسب التاريخ (ويغطي تجميع إحصائيات الإجازات)
+        db.Index(
+            'ix_leaves_employee_status_start', 'employee_id', 'status', 'start_date',
+            mssql_include=['end_date', 'leave_type', 'hours', 'days']
+        ),
     )
     
     def __repr__(self):
@@ -0,0 +1,31 @@
+# app/models/payroll_snapshot.py
+from app import db
+from datetime import datetime
+
+
+class PayrollSnapshot(db.Model):
+    """
+    لقطة راتب محسوبة لموظف في فترة محددة
+    تُعاد كما هي عند عرض/طباعة الوصل ما دامت بصمة المدخلات لم تتغير
+    """
+    __tablename__ = 'payroll_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+
+    # بصمة مدخلات الحساب (عدد وآخر تعديل لسجلات الحضور والإجازات والسلف...)
+    input_fingerprint = db.Column(db.String(64), nullable=False)
+
+    salary_result = db.Column(db.JSON, nullable=False)  # نتيجة calculate_employee_salary_period
+
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'start_date', 'end_date', name='unique_payroll_snapshot_period'),
+    )
+
+    def __repr__(self):
+        return f"<PayrollSnapshot Employee {self.employee_id} {self.start_date} - {self.end_date}>"
@@ -16,6 +16,14 @@ class ProductionMonitoring(db.Model):
     updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
     notes = db.Column(db.Text, nullable=True)  # ملاحظات إضافية
 
+    # فهرس إنتاج الموظف خلال فترة (الرواتب، تقارير الإنتاج)
+    __table_args__ = (
+        db.Index(
+            'ix_production_monitoring_employee_date', 'employee_id', 'date',
+            mssql_include=['piece_id', 'quantity', 'quality_grade']
+        ),
+    )
+
 
 
     def __repr__(self):
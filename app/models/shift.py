@@ -1,7 +1,7 @@
 # shift.py
 
 from app import db
-from datetime import time
+from datetime import datetime
 import json
 
 class Shift(db.Model):
@@ -20,6 +20,7 @@ class Shift(db.Model):
     note = db.Column(db.Text, nullable=True)  # ملاحظة
     absence_minutes = db.Column(db.Integer, nullable=False, default=0)  # فترة الغياب بالدقائق
     extra_minutes = db.Column(db.Integer, nullable=False, default=0)  # فترة الإضافي بالدقائق
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.now, onupdate=datetime.now)  # نسخة التقويم المجمّع
 
     def __repr__(self):
         return f"<Shift {self.name}>"
@@ -33,30 +34,32 @@ class Shift(db.Model):
             return None
         return self.daily_schedule.get(day_name.lower())
     
+    def compiled_calendar(self):
+        """
+        التقويم المجمّع للوردية (ShiftCalendar) - يُبنى مرة واحدة لكل نسخة من الوردية
+        """
+        from app.shift_calendar import compile_shift
+        return compile_shift(self)
+
     def is_working_day(self, day_name):
         """
         التحقق من كون اليوم يوم عمل
         """
-        day_schedule = self.get_day_schedule(day_name)
-        return day_schedule is not None and day_schedule.get('is_active', False)
+        from app.shift_calendar import DAY_NAMES
+        day_name = day_name.lower()
+        if day_name not in DAY_NAMES:
+            return False
+        return self.compiled_calendar().is_active(DAY_NAMES.index(day_name))
     
     def get_day_times(self, day_name):
         """
         الحصول على أوقات الدخول والخروج ليوم محدد
         """
-        day_schedule = self.get_day_schedule(day_name)
-        if not day_schedule or not day_schedule.get('is_active', False):
-            return None, None
-        
-        start_time_str = day_schedule.get('start_time')
-        end_time_str = day_schedule.get('end_time')
-        
-        try:
-            start_time = time.fromisoformat(start_time_str) if start_time_str else None
-            end_time = time.fromisoformat(end_time_str) if end_time_str else None
-            return start_time, end_time
-        except:
+        from app.shift_calendar import DAY_NAMES
+        day_name = day_name.lower()
+        if day_name not in DAY_NAMES:
             return None, None
+        return self.compiled_calendar().day_times(DAY_NAMES.index(day_name))
 
 """
 مثال على هيكل daily_schedule في JSON:
@@ -410,6 +410,8 @@ class TransactionApproval(db.Model):
     __table_args__ = (
     CheckConstraint("status IN ('pending', 'approved', 'rejected')", name='check_approval_status'),
     db.UniqueConstraint('transaction_id', 'approver_id', name='unique_transaction_approver'),
+    # عدد الموافقات لكل حالة في قائمة المعاملات
+    db.Index('ix_transaction_approvals_transaction_status', 'transaction_id', 'status'),
     )
     
     def __repr__(self):
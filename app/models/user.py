@@ -106,6 +106,7 @@ class User(db.Model):
     # دوال إدارة الأقسام والفروع المتعددة
     def add_department_management(self, department_id, role_type='head'):
         """إضافة قسم لإدارة المستخدم"""
+        self.invalidate_principal_cache()
         existing = UserDepartmentHead.query.filter_by(
             user_id=self.id, 
             department_id=department_id
@@ -123,6 +124,7 @@ class User(db.Model):
 
     def remove_department_management(self, department_id):
         """إزالة قسم من إدارة المستخدم"""
+        self.invalidate_principal_cache()
         management = UserDepartmentHead.query.filter_by(
             user_id=self.id, 
             department_id=department_id
@@ -135,6 +137,7 @@ class User(db.Model):
 
     def add_branch_management(self, branch_id, role_type='head'):
         """إضافة فرع لإدارة المستخدم"""
+        self.invalidate_principal_cache()
         existing = UserBranchHead.query.filter_by(
             user_id=self.id, 
             branch_id=branch_id
@@ -152,6 +155,7 @@ class User(db.Model):
 
     def remove_branch_management(self, branch_id):
         """إزالة فرع من إدارة المستخدم"""
+        self.invalidate_principal_cache()
         management = UserBranchHead.query.filter_by(
             user_id=self.id, 
             branch_id=branch_id
@@ -162,51 +166,128 @@ class User(db.Model):
             return True
         return False
 
+    def invalidate_principal_cache(self):
+        """إبطال بيانات المستخدم المحفوظة في ذاكرة token_required"""
+        from app.principal_cache import principal_cache
+
+        self._cached_managed_department_ids = None
+        self._cached_managed_branch_ids = None
+        self._accessible_employee_ids = None
+        principal_cache.invalidate(self.id)
+
     def get_managed_department_ids(self):
         """الحصول على معرفات الأقسام التي يديرها المستخدم"""
+        cached = getattr(self, '_cached_managed_department_ids', None)
+        if cached is not None:
+            # نسخة لأن المستدعين يضيفون القسم القديم إلى القائمة
+            return list(cached)
         managements = UserDepartmentHead.query.filter_by(user_id=self.id).all()
         return [m.department_id for m in managements]
 
     def get_managed_branch_ids(self):
         """الحصول على معرفات الفروع التي يديرها المستخدم"""
+        cached = getattr(self, '_cached_managed_branch_ids', None)
+        if cached is not None:
+            return list(cached)
         managements = UserBranchHead.query.filter_by(user_id=self.id).all()
         return [m.branch_id for m in managements]
 
-    def get_accessible_employees(self):
-        """الحصول على قائمة الموظفين الذين يمكن للمستخدم الوصول إليهم"""
+    # ==================== نطاق الموظفين المتاحين ====================
+
+    def get_accessible_employee_condition(self):
+        """
+        شرط SQL على Employee يحدد الموظفين الذين يمكن للمستخدم الوصول إليهم
+        None يعني جميع الموظفين (super admin)
+        """
         from app.models.employee import Employee
-        
+
         if self.is_super_admin():
-            # super admin يمكنه الوصول إلى جميع الموظفين
-            return Employee.query.all()
-        
+            return None
+
         elif self.is_branch_head() or self.is_branch_deputy():
             # رئيس الفرع أو نائبه يمكنه الوصول إلى موظفي جميع الفروع التي يديرها
             managed_branch_ids = self.get_managed_branch_ids()
-            
+
             # إضافة الفرع القديم للتوافق مع النظام السابق
             if self.branch_id and self.branch_id not in managed_branch_ids:
                 managed_branch_ids.append(self.branch_id)
-            
+
             if managed_branch_ids:
-                return Employee.query.filter(Employee.branch_id.in_(managed_branch_ids)).all()
-        
+                return Employee.branch_id.in_(managed_branch_ids)
+
         elif self.is_department_head() or self.is_department_deputy():
             # رئيس القسم أو نائبه يمكنه الوصول إلى موظفي جميع الأقسام التي يديرها
             managed_department_ids = self.get_managed_department_ids()
-            
+
             # إضافة القسم القديم للتوافق مع النظام السابق
             if self.department_id and self.department_id not in managed_department_ids:
                 managed_department_ids.append(self.department_id)
-            
+
             if managed_department_ids:
-                return Employee.query.filter(Employee.department_id.in_(managed_department_ids)).all()
-        
+                return Employee.department_id.in_(managed_department_ids)
+
         elif self.employee_id:
             # الموظف العادي يمكنه فقط الوصول إلى بياناته
-            return [Employee.query.get(self.employee_id)]
-        
-        return []
+            return Employee.id == self.employee_id
+
+        return db.false()
+
+    def accessible_employees_query(self):
+        """استعلام الموظفين المتاحين (قابل للفلترة والترقيم)"""
+        from app.models.employee import Employee
+
+        query = Employee.query
+        condition = self.get_accessible_employee_condition()
+        if condition is not None:
+            query = query.filter(condition)
+        return query
+
+    def accessible_employee_ids_subquery(self):
+        """
+        SELECT لمعرفات الموظفين المتاحين - للاستخدام في IN أو JOIN
+        مثال: Attendance.empId.in_(user.accessible_employee_ids_subquery())
+        """
+        from app.models.employee import Employee
+
+        select = db.select(Employee.id)
+        condition = self.get_accessible_employee_condition()
+        if condition is not None:
+            select = select.where(condition)
+        return select
+
+    def get_accessible_employee_ids(self):
+        """مجموعة معرفات الموظفين المتاحين (تُحسب مرة واحدة لكل كائن مستخدم)"""
+        cached = getattr(self, '_accessible_employee_ids', None)
+        if cached is None:
+            cached = frozenset(db.session.scalars(self.accessible_employee_ids_subquery()).all())
+            self._accessible_employee_ids = cached
+        return cached
+
+    def can_access_employee(self, employee_id):
+        """
+        هل يمكن للمستخدم الوصول إلى هذا الموظف؟
+        من مجموعة المعرفات إذا حُمّلت مسبقاً، وإلا باستعلام EXISTS واحد على المفتاح الأساسي
+        بدون تحميل جميع الموظفين المتاحين
+        """
+        cached = getattr(self, '_accessible_employee_ids', None)
+        if cached is not None:
+            return employee_id in cached
+
+        from app.models.employee import Employee
+
+        query = db.session.query(Employee.id).filter(Employee.id == employee_id)
+        condition = self.get_accessible_employee_condition()
+        if condition is not None:
+            query = query.filter(condition)
+        return db.session.query(query.exists()).scalar()
+
+    def has_accessible_employees(self):
+        """هل يوجد موظف واحد على الأقل ضمن نطاق المستخدم؟ (EXISTS)"""
+        return db.session.query(self.accessible_employees_query().exists()).scalar()
+
+    def get_accessible_employees(self):
+        """الحصول على قائمة الموظفين الذين يمكن للمستخدم الوصول إليهم"""
+        return self.accessible_employees_query().all()
 
     def get_accessible_holidays(self):
         """الحصول على قائمة العطل التي يمكن للمستخدم الوصول إليها"""
@@ -320,7 +401,7 @@ class User(db.Model):
 
     def get_department_transaction_summary(self, start_date=None, end_date=None):
         """
-        ملخص معاملات الأقسام/الفروع التي يديرها المستخدم
+        ملخص معاملات القسم/الفرع (للرؤساء والنواب)
         """
         from app.models.transaction import Transaction
         from datetime import datetime, timedelta
@@ -336,31 +417,22 @@ class User(db.Model):
             Transaction.created_at <= end_date
         )
         
-        # فلترة حسب صلاحيات المستخدم
+        # فلترة حسب صلاحيات المستخدم (استعلام فرعي بدلاً من تحميل الموظفين)
         if self.is_super_admin():
             pass  # لا حاجة لفلترة
         elif self.is_branch_head() or self.is_branch_deputy():
-            # معاملات موظفي جميع الفروع التي يديرها
-            managed_branch_ids = self.get_managed_branch_ids()
-            if self.branch_id and self.branch_id not in managed_branch_ids:
-                managed_branch_ids.append(self.branch_id)
-            
-            if managed_branch_ids:
+            # معاملات موظفي الفرع
+            if self.branch_id:
                 from app.models.employee import Employee
-                branch_employee_ids = [emp.id for emp in Employee.query.filter(Employee.branch_id.in_(managed_branch_ids)).all()]
+                branch_employee_ids = db.select(Employee.id).where(Employee.branch_id == self.branch_id)
                 query = query.filter(Transaction.employee_id.in_(branch_employee_ids))
             else:
                 return None
-                
         elif self.is_department_head() or self.is_department_deputy():
-            # معاملات موظفي جميع الأقسام التي يديرها
-            managed_department_ids = self.get_managed_department_ids()
-            if self.department_id and self.department_id not in managed_department_ids:
-                managed_department_ids.append(self.department_id)
-            
-            if managed_department_ids:
+            # معاملات موظفي القسم
+            if self.department_id:
                 from app.models.employee import Employee
-                dept_employee_ids = [emp.id for emp in Employee.query.filter(Employee.department_id.in_(managed_department_ids)).all()]
+                dept_employee_ids = db.select(Employee.id).where(Employee.department_id == self.department_id)
                 query = query.filter(Transaction.employee_id.in_(dept_employee_ids))
             else:
                 return None
@@ -373,14 +445,11 @@ class User(db.Model):
         
         transactions = query.all()
         
-        # إنشاء الملخص...
         summary = {
             'period': {
                 'start_date': start_date.isoformat(),
                 'end_date': end_date.isoformat()
             },
-            'managed_departments': self.get_managed_department_ids(),
-            'managed_branches': self.get_managed_branch_ids(),
             'total': len(transactions),
             'by_status': {
                 'pending': len([t for t in transactions if t.status == 'pending']),
@@ -474,14 +543,12 @@ class User(db.Model):
             # السوبر أدمن يمكنه الوصول إلى جميع المعاملات
             return Transaction.query.all()
         
-        # الحصول على الموظفين الذين يمكن الوصول إليهم
-        accessible_employee_ids = [emp.id for emp in self.get_accessible_employees()]
-        
-        if accessible_employee_ids:
+        # الموظفون الذين يمكن الوصول إليهم كاستعلام فرعي (بدون تحميلهم)
+        if self.has_accessible_employees():
             # المعاملات للموظفين التابعين + المعاملات التي طلبها المستخدم
             return Transaction.query.filter(
                 db.or_(
-                    Transaction.employee_id.in_(accessible_employee_ids),
+                    Transaction.employee_id.in_(self.accessible_employee_ids_subquery()),
                     Transaction.requested_by == self.id
                 )
             ).all()
@@ -553,78 +620,3 @@ class User(db.Model):
         التحقق من وجود صلاحية الموافقة على معاملة معينة
         """
         return transaction.can_be_approved_by(self)
-
-    # ================================ دوال مساعدة إضافية ================================
-
-    def get_department_transaction_summary(self, start_date=None, end_date=None):
-        """
-        ملخص معاملات القسم/الفرع (للرؤساء والنواب)
-        """
-        from app.models.transaction import Transaction
-        from datetime import datetime, timedelta
-        
-        if not start_date:
-            start_date = datetime.now().replace(day=1)  # بداية الشهر الحالي
-        
-        if not end_date:
-            end_date = datetime.now()
-        
-        query = Transaction.query.filter(
-            Transaction.created_at >= start_date,
-            Transaction.created_at <= end_date
-        )
-        
-        # فلترة حسب صلاحيات المستخدم
-        if self.is_super_admin():
-            pass  # لا حاجة لفلترة
-        elif self.is_branch_head() or self.is_branch_deputy():
-            # معاملات موظفي الفرع
-            if self.branch_id:
-                from app.models.employee import Employee
-                branch_employee_ids = [emp.id for emp in Employee.query.filter_by(branch_id=self.branch_id).all()]
-                query = query.filter(Transaction.employee_id.in_(branch_employee_ids))
-            else:
-                return None
-        elif self.is_department_head() or self.is_department_deputy():
-            # معاملات موظفي القسم
-            if self.department_id:
-                from app.models.employee import Employee
-                dept_employee_ids = [emp.id for emp in Employee.query.filter_by(department_id=self.department_id).all()]
-                query = query.filter(Transaction.employee_id.in_(dept_employee_ids))
-            else:
-                return None
-        else:
-            # موظف عادي - فقط معاملاته
-            if self.employee_id:
-                query = query.filter(Transaction.employee_id == self.employee_id)
-            else:
-                return None
-        
-        transactions = query.all()
-        
-        summary = {
-            'period': {
-                'start_date': start_date.isoformat(),
-                'end_date': end_date.isoformat()
-            },
-            'total': len(transactions),
-            'by_status': {
-                'pending': len([t for t in transactions if t.status == 'pending']),
-                'approved': len([t for t in transactions if t.status == 'approved']),
-                'rejected': len([t for t in transactions if t.status == 'rejected'])
-            },
-            'by_type': {}
-        }
-        
-        # تصنيف حسب النوع
-        transaction_types = ['advance', 'reward', 'penalty', 'hourly_leave', 'daily_leave']
-        for trans_type in transaction_types:
-            type_transactions = [t for t in transactions if t.transaction_type == trans_type]
-            summary['by_type'][trans_type] = {
-                'total': len(type_transactions),
-                'pending': len([t for t in type_transactions if t.status == 'pending']),
-                'approved': len([t for t in type_transactions if t.status == 'approved']),
-                'rejected': len([t for t in type_transactions if t.status == 'rejected'])
-            }
-        
-        return summary
\ No newline at end of file
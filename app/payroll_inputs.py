@@ -0,0 +1,168 @@
+# app/payroll_inputs.py
+"""
+مدخلات حساب الرواتب لفترة محددة محملة مسبقاً:
+- استعلام واحد لكل جدول (لكل دفعة موظفين) بدلاً من استعلامات لكل موظف
+- النتائج مجمعة حسب الموظف في قواميس بالذاكرة
+- كل جدول يُحمّل فقط لموظفي نظام العمل الذي يحتاجه
+"""
+from collections import defaultdict
+from sqlalchemy.orm import joinedload
+from app import db
+from app.date_ranges import date_range
+
+# SQL Server لا يقبل أكثر من 2100 معامل في الاستعلام الواحد
+IN_BATCH_SIZE = 1000
+
+
+def get_work_system(employee):
+    """نظام عمل الموظف بنفس ترتيب calculate_employee_salary_period"""
+    if employee.profession and not employee.job_title:
+        return 'hourly'
+    if employee.job_title:
+        if employee.job_title.month_system:
+            return 'monthly'
+        if employee.job_title.production_system:
+            return 'production'
+        if employee.job_title.shift_system:
+            return 'shift'
+    return 'none'
+
+
+def _chunks(items, size=IN_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def load_reference_data(employees):
+    """
+    تحميل المسميات الوظيفية والمهن من ذاكرة البيانات المرجعية إلى خريطة الهوية في الجلسة
+    حتى لا يُنفذ التحميل الكسول استعلاماً لكل موظف
+    """
+    from app.models import JobTitle, Profession
+    from app.reference_cache import reference_cache
+
+    reference_cache.get_many(JobTitle, {e.position for e in employees if e.position})
+    reference_cache.get_many(Profession, {e.profession_id for e in employees if e.profession_id})
+
+
+class PayrollInputs:
+    """
+    جميع مدخلات الرواتب لمجموعة موظفين وفترة - يُبنى مرة واحدة لكل عملية حساب
+    """
+
+    def __init__(self, employees, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+
+        self.shifts = {}
+        self.monthly_attendances = defaultdict(list)
+        self.production_records = defaultdict(list)
+        self.attendances = defaultdict(list)
+        self.attendance_days = {}
+        self.leaves = defaultdict(list)
+        self.advances = defaultdict(list)
+
+        load_reference_data(employees)
+
+        by_system = defaultdict(list)
+        for employee in employees:
+            by_system[get_work_system(employee)].append(employee)
+
+        monthly_ids = [e.id for e in by_system['monthly']]
+        production_ids = [e.id for e in by_system['production']]
+        shift_employees = [e for e in by_system['shift'] if e.shift_id]
+        hourly_ids = [e.id for e in by_system['hourly']]
+
+        self._load_monthly_attendances(monthly_ids)
+        self._load_production_records(production_ids)
+        self._load_shifts({e.shift_id for e in shift_employees})
+        # حضور الورديات يُحتاج فقط لمن لديه وردية موجودة
+        shift_ids = [e.id for e in shift_employees if e.shift_id in self.shifts]
+        self._load_attendances(shift_ids + hourly_ids)
+        self._evaluate_shift_days([e for e in shift_employees if e.shift_id in self.shifts])
+        self._load_leaves(shift_ids)
+        self._load_advances([e.id for e in employees])
+
+    def _load_monthly_attendances(self, employee_ids):
+        from app.models import MonthlyAttendance
+
+        for chunk in _chunks(employee_ids):
+            rows = MonthlyAttendance.query.filter(
+                MonthlyAttendance.employee_id.in_(chunk),
+                date_range(MonthlyAttendance.date, self.start_date, self.end_date)
+            ).order_by(MonthlyAttendance.id).all()
+            for row in rows:
+                self.monthly_attendances[row.employee_id].append(row)
+
+    def _load_production_records(self, employee_ids):
+        from app.models import ProductionMonitoring
+
+        for chunk in _chunks(employee_ids):
+            rows = ProductionMonitoring.query.options(
+                joinedload(ProductionMonitoring.piece)
+            ).filter(
+                ProductionMonitoring.employee_id.in_(chunk),
+                date_range(ProductionMonitoring.date, self.start_date, self.end_date)
+            ).order_by(ProductionMonitoring.id).all()
+            for row in rows:
+                self.production_records[row.employee_id].append(row)
+
+    def _load_shifts(self, shift_ids):
+        from app.models import Shift
+        from app.reference_cache import reference_cache
+
+        self.shifts.update(reference_cache.get_many(Shift, shift_ids))
+
+    def _load_attendances(self, employee_ids):
+        from app.models import Attendance
+
+        # نفس شرط وترتيب الاستعلام لكل موظف في calculate_*_system_period
+        for chunk in _chunks(employee_ids):
+            rows = Attendance.query.filter(
+                Attendance.empId.in_(chunk),
+                Attendance.checkInTime.isnot(None),
+                date_range(Attendance.createdAt, self.start_date, self.end_date)
+            ).order_by(
+                Attendance.empId,
+                Attendance.createdAt,
+                Attendance.checkInTime
+            ).all()
+            for row in rows:
+                self.attendances[row.empId].append(row)
+
+    def _evaluate_shift_days(self, employees):
+        """تقييم أيام حضور جميع موظفي الورديات بمحرك الحضور في استدعاء واحد"""
+        from app.attendance_engine import evaluate_attendances, shift_week
+
+        shift_weeks = {shift_id: shift_week(shift) for shift_id, shift in self.shifts.items()}
+        weeks = {employee.id: shift_weeks[employee.shift_id] for employee in employees}
+        rows = [row for employee in employees for row in self.attendances.get(employee.id, [])]
+        self.attendance_days = evaluate_attendances(rows, weeks)
+
+    def _load_leaves(self, employee_ids):
+        from app.models.leave import Leave
+
+        # نفس شرط Leave.get_employee_leaves_for_period
+        for chunk in _chunks(employee_ids):
+            rows = Leave.query.filter(
+                Leave.employee_id.in_(chunk),
+                Leave.status == 'active',
+                Leave.start_date <= self.end_date,
+                db.or_(
+                    Leave.end_date >= self.start_date,
+                    Leave.end_date.is_(None)
+                )
+            ).order_by(Leave.id).all()
+            for row in rows:
+                self.leaves[row.employee_id].append(row)
+
+    def _load_advances(self, employee_ids):
+        from app.models import Advance
+
+        for chunk in _chunks(employee_ids):
+            rows = Advance.query.filter(
+                Advance.employee_id.in_(chunk),
+                date_range(Advance.date, self.start_date, self.end_date)
+            ).order_by(Advance.id).all()
+            for row in rows:
+                self.advances[row.employee_id].append(row)
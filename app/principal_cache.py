@@ -0,0 +1,189 @@
+# app/principal_cache.py
+"""
+ذاكرة مؤقتة لهوية المستخدم المصادق عليه (principal) في token_required:
+- المفتاح user_id والقيمة بيانات المستخدم الأساسية + معرفات الفروع/الأقسام التي يديرها
+- LRU داخل العملية مع مدة صلاحية قصيرة (PRINCIPAL_CACHE_TTL)
+- Redis اختياري (PRINCIPAL_CACHE_REDIS_URL) لمشاركة الذاكرة بين العمليات
+- الإبطال الصريح عند تعديل/حذف/تعطيل المستخدم، وتلقائياً بعد أي commit
+  يغير صف المستخدم أو روابط إدارة الفروع/الأقسام
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+from app import db
+
+DEFAULT_TTL_SECONDS = 60
+DEFAULT_MAX_SIZE = 1024
+REDIS_KEY_PREFIX = 'hr:principal:'
+
+# الأعمدة المحفوظة في الذاكرة - كلمة المرور والتواريخ تُحمّل عند الحاجة فقط
+PRINCIPAL_COLUMNS = ('id', 'username', 'is_active', 'user_type', 'employee_id', 'department_id', 'branch_id')
+
+
+class PrincipalCache:
+    """
+    ذاكرة LRU + TTL لبيانات المستخدمين مع Redis اختياري
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_url = None
+
+    # ==================== الإعدادات ====================
+
+    def _ttl(self):
+        return current_app.config.get('PRINCIPAL_CACHE_TTL', DEFAULT_TTL_SECONDS)
+
+    def _max_size(self):
+        return current_app.config.get('PRINCIPAL_CACHE_SIZE', DEFAULT_MAX_SIZE)
+
+    def _get_redis(self):
+        """عميل Redis إذا تم ضبط PRINCIPAL_CACHE_REDIS_URL، وإلا None"""
+        url = current_app.config.get('PRINCIPAL_CACHE_REDIS_URL')
+        if not url:
+            return None
+        if self._redis is None or self._redis_url != url:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(url, socket_timeout=0.5)
+                self._redis_url = url
+            except Exception as e:
+                print(f"⚠️  تعذر الاتصال بـ Redis لذاكرة المستخدمين: {str(e)}")
+                return None
+        return self._redis
+
+    # ==================== القراءة والكتابة ====================
+
+    def _get_entry(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                expires_at, data = entry
+                if expires_at > now:
+                    self._entries.move_to_end(user_id)
+                    return data
+                del self._entries[user_id]
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                raw = client.get(f'{REDIS_KEY_PREFIX}{user_id}')
+                if raw:
+                    data = json.loads(raw)
+                    self._put_local(user_id, data)
+                    return data
+            except Exception as e:
+                print(f"⚠️  خطأ في قراءة ذاكرة المستخدمين من Redis: {str(e)}")
+        return None
+
+    def _put_local(self, user_id, data):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self._ttl(), data)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self._max_size():
+                self._entries.popitem(last=False)
+
+    def _put(self, user_id, data):
+        self._put_local(user_id, data)
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.setex(f'{REDIS_KEY_PREFIX}{user_id}', self._ttl(), json.dumps(data))
+            except Exception as e:
+                print(f"⚠️  خطأ في الكتابة إلى ذاكرة المستخدمين في Redis: {str(e)}")
+
+    def invalidate(self, user_id):
+        """حذف المستخدم من الذاكرة (يُستدعى بعد أي تعديل على بياناته أو صلاحياته)"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.delete(f'{REDIS_KEY_PREFIX}{user_id}')
+            except Exception as e:
+                print(f"⚠️  خطأ في حذف المستخدم من ذاكرة Redis: {str(e)}")
+
+    def clear(self):
+        """مسح الذاكرة المحلية بالكامل"""
+        with self._lock:
+            self._entries.clear()
+
+    # ==================== تحميل المستخدم ====================
+
+    @staticmethod
+    def _load(user_id):
+        """تحميل بيانات المستخدم من قاعدة البيانات - None إذا لم يوجد"""
+        from app.models.user import User
+
+        user = User.query.get(user_id)
+        if not user:
+            return None
+
+        data = {column: getattr(user, column) for column in PRINCIPAL_COLUMNS}
+        data['managed_branch_ids'] = user.get_managed_branch_ids()
+        data['managed_department_ids'] = user.get_managed_department_ids()
+        return data
+
+    @staticmethod
+    def _attach(data):
+        """
+        بناء كائن User مرتبط بالجلسة من البيانات المحفوظة بدون استعلام
+        الأعمدة غير المحفوظة (كلمة المرور، التواريخ) تُحمّل تلقائياً عند الوصول إليها
+        """
+        from app.models.user import User
+
+        user = User(**{column: data[column] for column in PRINCIPAL_COLUMNS})
+        make_transient_to_detached(user)
+        user = db.session.merge(user, load=False)
+        user._cached_managed_branch_ids = list(data['managed_branch_ids'])
+        user._cached_managed_department_ids = list(data['managed_department_ids'])
+        return user
+
+    def get_user(self, user_id):
+        """المستخدم المصادق عليه كـ User مرتبط بالجلسة - None إذا لم يوجد"""
+        data = self._get_entry(user_id)
+        if data is None:
+            data = self._load(user_id)
+            if data is None:
+                return None
+            self._put(user_id, data)
+        return self._attach(data)
+
+
+principal_cache = PrincipalCache()
+
+
+# ==================== الإبطال التلقائي ====================
+
+@event.listens_for(Session, 'after_flush')
+def _collect_principal_changes(session, flush_context):
+    """تجميع معرفات المستخدمين الذين تغيرت بياناتهم أو ما يديرونه في هذه المعاملة"""
+    from app.models.user import User, UserBranchHead, UserDepartmentHead
+
+    changed = session.info.setdefault('principal_cache_invalidations', set())
+    for instance in list(session.dirty) + list(session.deleted):
+        if isinstance(instance, User) and instance.id is not None:
+            changed.add(instance.id)
+    for instance in list(session.new) + list(session.deleted):
+        if isinstance(instance, (UserBranchHead, UserDepartmentHead)) and instance.user_id is not None:
+            changed.add(instance.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_principal_changes(session):
+    changed = session.info.pop('principal_cache_invalidations', None)
+    if changed and has_app_context():
+        for user_id in changed:
+            principal_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_principal_changes(session):
+    session.info.pop('principal_cache_invalidations', None)
@@ -0,0 +1,236 @@
+# app/reference_cache.py
+"""
+ذاكرة مؤقتة لبيانات المرجعية (الفروع، الأقسام، المسميات الوظيفية، المهن، الورديات، قطع الإنتاج):
+- كل جدول يُحمّل كاملاً باستعلام واحد عند أول طلب ويُحفظ كأعمدة في ذاكرة العملية
+- لكل جدول رقم نسخة يُزاد بعد أي commit يضيف أو يعدل أو يحذف صفاً منه (أحداث after_flush/after_commit)
+- Redis اختياري (REFERENCE_CACHE_REDIS_URL) يحمل أرقام النسخ حتى تُبطل العمليات الأخرى نسختها
+  وبدونه تنتهي صلاحية الجدول بعد REFERENCE_CACHE_TTL ثانية
+- البحث يعيد كائناً مرتبطاً بالجلسة بدون استعلام (نفس أسلوب principal_cache)
+"""
+import threading
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+from app import db
+
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_VERSION_CHECK_SECONDS = 2
+REDIS_KEY_PREFIX = 'hr:refdata:version:'
+
+# جداول لها رقم نسخة فقط بدون تحميل كامل
+# (تقويم العطل يحمّل العطل حسب السنة، وإحصائيات الإجازات للفترات المغلقة)
+VERSIONED_TABLES = ('holidays', 'leaves')
+
+
+_models = None
+
+
+def _reference_models():
+    """الجداول المرجعية المحفوظة في الذاكرة {اسم الجدول: النموذج}"""
+    global _models
+    if _models is None:
+        from app.models import Branch, Department, JobTitle, Profession, Shift, ProductionPiece
+
+        models = (Branch, Department, JobTitle, Profession, Shift, ProductionPiece)
+        _models = {model.__table__.name: model for model in models}
+    return _models
+
+
+def _is_tracked(table):
+    return table in VERSIONED_TABLES or table in _reference_models()
+
+
+def attach_row(model, data):
+    """
+    كائن مرتبط بالجلسة من أعمدة محفوظة في الذاكرة بدون استعلام
+    إذا كان الصف محملاً في الجلسة مسبقاً يُعاد كما هو حتى لا تُستبدل تعديلاته
+    """
+    existing = db.session.identity_map.get(identity_key(model, data['id']))
+    if existing is not None:
+        return existing
+
+    instance = model(**data)
+    make_transient_to_detached(instance)
+    return db.session.merge(instance, load=False)
+
+
+class ReferenceCache:
+    """
+    جداول مرجعية كاملة في الذاكرة مع إبطال بأرقام النسخ
+    """
+
+    def __init__(self):
+        self._tables = {}  # table -> (version, loaded_at, {id: {column: value}})
+        self._versions = {}  # table -> رقم النسخة المحلي
+        self._remote_versions = {}  # table -> (checked_at, رقم النسخة في Redis)
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_url = None
+
+    # ==================== الإعدادات ====================
+
+    def _ttl(self):
+        return current_app.config.get('REFERENCE_CACHE_TTL', DEFAULT_TTL_SECONDS)
+
+    def _version_check_interval(self):
+        return current_app.config.get('REFERENCE_CACHE_VERSION_CHECK', DEFAULT_VERSION_CHECK_SECONDS)
+
+    def _get_redis(self):
+        """عميل Redis إذا تم ضبط REFERENCE_CACHE_REDIS_URL، وإلا None"""
+        url = current_app.config.get('REFERENCE_CACHE_REDIS_URL')
+        if not url:
+            return None
+        if self._redis is None or self._redis_url != url:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(url, socket_timeout=0.5)
+                self._redis_url = url
+            except Exception as e:
+                print(f"⚠️  تعذر الاتصال بـ Redis لذاكرة البيانات المرجعية: {str(e)}")
+                return None
+        return self._redis
+
+    # ==================== أرقام النسخ ====================
+
+    def _current_version(self, table):
+        """
+        رقم نسخة الجدول: المحلي + المشترك في Redis
+        Redis يُسأل مرة واحدة كل REFERENCE_CACHE_VERSION_CHECK ثانية لكل جدول
+        """
+        local = self._versions.get(table, 0)
+        client = self._get_redis()
+        if client is None:
+            return local, None
+
+        now = time.monotonic()
+        checked = self._remote_versions.get(table)
+        if checked is not None and now - checked[0] < self._version_check_interval():
+            return local, checked[1]
+
+        try:
+            remote = int(client.get(f'{REDIS_KEY_PREFIX}{table}') or 0)
+        except Exception as e:
+            print(f"⚠️  خطأ في قراءة نسخة البيانات المرجعية من Redis: {str(e)}")
+            remote = checked[1] if checked is not None else None
+        self._remote_versions[table] = (now, remote)
+        return local, remote
+
+    def version(self, table):
+        """رقم النسخة الحالي للجدول - يتغير بعد أي commit يعدله في هذه العملية أو غيرها (مع Redis)"""
+        return self._current_version(table)
+
+    def invalidate(self, *tables):
+        """إبطال جداول مرجعية في هذه العملية وفي باقي العمليات عبر Redis"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+                self._tables.pop(table, None)
+                self._remote_versions.pop(table, None)
+
+        client = self._get_redis()
+        if client is not None:
+            for table in tables:
+                try:
+                    client.incr(f'{REDIS_KEY_PREFIX}{table}')
+                except Exception as e:
+                    print(f"⚠️  خطأ في تحديث نسخة البيانات المرجعية في Redis: {str(e)}")
+
+    def clear(self):
+        """مسح الذاكرة المحلية بالكامل"""
+        with self._lock:
+            self._tables.clear()
+            self._remote_versions.clear()
+
+    # ==================== التحميل ====================
+
+    def _rows(self, model):
+        """صفوف الجدول {id: {column: value}} من الذاكرة أو بتحميل الجدول كاملاً"""
+        table = model.__table__.name
+        version = self._current_version(table)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._tables.get(table)
+        if entry is not None and entry[0] == version and now - entry[1] < self._ttl():
+            return entry[2]
+
+        columns = [column.key for column in inspect(model).column_attrs]
+        rows = {}
+        for values in db.session.query(*[getattr(model, key) for key in columns]).all():
+            data = dict(zip(columns, values))
+            rows[data['id']] = data
+
+        with self._lock:
+            self._tables[table] = (version, now, rows)
+        return rows
+
+    # ==================== البحث ====================
+
+    @staticmethod
+    def _key(ident):
+        """معرفات الطلبات قد تصل نصاً ('5') بينما مفاتيح الجداول أرقام"""
+        if isinstance(ident, str) and ident.isdigit():
+            return int(ident)
+        return ident
+
+    def get(self, model, ident):
+        """صف مرجعي بالمعرف كـ كائن مرتبط بالجلسة - None إذا لم يوجد"""
+        if ident is None:
+            return None
+        data = self._rows(model).get(self._key(ident))
+        if data is None:
+            return None
+        return attach_row(model, data)
+
+    def get_many(self, model, idents):
+        """صفوف مرجعية بعدة معرفات {id: كائن} - المعرفات غير الموجودة تُهمل"""
+        rows = self._rows(model)
+        keys = {self._key(ident) for ident in idents if ident is not None}
+        return {key: attach_row(model, rows[key]) for key in keys if key in rows}
+
+    def lookup(self, model, ident, column):
+        """قيمة عمود واحد لصف مرجعي بدون إنشاء كائن (مثل اسم الفرع) - None إذا لم يوجد"""
+        if ident is None:
+            return None
+        data = self._rows(model).get(self._key(ident))
+        return data.get(column) if data is not None else None
+
+
+reference_cache = ReferenceCache()
+
+
+# ==================== الإبطال التلقائي ====================
+
+@event.listens_for(Session, 'after_flush')
+def _collect_reference_changes(session, flush_context):
+    """تجميع الجداول المرجعية التي تغيرت في هذه المعاملة"""
+    changed = session.info.setdefault('reference_cache_invalidations', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(getattr(instance, '__table__', None), 'name', None)
+        if _is_tracked(table):
+            changed.add(table)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_reference_changes(orm_execute_state):
+    """إضافة أو تعديل أو حذف جماعي (insert()/query.update()/delete()) على جدول مرجعي"""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and _is_tracked(mapper.local_table.name):
+        changed = orm_execute_state.session.info.setdefault('reference_cache_invalidations', set())
+        changed.add(mapper.local_table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_reference_changes(session):
+    changed = session.info.pop('reference_cache_invalidations', None)
+    if changed and has_app_context():
+        reference_cache.invalidate(*changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_reference_changes(session):
+    session.info.pop('reference_cache_invalidations', None)
@@ -1,10 +1,11 @@
 from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify
-from sqlalchemy import func, cast, Date
+from sqlalchemy import func
 from app import db
 from app.models import MonthlyAttendance, Employee
 from app.models.attendance_type import AttendanceType
 from app.utils import token_required
+from app.date_ranges import date_range, on_date
 import json
 
 monthly_attendance_bp = Blueprint('monthly_attendance', __name__)
@@ -29,7 +30,7 @@ def create_monthly_attendance(user_id):
         # التحقق من عدم وجود سجل لنفس اليوم
         existing_record = MonthlyAttendance.query.filter(
             MonthlyAttendance.employee_id == data['employee_id'],
-            cast(MonthlyAttendance.date, Date) == datetime.now().date()
+            on_date(MonthlyAttendance.date, datetime.now().date())
         ).first()
 
         if existing_record:
@@ -110,8 +111,11 @@ def get_employee_attendance(user_id, employee_id):
 
         if start_date and end_date:
             query = query.filter(
-                MonthlyAttendance.date >= datetime.strptime(start_date, '%Y-%m-%d'),
-                MonthlyAttendance.date <= datetime.strptime(end_date, '%Y-%m-%d')
+                date_range(
+                    MonthlyAttendance.date,
+                    datetime.strptime(start_date, '%Y-%m-%d'),
+                    datetime.strptime(end_date, '%Y-%m-%d')
+                )
             )
 
         records = query.order_by(MonthlyAttendance.date.desc()).all()
@@ -145,8 +149,7 @@ def get_monthly_report(user_id):
             end_date = datetime(int(year), int(month) + 1, 1) - timedelta(days=1)
 
         query = MonthlyAttendance.query.filter(
-            MonthlyAttendance.date >= start_date,
-            MonthlyAttendance.date <= end_date
+            date_range(MonthlyAttendance.date, start_date, end_date)
         )
 
         if employee_id:
@@ -275,8 +278,11 @@ def get_attendance_stats(user_id):
 
         if start_date and end_date:
             query = query.filter(
-                MonthlyAttendance.date >= datetime.strptime(start_date, '%Y-%m-%d'),
-                MonthlyAttendance.date <= datetime.strptime(end_date, '%Y-%m-%d')
+                date_range(
+                    MonthlyAttendance.date,
+                    datetime.strptime(start_date, '%Y-%m-%d'),
+                    datetime.strptime(end_date, '%Y-%m-%d')
+                )
             )
 
         if employee_id:
@@ -318,7 +324,7 @@ def get_daily_attendance(user_id):
         today = datetime.now().date()
         
         records = MonthlyAttendance.query.filter(
-            cast(MonthlyAttendance.date, Date) == today
+            on_date(MonthlyAttendance.date, today)
         ).order_by(MonthlyAttendance.date.desc()).all()
 
         return jsonify([{
@@ -4,6 +4,7 @@ from app import db
 from app.models import ProductionMonitoring, Employee, ProductionPiece
 from app.models.user import User
 from app.utils import token_required
+from app.reference_cache import reference_cache
 from sqlalchemy import func
 
 production_monitoring_bp = Blueprint('production_monitoring', __name__)
@@ -27,7 +28,7 @@ def create_monitoring(user_id):
             return jsonify({'message': 'Employee not found'}), 404
 
         # التحقق من وجود القطعة
-        piece = ProductionPiece.query.get(data['piece_id'])
+        piece = reference_cache.get(ProductionPiece, data['piece_id'])
         if not piece:
             return jsonify({'message': 'Production piece not found'}), 404
 
@@ -104,7 +105,7 @@ def create_monitoring_multi_quality(user_id):
             return jsonify({'message': 'Employee not found'}), 404
 
         # التحقق من وجود القطعة
-        piece = ProductionPiece.query.get(data['piece_id'])
+        piece = reference_cache.get(ProductionPiece, data['piece_id'])
         if not piece:
             return jsonify({'message': 'Production piece not found'}), 404
             
@@ -21,5 +21,6 @@ from app.routes.holiday import holiday_bp
 from app.routes.transaction_routes import transaction_bp
 from app.routes.leave_routes import leave_bp
 from app.routes.id_card import id_card_bp
+from app.routes.jobs import job_bp
 
 # from app.routes.reports import reports_bp
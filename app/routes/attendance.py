@@ -1,15 +1,26 @@
 from datetime import datetime, time, timedelta
 from flask import Blueprint, json, request, jsonify
-from sqlalchemy import func ,cast, Date
+from sqlalchemy import func
 from app import db
-from app.models import Attendance, Employee, Shift
+from app.models import Attendance, Employee, Shift, Branch, Department
 from app.models.holiday import Holiday
 from app.models.user import User
-from app.utils import token_required
+from app.utils import token_required, stream_json_array, stream_ndjson
+from app.controllers.fingerprint_sync_controller import FingerprintSyncController
+from app.jobs import job_queue, job_handler, is_async_request, job_accepted_response
+from app.models.background_job import BackgroundJob
+from app.attendance_calendar import AttendanceCalendar
+from app.date_ranges import date_range, on_date
+from app.reference_cache import reference_cache
+from app.checkin_buffer import checkin_buffer
+from app.attendance_engine import (
+    evaluate_attendances, overtime_seconds, shift_week, time_to_seconds
+)
 import json
 from json import JSONDecodeError  # استيراد JSONDecodeError مباشرة من مكتبة json
 
-from sqlalchemy import or_, cast
+from sqlalchemy import or_
+from sqlalchemy.orm import contains_eager
 attendance_bp = Blueprint('attendance', __name__)
 
 # Create Attendance
@@ -52,14 +63,12 @@ def get_all_attendances(current_user):
         return jsonify({'message': 'User not found'}), 404
 
     # الموظفون المسموح الوصول إليهم
-    accessible_employees = user.get_accessible_employees()
-    accessible_employee_ids = [emp.id for emp in accessible_employees]
-    if not accessible_employee_ids:
+    if not user.has_accessible_employees():
         return jsonify([]), 200
 
     # فلترة اختيارية بالحالة ?status=pending|approved|rejected
     status_param = request.args.get('status')
-    q = Attendance.query.filter(Attendance.empId.in_(accessible_employee_ids))
+    q = Attendance.query.filter(Attendance.empId.in_(user.accessible_employee_ids_subquery()))
     if status_param:
         q = q.filter(Attendance.status == status_param)
 
@@ -99,10 +108,7 @@ def get_attendances_by_status(current_user):
         return jsonify({'message': 'User not found'}), 404
 
     # الموظفون المسموح الوصول إليهم
-    accessible_employees = user.get_accessible_employees()
-    accessible_employee_ids = [emp.id for emp in accessible_employees]
-    
-    if not accessible_employee_ids:
+    if not user.has_accessible_employees():
         return jsonify({
             'pending': [],
             'approved': [],
@@ -118,7 +124,7 @@ def get_attendances_by_status(current_user):
     ).join(
         Employee, Attendance.empId == Employee.id
     ).filter(
-        Attendance.empId.in_(accessible_employee_ids)
+        Attendance.empId.in_(user.accessible_employee_ids_subquery())
     ).order_by(
         Attendance.createdAt.desc()
     ).all()
@@ -177,10 +183,7 @@ def get_employee_attendance_today(current_user, employee_id):
         return jsonify({'message': 'User not found'}), 404
 
     # التحقق من صلاحية الوصول للموظف
-    accessible_employees = user.get_accessible_employees()
-    accessible_employee_ids = [emp.id for emp in accessible_employees]
-    
-    if employee_id not in accessible_employee_ids:
+    if not user.can_access_employee(employee_id):
         return jsonify({'message': 'Access denied to this employee'}), 403
 
     # جلب بيانات الموظف
@@ -201,6 +204,8 @@ def get_employee_attendance_today(current_user, employee_id):
         'employeeName': employee.full_name
     }
 
+    pending_checkins = [] if attendance_today else checkin_buffer.pending_for(employee_id, today)
+
     # تقسيم الاستجابة حسب وجود سجل حضور
     if attendance_today:
         # إضافة تفاصيل سجل الحضور مع استخدام getattr للأمان
@@ -219,6 +224,23 @@ def get_employee_attendance_today(current_user, employee_id):
             'hasAttendance': attendance_details,
             'noAttendance': None
         }
+    elif pending_checkins:
+        # تسجيل دخول في طابور الكتابة المؤجلة لم يُنقل بعد (القراءة بعد الكتابة)
+        pending = pending_checkins[0]
+        result = {
+            'hasAttendance': {
+                **employee_data,
+                'attendanceId': None,
+                'checkInTime': pending['checkInTime'][:8],
+                'checkOutTime': None,
+                'status': pending['status'],
+                'workingHours': None,
+                'notes': None,
+                'createdAt': pending['date'],
+                'queued': True
+            },
+            'noAttendance': None
+        }
     else:
         result = {
             'hasAttendance': None,
@@ -241,8 +263,7 @@ def get_attendance(current_user, id):
     if not user:
         return jsonify({'message': 'User not found'}), 404
 
-    accessible_ids = [e.id for e in user.get_accessible_employees()]
-    if attendance.empId not in accessible_ids:
+    if not user.can_access_employee(attendance.empId):
         return jsonify({'message': 'غير مسموح: هذا السجل خارج نطاق صلاحياتك'}), 403
 
     # تجهيز الرد (مع status + الحقول الاختيارية)
@@ -274,8 +295,7 @@ def update_attendance(current_user, id):
         return jsonify({'message': 'User not found'}), 404
 
     # الموظفون المتاحون لهذا المستخدم (لمنع تعديل سجلات خارج النطاق)
-    accessible_ids = [e.id for e in user.get_accessible_employees()]
-    if (att.empId not in accessible_ids) and not (user.user_type == 'employee' and user.employee_id == att.empId):
+    if not user.can_access_employee(att.empId) and not (user.user_type == 'employee' and user.employee_id == att.empId):
         return jsonify({'message': 'غير مسموح: هذا السجل خارج نطاق صلاحياتك'}), 403
 
     data = request.get_json() or {}
@@ -409,7 +429,7 @@ def delete_employee_daily_attendance(user_id, empId, date_str):
         # العثور على جميع سجلات الحضور للموظف في التاريخ المحدد
         attendance_records = Attendance.query.filter(
             Attendance.empId == empId,
-            cast(Attendance.createdAt, Date) == target_date
+            on_date(Attendance.createdAt, target_date)
         ).all()
 
         if not attendance_records:
@@ -476,7 +496,7 @@ def delete_single_attendance_period(user_id, empId, date_str, attendance_id):
         attendance_record = Attendance.query.filter(
             Attendance.id == attendance_id,
             Attendance.empId == empId,
-            cast(Attendance.createdAt, Date) == target_date
+            on_date(Attendance.createdAt, target_date)
         ).first()
 
         if not attendance_record:
@@ -536,12 +556,18 @@ def _parse_time_or_none(value, field_name):
             pass
     raise ValueError(field_name)
 
+def _parse_employee_id(value):
+    """معرف الموظف من الطلب كرقم (قد يصل نصاً) - None إذا كان فارغاً أو غير صالح"""
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
 # Check-in Attendance for Employee / Manager
 @attendance_bp.route('/api/attendances/checkin', methods=['POST'])
 @token_required
 def check_in(user):
     data = request.get_json() or {}
-    print(user.user_type)
     # صلاحيات: موظف أو مدير
     is_employee = user.user_type == 'employee'
     is_manager  = user.user_type in [
@@ -565,18 +591,12 @@ def check_in(user):
             return jsonify({'message': 'لا يوجد موظف مرتبط بهذا المستخدم'}), 400
         emp_id = user.employee_id
     else:
-        emp_id = data.get('empId')
+        emp_id = _parse_employee_id(data.get('empId'))
         if not emp_id:
             return jsonify({'message': 'Employee ID is required'}), 400
-        # تأكد أن الموظف ضمن نطاق صلاحيات المدير
-        accessible_ids = [e.id for e in user.get_accessible_employees()]
-        # if emp_id not in accessible_ids:
-        #     return jsonify({'message': 'غير مسموح: الموظف خارج نطاق صلاحياتك'}), 403
-
-    # منع تكرار تسجيل حضور لنفس اليوم
-    existing = Attendance.query.filter_by(empId=emp_id, createdAt=target_date).first()
-    if existing:
-        return jsonify({'message': 'يوجد تسجيل حضور لهذا اليوم بالفعل'}), 409
+        # تأكد أن الموظف ضمن نطاق صلاحيات المدير (EXISTS واحد بدون تحميل الموظفين)
+        if not user.can_access_employee(emp_id):
+            return jsonify({'message': 'غير مسموح: الموظف خارج نطاق صلاحياتك'}), 403
 
     # وقت الحضور (اختياري، افتراضي الآن)
     try:
@@ -589,17 +609,43 @@ def check_in(user):
     if status not in ['pending', 'approved', 'rejected']:
         return jsonify({'message': 'الحالة غير صحيحة. المسموح: pending / approved / rejected'}), 400
 
-    # إنشاء السجل
-    new_attendance = Attendance(
-        empId=emp_id,
-        createdAt=target_date,
-        checkInTime=check_in_time,
-        checkInReason=data.get('checkInReason'),
-        status=status
-    )
+    # وضع الكتابة المؤجلة: التسجيل يُحفظ في الطابور المحلي ويُنقل لاحقاً بنفس شرط عدم التكرار
+    if checkin_buffer.enabled:
+        already_exists = checkin_buffer.pending_for(emp_id, target_date) or db.session.query(
+            Attendance.query.filter_by(empId=emp_id, createdAt=target_date).exists()
+        ).scalar()
+        if already_exists:
+            return jsonify({'message': 'يوجد تسجيل حضور لهذا اليوم بالفعل'}), 409
 
+        queue_id = checkin_buffer.enqueue(emp_id, target_date, check_in_time, data.get('checkInReason'), status)
+        return jsonify({
+            'message': 'Check-in accepted',
+            'queued': True,
+            'queueId': queue_id,
+            'attendance': {
+                'id': None,
+                'empId': emp_id,
+                'date': target_date.isoformat(),
+                'checkInTime': check_in_time.isoformat(),
+                'checkOutTime': None,
+                'checkInReason': data.get('checkInReason'),
+                'checkOutReason': None,
+                'status': status
+            }
+        }), 202
+
+    # إنشاء السجل مع منع تكرار تسجيل حضور لنفس اليوم في نفس الجملة
     try:
-        db.session.add(new_attendance)
+        attendance_id = Attendance.insert_if_no_record_for_day(
+            empId=emp_id,
+            createdAt=target_date,
+            checkInTime=check_in_time,
+            checkInReason=data.get('checkInReason'),
+            status=status
+        )
+        if attendance_id is None:
+            db.session.rollback()
+            return jsonify({'message': 'يوجد تسجيل حضور لهذا اليوم بالفعل'}), 409
         db.session.commit()
     except Exception:
         db.session.rollback()
@@ -608,14 +654,14 @@ def check_in(user):
     return jsonify({
         'message': 'Check-in successful',
         'attendance': {
-            'id': new_attendance.id,
-            'empId': new_attendance.empId,
-            'date': new_attendance.createdAt.isoformat(),
-            'checkInTime': new_attendance.checkInTime.isoformat() if new_attendance.checkInTime else None,
-            'checkOutTime': new_attendance.checkOutTime.isoformat() if new_attendance.checkOutTime else None,
-            'checkInReason': new_attendance.checkInReason,
-            'checkOutReason': new_attendance.checkOutReason,
-            'status': new_attendance.status
+            'id': attendance_id,
+            'empId': emp_id,
+            'date': target_date.isoformat(),
+            'checkInTime': check_in_time.isoformat(),
+            'checkOutTime': None,
+            'checkInReason': data.get('checkInReason'),
+            'checkOutReason': None,
+            'status': status
         }
     }), 201
    
@@ -667,7 +713,7 @@ def get_attendance_by_date_range(user_id):
     except ValueError:
         return jsonify({'message': 'Invalid date format. Please use YYYY-MM-DD'}), 400
 
-    attendances = Attendance.query.filter(Attendance.createdAt >= start_date, Attendance.createdAt <= end_date).all()
+    attendances = Attendance.query.filter(date_range(Attendance.createdAt, start_date, end_date)).all()
 
     if not attendances:
         return jsonify({'message': 'No attendance records found for the given date range'}), 404
@@ -715,11 +761,11 @@ def check_out(user):
             return jsonify({'message': 'لا يوجد موظف مرتبط بهذا المستخدم'}), 400
         emp_id = user.employee_id
     else:
-        emp_id = data.get('empId')
+        emp_id = _parse_employee_id(data.get('empId'))
         if not emp_id:
             return jsonify({'message': 'Employee ID is required'}), 400
-        accessible_ids = [e.id for e in user.get_accessible_employees()]
-        if emp_id not in accessible_ids:
+        # EXISTS واحد بدون تحميل الموظفين المتاحين
+        if not user.can_access_employee(emp_id):
             return jsonify({'message': 'غير مسموح: الموظف خارج نطاق صلاحياتك'}), 403
 
     # التاريخ
@@ -730,6 +776,9 @@ def check_out(user):
         except ValueError:
             return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
 
+    # تسجيل الدخول قد يكون ما زال في طابور الكتابة المؤجلة
+    checkin_buffer.flush_employee(emp_id, target_date)
+
     # ابحث عن سجل الحضور
     att = (Attendance.query
            .filter(Attendance.empId == emp_id,
@@ -1173,7 +1222,72 @@ def fingerprint_check_out():
 
 @attendance_bp.route('/api/fingerprint/sync', methods=['POST'])
 def fingerprint_sync():
-    return sync_fingerprint_records()
+    # افتراضياً → المحرك المجمّع مع سجل البصمات الخام (إعادة إرسال نفس البصمات لا تغير شيئاً)
+    # ?async=1 → جدولة المزامنة (بالمحرك المجمّع) كمهمة خلفية وإعادة رقم المهمة فوراً
+    # ?mode=legacy → المعالجة القديمة لكل بصمة على حدة (بدون سجل البصمات)
+    if request.args.get('mode') == 'legacy':
+        return sync_fingerprint_records()
+    return sync_fingerprint_records_bulk()
+
+@job_handler('fingerprint_sync')
+def run_fingerprint_sync_job(payload):
+    """تنفيذ مهمة مزامنة البصمة في الخلفية"""
+    return FingerprintSyncController.sync_records(payload['records'])
+
+@attendance_bp.route('/api/fingerprint/sync/jobs/<job_id>', methods=['GET'])
+def fingerprint_sync_job_status(job_id):
+    """
+    حالة مهمة مزامنة البصمة فقط (للأجهزة - بدون رمز دخول)
+    النتيجة الكاملة من /api/jobs/<job_id>/result برمز دخول صاحب المهمة أو المدير
+    """
+    job_queue.sweep()
+    job = BackgroundJob.query.filter_by(id=job_id, job_type='fingerprint_sync').first()
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }), 200
+
+def sync_fingerprint_records_bulk():
+    """
+    مزامنة سجلات البصمة بالمحرك المجمّع - نفس النتائج بعدد ثابت من الاستعلامات
+    """
+    try:
+        data = request.get_json()
+
+        if not data or 'records' not in data:
+            return jsonify({
+                'status': 'error',
+                'message': 'No records provided for synchronization'
+            }), 400
+
+        records = data['records']
+
+        if not isinstance(records, list) or len(records) == 0:
+            return jsonify({
+                'status': 'error',
+                'message': 'Records must be provided as a non-empty list'
+            }), 400
+
+        if is_async_request(data):
+            job = job_queue.enqueue('fingerprint_sync', {'records': records})
+            result, status = job_accepted_response(job, f'/api/fingerprint/sync/jobs/{job.id}')
+            return jsonify(result), status
+
+        result, status = FingerprintSyncController.sync_records(records)
+        return jsonify(result), status
+
+    except Exception as e:
+        db.session.rollback()
+        error_msg = f"خطأ عام في معالجة طلب المزامنة: {str(e)}"
+        print(error_msg)
+        return jsonify({
+            'status': 'error',
+            'message': error_msg
+        }), 500
 
 def sync_fingerprint_records():
     """
@@ -1323,7 +1437,7 @@ def sync_fingerprint_records():
                     # البحث عن السجل الموجود لهذا الموظف في هذا اليوم
                     existing_attendance = Attendance.query.filter(
                         Attendance.empId == emp_id,
-                        cast(Attendance.createdAt, Date) == record_date
+                        on_date(Attendance.createdAt, record_date)
                     ).first()
                     
                     # معالجة كل بصمة على حدة
@@ -1554,11 +1668,11 @@ def check_in_by_fingerprint(fingerprint_id):
     existing_open_attendance = (
         Attendance.query.filter(
             Attendance.empId == employee.id,
-            cast(Attendance.createdAt, Date) == today,
+            on_date(Attendance.createdAt, today),
             Attendance.checkOutTime == None
         ).first()
     )
-    if existing_open_attendance:
+    if existing_open_attendance or checkin_buffer.pending_for(employee.id, today):
         return {
             'status': 'warning',
             'message': f'Employee {employee.full_name} already has an open check-in without check-out'
@@ -1566,6 +1680,23 @@ def check_in_by_fingerprint(fingerprint_id):
 
     # إنشاء تسجيل حضور جديد (من بصمة) ➜ الحالة approved
     now = datetime.now()
+    if checkin_buffer.enabled:
+        queue_id = checkin_buffer.enqueue(
+            employee.id, now.date(), now.time(), 'Fingerprint scan', 'approved', open_only=True
+        )
+        return {
+            'status': 'success',
+            'message': f'Check-in accepted for {employee.full_name}',
+            'data': {
+                'employee_id': employee.id,
+                'employee_name': employee.full_name,
+                'check_in_time': str(now.time()),
+                'attendance_id': None,
+                'queue_id': queue_id,
+                'status': 'approved'
+            }
+        }, 202
+
     attendance = Attendance(
         empId=employee.id,
         createdAt=now.date(),            # تاريخ فقط (متوافق مع عمود Date)
@@ -1604,10 +1735,11 @@ def check_out_by_fingerprint(fingerprint_id):
 
     # البحث عن آخر تسجيل حضور مفتوح لهذا الموظف اليوم
     today = date.today()
+    checkin_buffer.flush_employee(employee.id, today)
     latest_attendance = (
         Attendance.query.filter(
             Attendance.empId == employee.id,
-            cast(Attendance.createdAt, Date) == today,
+            on_date(Attendance.createdAt, today),
             Attendance.checkOutTime == None
         )
         .order_by(Attendance.createdAt.desc())
@@ -1665,72 +1797,87 @@ def get_all_attendance_summary_updated(current_user):
 
     try:
         target_date = datetime.strptime(date_str, '%Y-%m-%d')
-        start_datetime = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_datetime = start_datetime + timedelta(days=1)
-
-        # الحصول على الموظفين حسب صلاحيات المستخدم
-        accessible_employees = current_user.get_accessible_employees()
-        accessible_employee_ids = [emp.id for emp in accessible_employees]
-
-        # ✅ بناء الاستعلام مع فلترة حسب الصلاحيات والحالة
-        query = Attendance.query.filter(
-            Attendance.createdAt >= start_datetime,
-            Attendance.createdAt < end_datetime,
-            Attendance.empId.in_(accessible_employee_ids),
+
+        # ✅ بناء الاستعلام مع فلترة الحالة والفرع/القسم/الوردية في SQL
+        query = Attendance.query.join(Employee, Attendance.empId == Employee.id).filter(
+            on_date(Attendance.createdAt, target_date),
             or_(
                 Attendance.status == 'approved',
                 Attendance.status.is_(None)
-                )        
+                )
             )
-    
-        attendances = query.all()
 
-        if not attendances:
-            return jsonify({'message': 'No attendance records found for the given date'}), 200
+        # صلاحيات المستخدم كشرط على جدول الموظفين المنضم (بدون تحميل قائمة الموظفين)
+        scope_condition = current_user.get_accessible_employee_condition()
+        if scope_condition is not None:
+            query = query.filter(scope_condition)
+        scoped_query = query
 
-        result = []
+        if branch_id:
+            query = query.filter(Employee.branch_id == branch_id)
+        if department_id:
+            query = query.filter(Employee.department_id == department_id)
+        if shift_id:
+            query = query.filter(Employee.shift_id == shift_id)
 
-        for emp_id in set(att.empId for att in attendances):
-            try:
-                employee_attendances = [att for att in attendances if att.empId == emp_id]
-                employee = employee_attendances[0].employee
+        # تحميل الموظفين ومسمياتهم ومهنهم مع السجلات (بدون استعلام لكل موظف)
+        attendances = query.options(
+            contains_eager(Attendance.employee).joinedload(Employee.job_title),
+            contains_eager(Attendance.employee).joinedload(Employee.profession)
+        ).order_by(Attendance.empId, Attendance.id).all()
 
-                if not employee:
-                    print(f"Employee not found for ID: {emp_id}")
-                    continue
+        if not attendances:
+            # توجد سجلات في اليوم لكن الفلاتر استبعدتها جميعاً: قائمة فارغة كما في السابق
+            if (branch_id or department_id or shift_id) and db.session.query(scoped_query.exists()).scalar():
+                return jsonify([]), 200
+            return jsonify({'message': 'No attendance records found for the given date'}), 200
 
-                # تطبيق الفلاتر
-                if branch_id and employee.branch_id != branch_id:
-                    continue
-                if department_id and employee.department_id != department_id:
-                    continue
-                if shift_id and getattr(employee, 'shift_id', None) != shift_id:
-                    continue
+        # التجميع حسب الموظف في مرور واحد
+        grouped_attendances = {}
+        for att in attendances:
+            grouped_attendances.setdefault(att.empId, []).append(att)
 
-                # فلتر السجلات الناقصة
-                if filter_incomplete:
-                    total_checkins = sum(1 for a in employee_attendances if a.checkInTime is not None)
-                    total_checkouts = sum(1 for a in employee_attendances if a.checkOutTime is not None)
+        # الورديات المطلوبة من ذاكرة البيانات المرجعية
+        shift_ids = {group[0].employee.shift_id for group in grouped_attendances.values() if group[0].employee.shift_id}
+        shifts = reference_cache.get_many(Shift, shift_ids)
 
-                    if total_checkins == 0 or total_checkouts == 0 or total_checkins != total_checkouts:
-                        pass
-                    else:
-                        continue
+        # تقييم جميع أيام الموظفين دفعة واحدة بمحرك الحضور
+        attendance_days = evaluate_attendances(
+            attendances, _employee_weeks([group[0].employee for group in grouped_attendances.values()], shifts)
+        )
 
-                # اختيار نظام الحضور حسب work_system مع النظام المحدث
-                if employee.work_system == 'shift':
-                    attendance_summary = process_shift_attendance_updated(employee, employee_attendances, target_date.date())
-                else:
-                    attendance_summary = process_hours_attendance(employee, employee_attendances, date_str)
+        def generate_summaries():
+            for emp_id, employee_attendances in grouped_attendances.items():
+                try:
+                    employee = employee_attendances[0].employee
+
+                    # فلتر السجلات الناقصة
+                    if filter_incomplete:
+                        total_checkins = sum(1 for a in employee_attendances if a.checkInTime is not None)
+                        total_checkouts = sum(1 for a in employee_attendances if a.checkOutTime is not None)
+
+                        if not (total_checkins == 0 or total_checkouts == 0 or total_checkins != total_checkouts):
+                            continue
+
+                    # اختيار نظام الحضور حسب work_system مع النظام المحدث
+                    day = attendance_days.get((emp_id, target_date.date()))
+                    if employee.work_system == 'shift':
+                        attendance_summary = process_shift_attendance_updated(
+                            employee, employee_attendances, target_date.date(),
+                            shift=shifts.get(employee.shift_id), day=day
+                        )
+                    else:
+                        attendance_summary = process_hours_attendance(employee, employee_attendances, date_str, day=day)
 
-                if attendance_summary:
-                    result.append(attendance_summary)
+                    if attendance_summary:
+                        yield attendance_summary
 
-            except Exception as emp_error:
-                print(f"Error processing employee {emp_id}: {str(emp_error)}")
-                continue
+                except Exception as emp_error:
+                    print(f"Error processing employee {emp_id}: {str(emp_error)}")
+                    continue
 
-        return jsonify(result), 200
+        # إرسال النتائج كدفق بدلاً من بناء القائمة كاملة في الذاكرة
+        return stream_json_array(generate_summaries())
 
     except ValueError:
         return jsonify({'message': 'Invalid date format. Please use YYYY-MM-DD'}), 400
@@ -1740,11 +1887,51 @@ def get_all_attendance_summary_updated(current_user):
 
 
 
+# الحد الأقصى لحجم صفحة السجلات الخام
+RAW_ATTENDANCES_MAX_PAGE_SIZE = 5000
+
+
+def _raw_attendance_cursor(row):
+    """مؤشر الصفحة التالية: تاريخ السجل، وقت الدخول، المعرف"""
+    check_in = row.Attendance.checkInTime.isoformat() if row.Attendance.checkInTime else ''
+    return f'{row.Attendance.createdAt.isoformat()},{check_in},{row.Attendance.id}'
+
+
+def _serialize_raw_attendance(row):
+    attendance = row.Attendance
+    return {
+        'id': attendance.id,
+        'empId': attendance.empId,
+        'createdAt': attendance.createdAt.isoformat(),
+        'checkInTime': attendance.checkInTime.isoformat() if attendance.checkInTime else None,
+        'checkOutTime': attendance.checkOutTime.isoformat() if attendance.checkOutTime else None,
+        'checkInReason': attendance.checkInReason,
+        'checkOutReason': attendance.checkOutReason,
+        'productionQuantity': float(attendance.productionQuantity) if attendance.productionQuantity else None,
+        'status': attendance.status if attendance.status is not None else 'approved',
+        'employee': {
+            'id': row.employee_id,
+            'full_name': row.full_name,
+            'fingerprint_id': row.fingerprint_id,
+            'employee_type': row.employee_type,
+            'work_system': row.work_system,
+            'position': row.position,
+            'branch_name': row.branch_name,
+            'department_name': row.department_name,
+            'shift_name': row.shift_name
+        } if row.employee_id is not None else None
+    }
+
+
 @attendance_bp.route('/api/attendances/raw', methods=['GET'])
 @token_required
 def get_raw_attendances(current_user):
     """
-    جلب السجلات الخام مع الفلاتر - بدون معالجة أو دمج (بدون pagination)
+    جلب السجلات الخام مع الفلاتر - بدون معالجة أو دمج
+    - ?limit=500&cursor=... : ترقيم بالمؤشر (keyset) بنفس ترتيب النتائج
+    - ?format=ndjson : إرسال السجلات سطراً بسطر (application/x-ndjson) بدون بناء الرد في الذاكرة
+      مع limit تُرسل بيانات الترقيم في الترويسات: X-Next-Cursor (غائبة في الصفحة الأخيرة) و X-Has-Next (true/false)
+    بدون limit/cursor تُعاد جميع السجلات كما في السابق
     """
     try:
         # المعاملات
@@ -1760,34 +1947,57 @@ def get_raw_attendances(current_user):
         # ✅ معامل جديد لاستثناء pending
         exclude_pending = request.args.get('exclude_pending', type=bool, default=True)
 
-        # الموظفون ضمن صلاحيات المستخدم
-        user = User.query.get(current_user.id)
-        accessible_employees = user.get_accessible_employees()
-        accessible_employee_ids = [emp.id for emp in accessible_employees]
-
-        # الاستعلام الأساسي
-        query = Attendance.query.filter(Attendance.empId.in_(accessible_employee_ids))
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        paginated = limit is not None or cursor is not None
+        ndjson = request.args.get('format', '').lower() == 'ndjson' or \
+            'application/x-ndjson' in request.headers.get('Accept', '')
+
+        if paginated:
+            limit = min(max(limit or 500, 1), RAW_ATTENDANCES_MAX_PAGE_SIZE)
+
+        # الاستعلام الأساسي: السجل مع بيانات الموظف والفرع والقسم والوردية في استعلام واحد
+        query = db.session.query(
+            Attendance,
+            Employee.id.label('employee_id'),
+            Employee.full_name,
+            Employee.fingerprint_id,
+            Employee.employee_type,
+            Employee.work_system,
+            Employee.position,
+            Branch.name.label('branch_name'),
+            Department.name.label('department_name'),
+            Shift.name.label('shift_name')
+        ).outerjoin(
+            Employee, Attendance.empId == Employee.id
+        ).outerjoin(
+            Branch, Employee.branch_id == Branch.id
+        ).outerjoin(
+            Department, Employee.department_id == Department.id
+        ).outerjoin(
+            Shift, Employee.shift_id == Shift.id
+        ).filter(
+            Attendance.empId.in_(current_user.accessible_employee_ids_subquery())
+        )
 
         # فلاتر التاريخ
         if start_date:
             start_datetime = datetime.strptime(start_date, '%Y-%m-%d').date()
-            query = query.filter(Attendance.createdAt >= start_datetime)
+            query = query.filter(date_range(Attendance.createdAt, start=start_datetime))
 
         if end_date:
             end_datetime = datetime.strptime(end_date, '%Y-%m-%d').date()
-            query = query.filter(Attendance.createdAt <= end_datetime)
+            query = query.filter(date_range(Attendance.createdAt, end=end_datetime))
 
         # فلاتر خصائص الموظف
-        if branch_id or department_id or shift_id or employee_id:
-            query = query.join(Employee, Attendance.empId == Employee.id)
-            if branch_id:
-                query = query.filter(Employee.branch_id == branch_id)
-            if department_id:
-                query = query.filter(Employee.department_id == department_id)
-            if shift_id:
-                query = query.filter(Employee.shift_id == shift_id)
-            if employee_id:
-                query = query.filter(Employee.id == employee_id)
+        if branch_id:
+            query = query.filter(Employee.branch_id == branch_id)
+        if department_id:
+            query = query.filter(Employee.department_id == department_id)
+        if shift_id:
+            query = query.filter(Employee.shift_id == shift_id)
+        if employee_id:
+            query = query.filter(Employee.id == employee_id)
 
         # فلتر السجلات بدون خروج
         if no_checkout:
@@ -1816,44 +2026,57 @@ def get_raw_attendances(current_user):
             elif status_filter in ('pending', 'rejected'):
                 query = query.filter(Attendance.status == status_filter)
 
-        # ترتيب النتائج
-        attendances = query.order_by(Attendance.createdAt.desc(),
-                                     Attendance.checkInTime.desc()).all()
+        # ترتيب النتائج (وقت الدخول الفارغ يأتي آخر اليوم، والمعرف لتثبيت الترتيب بين الصفحات)
+        check_in_order = func.coalesce(Attendance.checkInTime, time.min)
+        if cursor:
+            try:
+                cursor_date, cursor_time, cursor_id = cursor.split(',')
+                cursor_date = datetime.strptime(cursor_date, '%Y-%m-%d').date()
+                cursor_time = time.fromisoformat(cursor_time) if cursor_time else time.min
+                cursor_id = int(cursor_id)
+            except ValueError:
+                return jsonify({'status': 'error', 'message': 'مؤشر الصفحة غير صالح'}), 400
+
+            query = query.filter(or_(
+                Attendance.createdAt < cursor_date,
+                db.and_(Attendance.createdAt == cursor_date, check_in_order < cursor_time),
+                db.and_(Attendance.createdAt == cursor_date, check_in_order == cursor_time, Attendance.id < cursor_id)
+            ))
+
+        query = query.order_by(Attendance.createdAt.desc(), check_in_order.desc(), Attendance.id.desc())
+
+        if paginated:
+            rows = query.limit(limit + 1).all()
+            has_next = len(rows) > limit
+            rows = rows[:limit]
+            next_cursor = _raw_attendance_cursor(rows[-1]) if has_next and rows else None
+
+            if ndjson:
+                response = stream_ndjson(_serialize_raw_attendance(row) for row in rows)
+                if next_cursor:
+                    response.headers['X-Next-Cursor'] = next_cursor
+                response.headers['X-Has-Next'] = 'true' if has_next else 'false'
+                response.headers['Access-Control-Expose-Headers'] = 'X-Next-Cursor, X-Has-Next'
+                return response
 
-        # تحضير الخرج
-        result = []
-        for attendance in attendances:
-            employee = Employee.query.get(attendance.empId)
-
-            attendance_data = {
-                'id': attendance.id,
-                'empId': attendance.empId,
-                'createdAt': attendance.createdAt.isoformat(),
-                'checkInTime': attendance.checkInTime.isoformat() if attendance.checkInTime else None,
-                'checkOutTime': attendance.checkOutTime.isoformat() if attendance.checkOutTime else None,
-                'checkInReason': attendance.checkInReason,
-                'checkOutReason': attendance.checkOutReason,
-                'productionQuantity': float(attendance.productionQuantity) if attendance.productionQuantity else None,
-                'status': attendance.status if attendance.status is not None else 'approved',
-                'employee': {
-                    'id': employee.id,
-                    'full_name': employee.full_name,
-                    'fingerprint_id': employee.fingerprint_id,
-                    'employee_type': employee.employee_type,
-                    'work_system': employee.work_system,
-                    'position': employee.position,
-                    'branch_name': employee.branch.name if employee.branch else None,
-                    'department_name': employee.department.name if employee.department else None,
-                    'shift_name': None
-                } if employee else None
-            }
+            return jsonify({
+                'status': 'success',
+                'data': [_serialize_raw_attendance(row) for row in rows],
+                'total': len(rows),
+                'pagination': {
+                    'cursor': cursor,
+                    'limit': limit,
+                    'next_cursor': next_cursor,
+                    'has_next': has_next
+                },
+                'message': f'تم جلب {len(rows)} سجل'
+            }), 200
 
-            if employee and employee.shift_id:
-                shift = Shift.query.get(employee.shift_id)
-                if shift:
-                    attendance_data['employee']['shift_name'] = shift.name
+        if ndjson:
+            # القراءة من قاعدة البيانات على دفعات أثناء الإرسال
+            return stream_ndjson(_serialize_raw_attendance(row) for row in query.yield_per(1000))
 
-            result.append(attendance_data)
+        result = [_serialize_raw_attendance(row) for row in query.all()]
 
         return jsonify({
             'status': 'success',
@@ -1972,26 +2195,45 @@ def get_raw_attendance_stats(current_user):
         start_datetime = datetime.strptime(start_date, '%Y-%m-%d').date()
         end_datetime = datetime.strptime(end_date, '%Y-%m-%d').date()
 
-        # الحصول على الموظفين المسموح للمستخدم برؤيتهم
-        user = User.query.get(current_user.id)
-        accessible_employees = user.get_accessible_employees()
-        accessible_employee_ids = [emp.id for emp in accessible_employees]
-
-        # الاستعلام الأساسي
-        base_query = Attendance.query.filter(
-            Attendance.empId.in_(accessible_employee_ids),
-            Attendance.createdAt >= start_datetime,
-            Attendance.createdAt <= end_datetime
-        )
+        # جميع الإحصائيات باستعلام GROUP BY واحد حسب اليوم والحالة
+        # COUNT(عمود) يعد القيم غير الفارغة فقط
+        rows = db.session.query(
+            Attendance.createdAt,
+            Attendance.status,
+            func.count(Attendance.id),
+            func.count(Attendance.checkInTime),
+            func.count(Attendance.checkOutTime),
+            func.sum(db.case(
+                (db.and_(Attendance.checkInTime.isnot(None), Attendance.checkOutTime.is_(None)), 1),
+                else_=0
+            ))
+        ).filter(
+            Attendance.empId.in_(current_user.accessible_employee_ids_subquery()),
+            date_range(Attendance.createdAt, start_datetime, end_datetime)
+        ).group_by(
+            Attendance.createdAt,
+            Attendance.status
+        ).all()
 
-        # حساب الإحصائيات
-        total_records = base_query.count()
-        records_with_checkin = base_query.filter(Attendance.checkInTime.isnot(None)).count()
-        records_with_checkout = base_query.filter(Attendance.checkOutTime.isnot(None)).count()
-        incomplete_records = base_query.filter(
-            Attendance.checkInTime.isnot(None),
-            Attendance.checkOutTime.is_(None)
-        ).count()
+        total_records = 0
+        records_with_checkin = 0
+        records_with_checkout = 0
+        incomplete_records = 0
+        by_status = {}
+        by_date = {}
+        for created_at, status, count, checkin_count, checkout_count, incomplete_count in rows:
+            incomplete_count = int(incomplete_count or 0)
+            total_records += count
+            records_with_checkin += checkin_count
+            records_with_checkout += checkout_count
+            incomplete_records += incomplete_count
+
+            status = status if status is not None else 'approved'
+            by_status[status] = by_status.get(status, 0) + count
+
+            day = by_date.setdefault(created_at.isoformat(), {'total_records': 0, 'incomplete_records': 0})
+            day['total_records'] += count
+            day['incomplete_records'] += incomplete_count
 
         return jsonify({
             'status': 'success',
@@ -2000,6 +2242,8 @@ def get_raw_attendance_stats(current_user):
                 'records_with_checkin': records_with_checkin,
                 'records_with_checkout': records_with_checkout,
                 'incomplete_records': incomplete_records,
+                'by_status': by_status,
+                'by_date': dict(sorted(by_date.items())),
                 'period': f'{start_date} إلى {end_date}'
             }
         }), 200
@@ -2031,7 +2275,7 @@ def filter_employees_by_status_updated(user_id):
     for employee in employees:
         attendance = Attendance.query.filter(
             Attendance.empId == employee.id,
-            cast(Attendance.createdAt, Date) == target_date
+            on_date(Attendance.createdAt, target_date)
         ).first()
 
         check_in_time = None
@@ -2041,7 +2285,7 @@ def filter_employees_by_status_updated(user_id):
             check_in_time = str(attendance.checkInTime)
 
             if employee.work_system == 'shift':
-                shift = Shift.query.get(employee.shift_id)
+                shift = reference_cache.get(Shift, employee.shift_id)
                 if shift:
                     # استخدام النظام الجديد للحصول على أوقات الوردية
                     is_working_day, shift_start_time, shift_end_time = get_shift_schedule_for_date(shift, target_date)
@@ -2064,7 +2308,7 @@ def filter_employees_by_status_updated(user_id):
         else:
             # التحقق من كون اليوم يوم إجازة
             if employee.work_system == 'shift' and employee.shift_id:
-                shift = Shift.query.get(employee.shift_id)
+                shift = reference_cache.get(Shift, employee.shift_id)
                 if shift:
                     is_working_day, _, _ = get_shift_schedule_for_date(shift, target_date)
                     if not is_working_day:
@@ -2145,10 +2389,7 @@ def get_employee_monthly_attendance_report(user, employee_id):
             }), 404
 
         # التحقق من صلاحية المستخدم لرؤية بيانات هذا الموظف
-        accessible_employees = current_user.get_accessible_employees()
-        accessible_employee_ids = [emp.id for emp in accessible_employees]
-
-        if employee_id not in accessible_employee_ids:
+        if not current_user.can_access_employee(employee_id):
             return jsonify({
                 'status': 'error',
                 'message': 'ليس لديك صلاحية لرؤية بيانات هذا الموظف'
@@ -2160,8 +2401,7 @@ def get_employee_monthly_attendance_report(user, employee_id):
 
         attendances = Attendance.query.filter(
             Attendance.empId == employee_id,
-            Attendance.createdAt >= start_datetime,
-            Attendance.createdAt <= end_datetime
+            date_range(Attendance.createdAt, start_datetime, end_datetime)
         ).order_by(Attendance.createdAt).all()
 
         # تجميع سجلات الحضور حسب التاريخ
@@ -2183,7 +2423,8 @@ def get_employee_monthly_attendance_report(user, employee_id):
             employee, 
             start_date, 
             end_date, 
-            attendance_by_date
+            attendance_by_date,
+            calendar=AttendanceCalendar(start_date, end_date, [employee.id])
         )
 
         if not employee_report:
@@ -2243,7 +2484,7 @@ def get_employee_monthly_attendance_report(user, employee_id):
 
 def process_shift_attendance(employee, employee_attendances, date_str):
     """معالجة حضور الموظف في نظام الورديات"""
-    shift = Shift.query.filter_by(id=employee.shift_id).first()
+    shift = reference_cache.get(Shift, employee.shift_id)
     if not shift:
         return None
 
@@ -2291,7 +2532,7 @@ def process_shift_attendance(employee, employee_attendances, date_str):
         total_break_time, employee_attendances
     )
 
-def process_hours_attendance(employee, employee_attendances, date_str):
+def process_hours_attendance(employee, employee_attendances, date_str, day=None):
     """معالجة حضور الموظف في نظام الساعات"""
     first_check_in = min(att.checkInTime for att in employee_attendances)
     last_check_out = max(
@@ -2300,7 +2541,7 @@ def process_hours_attendance(employee, employee_attendances, date_str):
     )
 
     # في نظام الساعات، نعتبر كل تسجيل دخول وخروج كفترة عمل منفصلة
-    total_work_time, total_break_time = calculate_work_and_break_time(employee_attendances)
+    total_work_time, total_break_time = calculate_work_and_break_time(employee_attendances, day)
 
     # لا نحتاج لحساب التأخير في نظام الساعات
     check_in_status = "Recorded"
@@ -2312,27 +2553,28 @@ def process_hours_attendance(employee, employee_attendances, date_str):
         total_break_time, employee_attendances
     )
 
-def calculate_work_and_break_time(employee_attendances):
-    """حساب إجمالي وقت العمل والاستراحة"""
-    total_work_time = timedelta()
-    total_break_time = timedelta()
-
-    # حساب وقت العمل
-    for attendance in employee_attendances:
-        if attendance.checkInTime and attendance.checkOutTime:
-            work_time_seconds = time_to_seconds(attendance.checkOutTime) - time_to_seconds(attendance.checkInTime)
-            total_work_time += timedelta(seconds=work_time_seconds)
-
-    # حساب وقت الاستراحة بين الفترات
-    for i in range(1, len(employee_attendances)):
-        if employee_attendances[i].checkInTime and employee_attendances[i - 1].checkOutTime:
-            break_time_seconds = (
-                time_to_seconds(employee_attendances[i].checkInTime) -
-                time_to_seconds(employee_attendances[i - 1].checkOutTime)
-            )
-            total_break_time += timedelta(seconds=break_time_seconds)
+def _employee_weeks(employees, shifts):
+    """جداول الأسبوع لموظفي نظام الورديات {employee_id: shift_week} - تُجمّع مرة واحدة لكل وردية"""
+    shift_weeks = {shift_id: shift_week(shift) for shift_id, shift in shifts.items()}
+    return {
+        employee.id: shift_weeks[employee.shift_id]
+        for employee in employees
+        if employee.work_system == 'shift' and employee.shift_id in shift_weeks
+    }
+
 
-    return total_work_time, total_break_time
+def evaluate_employee_day(employee_attendances, shift=None):
+    """نتيجة محرك الحضور لسجلات يوم واحد لموظف واحد (بدون وردية: يوم بدون جدول)"""
+    weeks = {employee_attendances[0].empId: shift_week(shift)} if shift else {}
+    days = evaluate_attendances(employee_attendances, weeks)
+    return next(iter(days.values()))
+
+
+def calculate_work_and_break_time(employee_attendances, day=None):
+    """حساب إجمالي وقت العمل والاستراحة من نتيجة محرك الحضور"""
+    if day is None:
+        day = evaluate_employee_day(employee_attendances)
+    return timedelta(seconds=day['worked']), timedelta(seconds=day['break_time'])
 
 
 def format_attendance_summary(employee, date_str, check_in_time, check_in_status,
@@ -2422,13 +2664,6 @@ def format_attendance_summary(employee, date_str, check_in_time, check_in_status
         'lastCheckOut': str(check_out_time) if check_out_time else None
     }
 
-def time_to_seconds(t):
-    """Convert a time object to seconds since midnight."""
-    if t is None:
-        return 0
-    return t.hour * 3600 + t.minute * 60 + t.second
-
-
 # تقارير الحضور الشهرية
 @attendance_bp.route('/api/attendances/monthly-report', methods=['GET'])
 @token_required
@@ -2484,20 +2719,19 @@ def get_monthly_attendance_report(user):
         if not user:
             return jsonify({'status': 'error', 'message': 'المستخدم غير موجود'}), 404
 
-        # جلب الموظفين المسموح للمستخدم برؤيتهم
-        accessible_employees = user.get_accessible_employees()
-        
-        # تطبيق الفلاتر على الموظفين
-        employees_query = accessible_employees
+        # جلب الموظفين المسموح للمستخدم برؤيتهم مع تطبيق الفلاتر في SQL
+        employees_query = user.accessible_employees_query()
         
         if employee_id:
-            employees_query = [emp for emp in employees_query if emp.id == employee_id]
+            employees_query = employees_query.filter(Employee.id == employee_id)
         if branch_id:
-            employees_query = [emp for emp in employees_query if emp.branch_id == branch_id]
+            employees_query = employees_query.filter(Employee.branch_id == branch_id)
         if department_id:
-            employees_query = [emp for emp in employees_query if emp.department_id == department_id]
+            employees_query = employees_query.filter(Employee.department_id == department_id)
         if shift_id:
-            employees_query = [emp for emp in employees_query if getattr(emp, 'shift_id', None) == shift_id]
+            employees_query = employees_query.filter(Employee.shift_id == shift_id)
+
+        employees_query = employees_query.all()
 
         if not employees_query:
             return jsonify({
@@ -2517,8 +2751,7 @@ def get_monthly_attendance_report(user):
         
         attendances = Attendance.query.filter(
             Attendance.empId.in_(employee_ids),
-            Attendance.createdAt >= start_datetime,
-            Attendance.createdAt <= end_datetime
+            date_range(Attendance.createdAt, start_datetime, end_datetime)
         ).order_by(Attendance.createdAt).all()
 
         # تجميع سجلات الحضور حسب الموظف والتاريخ
@@ -2538,6 +2771,16 @@ def get_monthly_attendance_report(user):
             
             attendance_by_employee[emp_id][attendance_date].append(attendance)
 
+        # فهرس العطل والإجازات للفترة (استعلامان بدلاً من استعلامات لكل موظف ولكل يوم)
+        calendar = AttendanceCalendar(start_date, end_date, employee_ids)
+
+        # الورديات المطلوبة من ذاكرة البيانات المرجعية
+        shift_ids = {emp.shift_id for emp in employees_query if emp.shift_id}
+        shifts = reference_cache.get_many(Shift, shift_ids)
+
+        # تقييم أيام جميع الموظفين للفترة دفعة واحدة بمحرك الحضور
+        attendance_days = evaluate_attendances(attendances, _employee_weeks(employees_query, shifts))
+
         # إعداد التقرير النهائي
         report_data = []
         overall_summary = {
@@ -2560,7 +2803,10 @@ def get_monthly_attendance_report(user):
                 employee, 
                 start_date, 
                 end_date, 
-                attendance_by_employee.get(employee.id, {})
+                attendance_by_employee.get(employee.id, {}),
+                calendar=calendar,
+                shifts=shifts,
+                attendance_days=attendance_days
             )
             
             if employee_report:
@@ -2603,13 +2849,26 @@ def get_monthly_attendance_report(user):
 
 
 
-def generate_comprehensive_employee_report_updated(employee, start_date, end_date, employee_attendances):
-    """إنشاء تقرير مفصل وشامل لموظف واحد مع النظام المحدث ودعم العطل"""
+def generate_comprehensive_employee_report_updated(employee, start_date, end_date, employee_attendances,
+                                                  calendar=None, shifts=None, attendance_days=None):
+    """
+    إنشاء تقرير مفصل وشامل لموظف واحد مع النظام المحدث ودعم العطل
+    calendar: فهرس العطل والإجازات للفترة (AttendanceCalendar) - اختياري
+    shifts: قاموس الورديات المحملة مسبقاً {shift_id: Shift} - اختياري
+    attendance_days: نتائج محرك الحضور للفترة {(employee_id, date): day} - اختياري
+    """
     try:
         # جلب بيانات الوردية
         shift = None
         if employee.work_system == 'shift' and employee.shift_id:
-            shift = Shift.query.get(employee.shift_id)
+            shift = shifts.get(employee.shift_id) if shifts is not None else reference_cache.get(Shift, employee.shift_id)
+
+        # تقييم كل أيام الفترة للموظف دفعة واحدة إذا لم تُحسب مسبقاً
+        if attendance_days is None:
+            attendance_days = evaluate_attendances(
+                [attendance for records in employee_attendances.values() for attendance in records],
+                {employee.id: shift_week(shift)} if shift else {}
+            )
 
         # حساب عدد الأيام في الفترة
         current_date = start_date
@@ -2636,12 +2895,13 @@ def generate_comprehensive_employee_report_updated(employee, start_date, end_dat
             day_attendances = employee_attendances.get(current_date, [])
             
             # تحديد ما إذا كان اليوم يوم إجازة للموظف باستخدام النظام المحدث
-            is_vacation_day, holiday_info = is_employee_vacation_day_updated(employee, current_date, shift)
+            is_vacation_day, holiday_info = is_employee_vacation_day_updated(employee, current_date, shift, calendar)
             
             if day_attendances:
                 # الموظف سجل حضور
                 daily_record = process_comprehensive_daily_attendance_updated(
-                    employee, current_date, day_attendances, shift, is_vacation_day, holiday_info
+                    employee, current_date, day_attendances, shift, is_vacation_day, holiday_info, calendar,
+                    day=attendance_days.get((employee.id, current_date))
                 )
                 
                 if holiday_info:
@@ -2741,39 +3001,28 @@ def generate_comprehensive_employee_report_updated(employee, start_date, end_dat
         
 
 
-def process_comprehensive_daily_attendance_updated(employee, date, day_attendances, shift, is_vacation_day, holiday_info=None):
-    """معالجة شاملة لحضور يوم واحد للموظف مع النظام المحدث ودعم العطل والإجازات المعتمدة"""
+def process_comprehensive_daily_attendance_updated(employee, date, day_attendances, shift, is_vacation_day, holiday_info=None,
+                                                  calendar=None, day=None):
+    """
+    معالجة شاملة لحضور يوم واحد للموظف مع النظام المحدث ودعم العطل والإجازات المعتمدة
+    الساعات والتأخير والإضافي تُقرأ من نتيجة محرك الحضور (day) - نفس قيم الرواتب
+    """
     try:
         # ترتيب سجلات اليوم حسب الوقت
         day_attendances.sort(key=lambda x: x.createdAt)
-       
+
+        if day is None:
+            day = evaluate_employee_day(day_attendances, shift if employee.work_system == 'shift' else None)
+
         # الحصول على أول دخول وآخر خروج
-        first_check_in = None
-        last_check_out = None
-       
-        for attendance in day_attendances:
-            if attendance.checkInTime:
-                if not first_check_in:
-                    first_check_in = attendance.checkInTime
-            if attendance.checkOutTime:
-                last_check_out = attendance.checkOutTime
+        first_check_in = min((att.checkInTime for att in day_attendances if att.checkInTime), default=None)
+        last_check_out = max((att.checkOutTime for att in day_attendances if att.checkOutTime), default=None)
+
         # الحصول على معلومات الإجازات الساعية المعتمدة لهذا اليوم
-        leave_hours, leave_details = get_leave_hours_for_day(employee, date)
-        # حساب إجمالي ساعات العمل من الدخول للخروج
-        total_actual_work_hours = 0
-        if first_check_in and last_check_out:
-            start_datetime = datetime.combine(date, first_check_in)
-            end_datetime = datetime.combine(date, last_check_out)
-            work_duration = end_datetime - start_datetime
-            total_actual_work_hours = work_duration.total_seconds() / 3600
-        # حساب ساعات العمل الفعلية (مجموع فترات العمل)
-        actual_work_periods_hours = 0
-        for attendance in day_attendances:
-            if attendance.checkInTime and attendance.checkOutTime:
-                period_start = datetime.combine(date, attendance.checkInTime)
-                period_end = datetime.combine(date, attendance.checkOutTime)
-                period_duration = period_end - period_start
-                actual_work_periods_hours += period_duration.total_seconds() / 3600
+        leave_hours, leave_details = get_leave_hours_for_day(employee, date, calendar)
+        # إجمالي ساعات العمل من الدخول للخروج، وساعات العمل الفعلية (مجموع فترات العمل)
+        total_actual_work_hours = day['span'] / 3600
+        actual_work_periods_hours = day['worked'] / 3600
         # متغيرات التحليل
         is_late = False
         is_early_leave = False
@@ -2790,54 +3039,27 @@ def process_comprehensive_daily_attendance_updated(employee, date, day_attendanc
             work_hours_inside_shift = actual_work_periods_hours
         elif shift and employee.work_system == 'shift':
             # تحليل بناءً على الوردية المحدثة
-            is_working_day, shift_start_time, shift_end_time = get_shift_schedule_for_date(shift, date)
-           
-            if is_working_day and shift_start_time and shift_end_time:
-                required_work_hours = calculate_shift_duration_for_date(shift, date)
-               
-                # طرح ساعات الإجازة المعتمدة من الساعات المطلوبة
-                adjusted_required_hours = max(0, required_work_hours - leave_hours)
-               
-                # تحليل التأخير (مع مراعاة الإجازات الساعية)
-                if first_check_in:
-                    expected_start = datetime.combine(date, shift_start_time)
-                    actual_start = datetime.combine(date, first_check_in)
-                    allowed_delay = timedelta(minutes=shift.allowed_delay_minutes)
-                   
-                    # التحقق من وجود إجازة ساعية تغطي وقت التأخير
-                    is_on_leave, leave_info = is_employee_on_hourly_leave(employee, date, first_check_in)
-                   
-                    if not is_on_leave and actual_start > expected_start + allowed_delay:
+            if day['is_working']:
+                _, shift_start_time, shift_end_time = get_shift_schedule_for_date(shift, date)
+                required_work_hours = day['scheduled'] / 3600
+
+                # تحليل التأخير (مع مراعاة الإجازات الساعية التي تغطي وقت الدخول)
+                if day['late']:
+                    is_on_leave, leave_info = is_employee_on_hourly_leave(employee, date, first_check_in, calendar)
+                    if not is_on_leave:
                         is_late = True
-                        late_hours = (actual_start - expected_start).total_seconds() / 3600
-                # تحليل الخروج المبكر والإضافي
-                if last_check_out:
-                    expected_end = datetime.combine(date, shift_end_time)
-                    actual_end = datetime.combine(date, last_check_out)
-                    allowed_early = timedelta(minutes=shift.allowed_exit_minutes)
-                   
-                    if actual_end < expected_end - allowed_early:
-                        # التحقق من وجود إجازة ساعية تغطي وقت الخروج المبكر
-                        is_on_leave, leave_info = is_employee_on_hourly_leave(employee, date, last_check_out)
-                       
-                        if not is_on_leave:
-                            is_early_leave = True
-                            early_leave_hours = (expected_end - actual_end).total_seconds() / 3600
-                    overtime_hours = max(0, total_actual_work_hours - required_work_hours)
+                        late_hours = day['late'] / 3600
+                # تحليل الخروج المبكر (مع مراعاة الإجازات الساعية التي تغطي وقت الخروج)
+                if day['early']:
+                    is_on_leave, leave_info = is_employee_on_hourly_leave(employee, date, last_check_out, calendar)
+                    if not is_on_leave:
+                        is_early_leave = True
+                        early_leave_hours = day['early'] / 3600
+                # الإضافي: العمل الفعلي + الإجازة المعتمدة الزائد عن مدة الوردية (نفس قاعدة الرواتب)
+                overtime_hours = overtime_seconds(day, leave_hours * 3600) / 3600
                 # حساب ساعات العمل داخل الوردية (مع مراعاة الإجازات)
-                if first_check_in and last_check_out:
-                    shift_start_dt = datetime.combine(date, shift_start_time)
-                    shift_end_dt = datetime.combine(date, shift_end_time)
-                    actual_start_dt = datetime.combine(date, first_check_in)
-                    actual_end_dt = datetime.combine(date, last_check_out)
-                   
-                    effective_start = max(actual_start_dt, shift_start_dt)
-                    effective_end = min(actual_end_dt, shift_end_dt)
-                   
-                    if effective_end > effective_start:
-                        work_hours_inside_shift = (effective_end - effective_start).total_seconds() / 3600
-                        # إضافة ساعات الإجازة المعتمدة للعمل داخل الوردية
-                        work_hours_inside_shift += leave_hours
+                if day['inside_shift'] > 0:
+                    work_hours_inside_shift = day['inside_shift'] / 3600 + leave_hours
         else:
             # في حالة عدم وجود وردية أو نظام ساعات
             work_hours_inside_shift = actual_work_periods_hours + leave_hours
@@ -3029,24 +3251,44 @@ def get_arabic_day_name(date):
     return arabic_days.get(date.weekday(), 'غير محدد')
 
 
-def is_employee_on_leave_updated(employee, target_date, shift):
+def get_employee_holiday_for_date(employee, target_date, calendar=None):
     """
-    تحديد ما إذا كان الموظف في إجازة في التاريخ المحدد
-    يدعم الإجازات المعتمدة من نظام المعاملات
+    العطلة الرسمية للموظف في التاريخ المحدد
+    من فهرس التقويم إذا توفر، وإلا من قاعدة البيانات
     """
-    # أولاً: التحقق من العطل الرسمية
-    holiday = Holiday.is_holiday(
-        target_date, 
+    if calendar is not None:
+        return calendar.get_employee_holiday(employee, target_date)
+
+    return Holiday.is_holiday(
+        target_date,
         employee.branch_id if hasattr(employee, 'branch_id') else None,
         employee.department_id if hasattr(employee, 'department_id') else None
     )
+
+def get_employee_leaves_for_date(employee, target_date, calendar=None):
+    """
+    الإجازات النشطة للموظف في التاريخ المحدد
+    من فهرس التقويم إذا توفر، وإلا من قاعدة البيانات
+    """
+    if calendar is not None:
+        return calendar.get_leaves(employee.id, target_date)
+
+    from app.models.leave import Leave
+    return Leave.get_employee_leaves_for_date(employee.id, target_date)
+
+def is_employee_on_leave_updated(employee, target_date, shift, calendar=None):
+    """
+    تحديد ما إذا كان الموظف في إجازة في التاريخ المحدد
+    يدعم الإجازات المعتمدة من نظام المعاملات
+    """
+    # أولاً: التحقق من العطل الرسمية
+    holiday = get_employee_holiday_for_date(employee, target_date, calendar)
     
     if holiday:
         return True, holiday, 'holiday'  # إرجاع نوع الإجازة أيضاً
     
     # ثانياً: التحقق من الإجازات المعتمدة
-    from app.models.leave import Leave
-    leaves = Leave.get_employee_leaves_for_date(employee.id, target_date)
+    leaves = get_employee_leaves_for_date(employee, target_date, calendar)
     
     for leave in leaves:
         if leave.is_date_covered_by_leave(target_date):
@@ -3063,12 +3305,11 @@ def is_employee_on_leave_updated(employee, target_date, shift):
     is_working_day, _, _ = get_shift_schedule_for_date(shift, target_date)
     return not is_working_day, None, 'shift_off'
 
-def is_employee_on_hourly_leave(employee, target_date, check_time):
+def is_employee_on_hourly_leave(employee, target_date, check_time, calendar=None):
     """
     فحص ما إذا كان الموظف في إجازة ساعية في الوقت المحدد
     """
-    from app.models.leave import Leave
-    leaves = Leave.get_employee_leaves_for_date(employee.id, target_date)
+    leaves = get_employee_leaves_for_date(employee, target_date, calendar)
     
     for leave in leaves:
         if leave.leave_type == 'hourly_leave' and leave.is_time_covered_by_leave(target_date, check_time):
@@ -3076,12 +3317,11 @@ def is_employee_on_hourly_leave(employee, target_date, check_time):
     
     return False, None
 
-def get_leave_hours_for_day(employee, target_date):
+def get_leave_hours_for_day(employee, target_date, calendar=None):
     """
     الحصول على عدد ساعات الإجازة المعتمدة للموظف في يوم محدد
     """
-    from app.models.leave import Leave
-    leaves = Leave.get_employee_leaves_for_date(employee.id, target_date)
+    leaves = get_employee_leaves_for_date(employee, target_date, calendar)
     
     total_leave_hours = 0
     leave_details = []
@@ -3106,73 +3346,33 @@ def get_leave_hours_for_day(employee, target_date):
 # Helper Functions المحدثة
 # =======================
 
-def get_day_name_english(date):
-    """تحويل التاريخ إلى اسم اليوم بالإنجليزية"""
-    days = {
-        0: 'monday',    # الاثنين
-        1: 'tuesday',   # الثلاثاء
-        2: 'wednesday', # الأربعاء
-        3: 'thursday',  # الخميس
-        4: 'friday',    # الجمعة
-        5: 'saturday',  # السبت
-        6: 'sunday'     # الأحد
-    }
-    return days.get(date.weekday())
-
 def get_shift_schedule_for_date(shift, target_date):
     """
-    الحصول على جدول الوردية لتاريخ محدد
+    الحصول على جدول الوردية لتاريخ محدد من التقويم المجمّع للوردية
     يرجع: (is_working_day, start_time, end_time)
     """
-    if not shift or not shift.daily_schedule:
-        return False, None, None
-    
-    day_name = get_day_name_english(target_date)
-    day_schedule = shift.daily_schedule.get(day_name, {})
-    
-    if not day_schedule.get('is_active', False):
+    if not shift:
         return False, None, None
-    
-    try:
-        start_time = time.fromisoformat(day_schedule.get('start_time', ''))
-        end_time = time.fromisoformat(day_schedule.get('end_time', ''))
-        return True, start_time, end_time
-    except (ValueError, TypeError):
+
+    calendar = shift.compiled_calendar()
+    weekday = target_date.weekday()
+    if not calendar.is_working_day(weekday):
         return False, None, None
 
-def calculate_shift_duration_for_date(shift, target_date):
-    """حساب مدة الوردية لتاريخ محدد"""
-    is_working_day, start_time, end_time = get_shift_schedule_for_date(shift, target_date)
-    
-    if not is_working_day or not start_time or not end_time:
-        return 0
-    
-    start_seconds = start_time.hour * 3600 + start_time.minute * 60
-    end_seconds = end_time.hour * 3600 + end_time.minute * 60
-    
-    # التعامل مع الورديات التي تمتد لليوم التالي
-    if end_seconds < start_seconds:
-        end_seconds += 24 * 3600
-    
-    duration_seconds = end_seconds - start_seconds
-    return duration_seconds / 3600
+    start_time, end_time = calendar.day_times(weekday)
+    return True, start_time, end_time
 
-def is_employee_vacation_day_updated(employee, date, shift):
+def is_employee_vacation_day_updated(employee, date, shift, calendar=None):
     """تحديد ما إذا كان اليوم يوم إجازة للموظف مع دعم نظام العطل والإجازات المعتمدة"""
     
     # أولاً: التحقق من العطل الرسمية
-    holiday = Holiday.is_holiday(
-        date, 
-        employee.branch_id if hasattr(employee, 'branch_id') else None,
-        employee.department_id if hasattr(employee, 'department_id') else None
-    )
+    holiday = get_employee_holiday_for_date(employee, date, calendar)
     
     if holiday:
         return True, holiday  # إرجاع معلومات العطلة الرسمية
     
     # ثانياً: التحقق من الإجازات المعتمدة
-    from app.models.leave import Leave
-    leaves = Leave.get_employee_leaves_for_date(employee.id, date)
+    leaves = get_employee_leaves_for_date(employee, date, calendar)
     
     for leave in leaves:
         if leave.is_date_covered_by_leave(date):
@@ -3199,24 +3399,27 @@ def is_employee_vacation_day_updated(employee, date, shift):
 # Updated Functions
 # =======================
 
-def process_shift_attendance_updated(employee, employee_attendances, target_date):
-    """معالجة حضور الموظف في نظام الورديات المحدث"""
-    shift = Shift.query.filter_by(id=employee.shift_id).first()
+def process_shift_attendance_updated(employee, employee_attendances, target_date, shift=None, day=None):
+    """
+    معالجة حضور الموظف في نظام الورديات المحدث (يمكن تمرير الوردية محملة مسبقاً)
+    day: نتيجة محرك الحضور لهذا اليوم إن كانت محسوبة مسبقاً لكل الموظفين
+    """
+    if shift is None:
+        shift = reference_cache.get(Shift, employee.shift_id)
     if not shift:
         return None
 
-    # الحصول على جدول الوردية لهذا التاريخ
-    is_working_day, shift_start_time, shift_end_time = get_shift_schedule_for_date(shift, target_date)
-    
-    if not is_working_day:
-        first_check_in = min(att.checkInTime for att in employee_attendances if att.checkInTime)
-        last_check_out = max(
-            (att.checkOutTime for att in employee_attendances if att.checkOutTime),
-            default=None
-        )
+    if day is None:
+        day = evaluate_employee_day(employee_attendances, shift)
 
-        total_work_time, total_break_time = calculate_work_and_break_time(employee_attendances)
+    first_check_in = min(att.checkInTime for att in employee_attendances if att.checkInTime)
+    last_check_out = max(
+        (att.checkOutTime for att in employee_attendances if att.checkOutTime),
+        default=None
+    )
+    total_work_time, total_break_time = calculate_work_and_break_time(employee_attendances, day)
 
+    if not day['is_working']:
         return format_attendance_summary_updated(
             employee, target_date, first_check_in, "Out of Shift",
             last_check_out, "Out of Shift", total_work_time,
@@ -3224,22 +3427,10 @@ def process_shift_attendance_updated(employee, employee_attendances, target_date
         )
 
     # باقي المنطق في حال اليوم فعلاً من أيام العمل
-    first_check_in = min(att.checkInTime for att in employee_attendances if att.checkInTime)
-    last_check_out = max(
-        (att.checkOutTime for att in employee_attendances if att.checkOutTime),
-        default=None
-    )
-
-    allowed_delay = timedelta(minutes=shift.allowed_delay_minutes)
-    allowed_exit = timedelta(minutes=shift.allowed_exit_minutes)
-
-    shift_start_seconds = time_to_seconds(shift_start_time)
-    shift_end_seconds = time_to_seconds(shift_end_time)
-    first_check_in_seconds = time_to_seconds(first_check_in)
-    last_check_out_seconds = time_to_seconds(last_check_out) if last_check_out else None
+    _, shift_start_time, shift_end_time = get_shift_schedule_for_date(shift, target_date)
 
     # حساب حالة الحضور
-    if first_check_in_seconds <= shift_start_seconds + allowed_delay.total_seconds():
+    if not day['late']:
         actual_check_in_time = shift_start_time
         check_in_status = "On Time"
     else:
@@ -3248,7 +3439,7 @@ def process_shift_attendance_updated(employee, employee_attendances, target_date
 
     # حساب حالة الانصراف
     if last_check_out:
-        if last_check_out_seconds >= shift_end_seconds - allowed_exit.total_seconds():
+        if not day['early']:
             actual_check_out_time = shift_end_time
             check_out_status = "On Time"
         else:
@@ -3258,8 +3449,6 @@ def process_shift_attendance_updated(employee, employee_attendances, target_date
         actual_check_out_time = None
         check_out_status = "No Check-out"
 
-    total_work_time, total_break_time = calculate_work_and_break_time(employee_attendances)
-
     return format_attendance_summary_updated(
         employee, target_date, actual_check_in_time, check_in_status,
         actual_check_out_time, check_out_status, total_work_time,
@@ -7,6 +7,7 @@ from app.models.transaction import TransactionApproval
 from app.models.transaction_history import TransactionHistory
 from app.models.user import UserBranchHead, UserDepartmentHead
 from app.utils import token_required
+from app.reference_cache import reference_cache
 
 from sqlalchemy import or_, and_, not_, func
 
@@ -698,13 +699,13 @@ def get_department_managers(user_id, dept_id):
                 employee = user.employee
                 job_title = None
                 if employee.position:
-                    job = JobTitle.query.get(employee.position)
+                    job = reference_cache.get(JobTitle, employee.position)
                     if job:
                         job_title = job.title_name
                         
                 branch_name = None
                 if employee.branch_id:
-                    branch = Branch.query.get(employee.branch_id)
+                    branch = reference_cache.get(Branch, employee.branch_id)
                     if branch:
                         branch_name = branch.name
                 
@@ -766,13 +767,13 @@ def get_department_head(user_id, dept_id):
         employee = user.employee
         job_title = None
         if employee.position:
-            job = JobTitle.query.get(employee.position)
+            job = reference_cache.get(JobTitle, employee.position)
             if job:
                 job_title = job.title_name
                 
         branch_name = None
         if employee.branch_id:
-            branch = Branch.query.get(employee.branch_id)
+            branch = reference_cache.get(Branch, employee.branch_id)
             if branch:
                 branch_name = branch.name
         
@@ -844,13 +845,13 @@ def get_department_head_fun(user_id, dept_id):
         employee = head.employee
         job_title = None
         if employee.position:
-            job = JobTitle.query.get(employee.position)
+            job = reference_cache.get(JobTitle, employee.position)
             if job:
                 job_title = job.title_name
                 
         branch_name = None
         if employee.branch_id:
-            branch = Branch.query.get(employee.branch_id)
+            branch = reference_cache.get(Branch, employee.branch_id)
             if branch:
                 branch_name = branch.name
         
@@ -900,13 +901,13 @@ def get_department_employees(user_id, dept_id):
         for emp in employees:
             job_title = None
             if emp.position:
-                job = JobTitle.query.get(emp.position)
+                job = reference_cache.get(JobTitle, emp.position)
                 if job:
                     job_title = job.title_name
             
             branch_name = None
             if emp.branch_id:
-                branch = Branch.query.get(emp.branch_id)
+                branch = reference_cache.get(Branch, emp.branch_id)
                 if branch:
                     branch_name = branch.name
             
@@ -956,13 +957,13 @@ def get_branch_employees(user_id, branch_id):
         for emp in employees:
             job_title = None
             if emp.position:
-                job = JobTitle.query.get(emp.position)
+                job = reference_cache.get(JobTitle, emp.position)
                 if job:
                     job_title = job.title_name
             
             department_name = None
             if emp.department_id:
-                dept = Department.query.get(emp.department_id)
+                dept = reference_cache.get(Department, emp.department_id)
                 if dept:
                     department_name = dept.name
             
@@ -1301,19 +1302,19 @@ def get_unassigned_employees(user_id):
         for emp in employees:
             job_title = None
             if emp.position:
-                job = JobTitle.query.get(emp.position)
+                job = reference_cache.get(JobTitle, emp.position)
                 if job:
                     job_title = job.title_name
             
             branch_name = None
             if emp.branch_id:
-                branch = Branch.query.get(emp.branch_id)
+                branch = reference_cache.get(Branch, emp.branch_id)
                 if branch:
                     branch_name = branch.name
             
             department_name = None
             if emp.department_id:
-                department = Department.query.get(emp.department_id)
+                department = reference_cache.get(Department, emp.department_id)
                 if department:
                     department_name = department.name
             
@@ -9,9 +9,12 @@ from app.models.branch import Branch
 from app.models.department import Department
 
 from app.utils import token_required
+from app.date_ranges import on_date
+from app.reference_cache import reference_cache
 
 # ✅ استيرادات الموديلات بالشكل الصحيح
-from app.models import Employee, Attendance, Advance, JobTitle, ProductionMonitoring, MonthlyAttendance, Branch , Department,BranchDepartment, Profession
+from app.models import Employee, Attendance, Advance, JobTitle, ProductionMonitoring, MonthlyAttendance, Branch , Department,BranchDepartment, Profession, EmployeeImport
+from sqlalchemy.orm import joinedload, selectinload, load_only
 
 
 
@@ -46,8 +49,7 @@ def save_employee_file(file, fingerprint_id, folder_name):
     return None
 
 
-import pandas as pd
-from werkzeug.utils import secure_filename
+from app.controllers.employee_import_controller import EmployeeImportController
 
 # تابع استيراد بيانات الموظفين من ملف Excel
 @employee_bp.route('/api/employees/import', methods=['POST'])
@@ -67,335 +69,69 @@ def import_employees(user_id):
     if not allowed_file(file.filename):
         return jsonify({'message': 'Invalid file type. Only Excel files are allowed.'}), 400
     
+    # dry_run=1: التحقق من الملف بدون كتابة
+    # chunked=1 أو chunk_size=N: commit كل N صف مع سجل استيراد قابل للاستئناف
+    def _flag(name):
+        return str(request.form.get(name, request.args.get(name, ''))).lower() in ('1', 'true', 'yes')
+
+    chunk_size = request.form.get('chunk_size', request.args.get('chunk_size')) or None
+    if chunk_size is not None and not str(chunk_size).isdigit():
+        return jsonify({'message': 'chunk_size must be a positive integer'}), 400
+
     try:
-        # Read Excel file using pandas
-        df = pd.read_excel(file, dtype={
-            'رقم البصمة': 'Int64',
-            'الراتب الأساسي': float,
-            'نسبة السلفة': float,
-            'معرف الوردية': 'Int64',
-            'تاريخ الميلاد': 'datetime64[ns]',
-            'تاريخ بداية التأمين': 'datetime64[ns]',
-            'تاريخ نهاية التأمين': 'datetime64[ns]'
-        })
-        
-        # Rename columns to match Employee table fields
-        df.rename(columns={
-            'رقم البصمة': 'fingerprint_id',
-            'الاسم الكامل': 'full_name',
-            'نوع الموظف': 'employee_type',
-            'المسمى الوظيفي': 'job_title_name',
-            'المهنة': 'profession_name',
-            'الشهادة': 'certificates',
-            'الراتب الأساسي': 'salary',
-            'نسبة السلفة': 'advancePercentage',
-            'تاريخ الميلاد': 'date_of_birth',
-            'مكان الميلاد': 'place_of_birth',
-            'رقم الهوية الوطنية': 'national_id',
-            'رقم هوية إضافي': 'id_card_number',
-            'نوع العقد': 'contract_type',
-            'العنوان': 'residence',
-            'رقم الجوال الأساسي': 'mobile_1',
-            'رقم جوال إضافي': 'mobile_2',
-            'رقم الطوارئ': 'mobile_3',
-            'نظام العمل': 'work_system',
-            'معرف الوردية': 'shift_id',
-            'قيمة التأمينات': 'insurance_deduction',
-            'البدلات': 'allowances',
-            'تاريخ بداية التأمين': 'insurance_start_date',
-            'تاريخ نهاية التأمين': 'insurance_end_date',
-            'ملاحظات': 'notes',
-            'مكان العمل': 'work_location',
-            'الدائرة / الشعبة': 'division_section'
-        }, inplace=True)
-        
-        # Check for required columns
-        required_columns = ['fingerprint_id', 'full_name', 'employee_type']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            return jsonify({'message': f'Missing required columns: {", ".join(missing_columns)}'}), 400
-        
-        # Print columns for debugging
-        print("DataFrame columns:", df.columns.tolist())
-        
-        # Fill missing values based on data type
-        numeric_cols = ['salary', 'advancePercentage', 'insurance_deduction', 'allowances']
-        df[numeric_cols] = df[numeric_cols].fillna(0)
-        nullable_int_cols = ['fingerprint_id', 'shift_id']
-        df[nullable_int_cols] = df[nullable_int_cols].fillna(pd.NA).astype('Int64')
-
-        # معالجة التواريخ بشكل آمن
-        datetime_cols = ['date_of_birth', 'insurance_start_date', 'insurance_end_date']
-        for col in datetime_cols:
-            if col in df.columns:
-                # تحويل التواريخ وتنظيف القيم غير الصالحة
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-                
-        string_cols = [
-            'full_name', 'employee_type', 'job_title_name', 'profession_name',
-            'certificates', 'place_of_birth', 'national_id', 'id_card_number',
-            'contract_type', 'residence', 'mobile_1', 'mobile_2', 'mobile_3',
-            'work_system', 'notes', 'work_location', 'division_section'
-        ]
-        df[string_cols] = df[string_cols].fillna('')
+        chunked = _flag('chunked') or bool(chunk_size)
+        result, status = EmployeeImportController.import_file(
+            file,
+            dry_run=_flag('dry_run'),
+            chunk_size=EmployeeImportController.get_chunk_size(chunk_size) if chunked else None,
+            created_by=user_id.id
+        )
+        return jsonify(result), status
 
-        # Print data after filling NaN
-        print("DataFrame after filling NaN:", df.head())
-        
-        # Ensure numeric columns are properly converted
-        df['fingerprint_id'] = pd.to_numeric(df['fingerprint_id'], errors='coerce').fillna(pd.NA).astype('Int64')
-        df['salary'] = pd.to_numeric(df['salary'], errors='coerce').fillna(0)
-        df['advancePercentage'] = pd.to_numeric(df['advancePercentage'], errors='coerce').fillna(0)
-        df['shift_id'] = pd.to_numeric(df['shift_id'], errors='coerce').fillna(pd.NA).astype('Int64')
-        df['insurance_deduction'] = pd.to_numeric(df['insurance_deduction'], errors='coerce').fillna(0)
-        df['allowances'] = pd.to_numeric(df['allowances'], errors='coerce').fillna(0)
-        
-        # دالة مساعدة لمعالجة التواريخ
-        def safe_date_convert(date_value):
-            """تحويل آمن للتواريخ - إرجاع None للقيم غير الصالحة"""
-            if pd.isna(date_value) or date_value is pd.NaT:
-                return None
-            try:
-                if hasattr(date_value, 'date'):
-                    return date_value.date()
-                else:
-                    return date_value
-            except:
-                return None
-        
-        # Convert to list of dictionaries
-        employees_data = df.to_dict(orient='records')
-        
-        # ======================= جمع جميع المراجع المطلوبة مسبقاً =======================
-        
-        # جمع جميع job_titles وprofessions وshift_ids المطلوبة
-        all_job_titles = set()
-        all_professions = set()
-        all_shift_ids = set()
-        
-        for data in employees_data:
-            job_title = str(data.get('job_title_name', '')).strip()
-            if job_title:
-                all_job_titles.add(job_title)
-            
-            profession = str(data.get('profession_name', '')).strip()
-            if profession:
-                all_professions.add(profession)
-            
-            shift_id = data.get('shift_id')
-            if pd.notna(shift_id) and shift_id not in ['', None]:
-                try:
-                    shift_id = int(float(shift_id))
-                    if shift_id > 0:  # تجاهل الـ shift_id السالبة أو الصفر
-                        all_shift_ids.add(shift_id)
-                except (ValueError, TypeError):
-                    pass
-        
-        print(f"Found job titles to process: {all_job_titles}")
-        print(f"Found professions to process: {all_professions}")
-        print(f"Found shift IDs to validate: {all_shift_ids}")
-        
-        # ======================= التحقق من صحة shift_ids =======================
-        
-        valid_shift_ids = set()
-        if all_shift_ids:
-            try:
-                from app.models.shift import Shift  # استبدل بالمسار الصحيح لـ Shift model
-                existing_shifts = Shift.query.filter(Shift.id.in_(all_shift_ids)).all()
-                valid_shift_ids = {shift.id for shift in existing_shifts}
-                
-                invalid_shift_ids = all_shift_ids - valid_shift_ids
-                if invalid_shift_ids:
-                    print(f"WARNING: Invalid shift IDs found: {invalid_shift_ids}")
-                    print(f"Valid shift IDs: {valid_shift_ids}")
-                    
-            except ImportError:
-                print("Shift model not found - shift_id validation skipped")
-                # إذا لم يوجد Shift model، اعتبر جميع shift_ids غير صالحة
-                valid_shift_ids = set()
-        
-        # ======================= إنشاء أو جلب job_titles وprofessions =======================
-        
-        job_title_cache = {}
-        profession_cache = {}
-        
-        # معالجة job_titles
-        for job_title_name in all_job_titles:
-            job_title_obj = JobTitle.query.filter_by(title_name=job_title_name).first()
-            if not job_title_obj:
-                job_title_obj = JobTitle(title_name=job_title_name)
-                db.session.add(job_title_obj)
-                db.session.flush()
-            job_title_cache[job_title_name] = job_title_obj
-        
-        # معالجة professions
-        for profession_name in all_professions:
-            profession_obj = Profession.query.filter_by(name=profession_name).first()
-            if not profession_obj:
-                profession_obj = Profession(name=profession_name)
-                db.session.add(profession_obj)
-                db.session.flush()
-            profession_cache[profession_name] = profession_obj
-        
-        print(f"Job title cache: {len(job_title_cache)} items")
-        print(f"Profession cache: {len(profession_cache)} items")
-        
-        # ======================= معالجة كل سجل على حدة =======================
-        
-        processed_employees = []
-        for data in employees_data:
-            # معالجة التواريخ
-            birth_date = safe_date_convert(data.get('date_of_birth'))
-            insurance_start = safe_date_convert(data.get('insurance_start_date'))
-            insurance_end = safe_date_convert(data.get('insurance_end_date'))
-            
-            # التحقق من صحة تواريخ التأمين
-            if insurance_start and insurance_end:
-                if insurance_start >= insurance_end:
-                    print(f"تحذير: تواريخ تأمين غير صالحة للموظف {data.get('full_name', 'Unknown')}")
-                    insurance_start = None
-                    insurance_end = None
-            elif insurance_start and not insurance_end:
-                insurance_start = None
-            elif insurance_end and not insurance_start:
-                insurance_end = None
-            
-            processed_data = data.copy()
-            processed_data['date_of_birth'] = birth_date
-            processed_data['insurance_start_date'] = insurance_start
-            processed_data['insurance_end_date'] = insurance_end
-            
-            processed_employees.append(processed_data)
-        
-        # ======================= إدراج البيانات =======================
-        
-        successful_imports = 0
-        failed_imports = []
-        
-        for i, data in enumerate(processed_employees):
-            try:
-                # معالجة القيم الرقمية بشكل آمن
-                def safe_int_convert(value):
-                    if pd.isna(value) or value is None or value == '':
-                        return None
-                    try:
-                        return int(float(value))
-                    except (ValueError, TypeError):
-                        return None
-                
-                def safe_float_convert(value, default=0.0):
-                    if pd.isna(value) or value is None or value == '':
-                        return default
-                    try:
-                        return float(value)
-                    except (ValueError, TypeError):
-                        return default
-                
-                # معالجة القيم
-                fingerprint_id = safe_int_convert(data.get('fingerprint_id'))
-                salary = safe_float_convert(data.get('salary'), 0)
-                advance_percentage = safe_float_convert(data.get('advancePercentage'))
-                insurance_deduction = safe_float_convert(data.get('insurance_deduction'), 0)
-                allowances = safe_float_convert(data.get('allowances'), 0)
-                
-                # معالجة shift_id مع التحقق من الصحة
-                shift_id = safe_int_convert(data.get('shift_id'))
-                if shift_id and shift_id not in valid_shift_ids:
-                    print(f"Row {i+1}: Invalid shift_id {shift_id}, setting to None")
-                    shift_id = None
-                
-                # التحقق من القيم المطلوبة
-                if not fingerprint_id:
-                    failed_imports.append(f"Row {i+1}: Missing or invalid fingerprint_id")
-                    continue
-                
-                full_name = str(data.get('full_name', '')).strip()
-                if not full_name:
-                    failed_imports.append(f"Row {i+1}: Missing full_name")
-                    continue
-                
-                employee_type = str(data.get('employee_type', '')).strip()
-                if not employee_type:
-                    failed_imports.append(f"Row {i+1}: Missing employee_type")
-                    continue
-                
-                # التحقق من وجود fingerprint_id مسبقاً
-                existing_employee = Employee.query.filter_by(fingerprint_id=fingerprint_id).first()
-                if existing_employee:
-                    failed_imports.append(f"Row {i+1}: Fingerprint ID {fingerprint_id} already exists")
-                    continue
-                
-                # الحصول على job_title وprofession من الـ cache
-                job_title_name = str(data.get('job_title_name', '')).strip()
-                job_title_obj = job_title_cache.get(job_title_name) if job_title_name else None
-                
-                profession_name = str(data.get('profession_name', '')).strip()
-                profession_obj = profession_cache.get(profession_name) if profession_name else None
-                
-                # Create Employee object
-                employee = Employee(
-                    fingerprint_id=fingerprint_id,
-                    full_name=full_name,
-                    employee_type=employee_type,
-                    position=job_title_obj.id if job_title_obj else None,
-                    profession_id=profession_obj.id if profession_obj else None,
-                    salary=salary,
-                    advancePercentage=advance_percentage,
-                    work_system=str(data.get('work_system', '')).strip() or None,
-                    date_of_birth=data.get('date_of_birth'),
-                    place_of_birth=str(data.get('place_of_birth', '')).strip() or None,
-                    national_id=str(data.get('national_id', '')).strip() or None,
-                    id_card_number=str(data.get('id_card_number', '')).strip() or None,
-                    residence=str(data.get('residence', '')).strip() or None,
-                    mobile_1=str(data.get('mobile_1', '')).strip() or None,
-                    mobile_2=str(data.get('mobile_2', '')).strip() or None,
-                    mobile_3=str(data.get('mobile_3', '')).strip() or None,
-                    shift_id=shift_id,  # سيكون None إذا كان غير صالح
-                    insurance_deduction=insurance_deduction,
-                    allowances=allowances,
-                    insurance_start_date=data.get('insurance_start_date'),
-                    insurance_end_date=data.get('insurance_end_date'),
-                    notes=str(data.get('notes', '')).strip() or None,
-                    certificates=str(data.get('certificates', '')).strip() or None,
-                    work_location=str(data.get('work_location', '')).strip() or None,
-                    division_section=str(data.get('division_section', '')).strip() or None
-                )
-                
-                db.session.add(employee)
-                successful_imports += 1
-                
-            except Exception as e:
-                failed_imports.append(f"Row {i+1}: {str(e)}")
-                print(f"Error processing row {i+1}: {str(e)}")
-                continue
-        
-        # Commit changes
-        db.session.commit()
-        
-        response_message = f'Import completed: {successful_imports} employees imported successfully'
-        if failed_imports:
-            response_message += f', {len(failed_imports)} failed'
-        
-        return jsonify({
-            'message': response_message,
-            'successful': successful_imports,
-            'failed': len(failed_imports),
-            'errors': failed_imports[:10],  # عرض أول 10 أخطاء فقط
-            'validation_info': {
-                'total_shift_ids_found': len(all_shift_ids),
-                'valid_shift_ids': list(valid_shift_ids),
-                'invalid_shift_ids': list(all_shift_ids - valid_shift_ids) if all_shift_ids else [],
-                'job_titles_created': len(job_title_cache),
-                'professions_created': len(profession_cache)
-            }
-        }), 201
-    
     except Exception as e:
         # Rollback changes on error
         db.session.rollback()
         print(f"Full error: {str(e)}")
         return jsonify({'message': 'Error importing employees', 'error': str(e)}), 500
     
+def _get_import_for_user(user, import_id):
+    """جلب سجل الاستيراد مع التحقق من أن المستخدم هو منشئه أو super admin"""
+    import_job = EmployeeImport.query.get(import_id)
+    if not import_job:
+        return None, (jsonify({'message': 'Import not found'}), 404)
+
+    if not user.is_super_admin() and import_job.created_by != user.id:
+        return None, (jsonify({'message': 'ليس لديك صلاحية للوصول إلى هذا الاستيراد'}), 403)
+
+    return import_job, None
+
+
+@employee_bp.route('/api/employees/import/<import_id>', methods=['GET'])
+@token_required
+def get_employee_import(user_id, import_id):
+    """حالة استيراد على دفعات"""
+    import_job, error = _get_import_for_user(user_id, import_id)
+    if error:
+        return error
+    return jsonify(import_job.to_dict()), 200
+
+
+@employee_bp.route('/api/employees/import/<import_id>/resume', methods=['POST'])
+@token_required
+def resume_employee_import(user_id, import_id):
+    """استئناف استيراد متوقف من بعد آخر صف تم تثبيته"""
+    _, error = _get_import_for_user(user_id, import_id)
+    if error:
+        return error
+    try:
+        result, status = EmployeeImportController.resume_import(import_id)
+        return jsonify(result), status
+    except Exception as e:
+        db.session.rollback()
+        print(f"Full error: {str(e)}")
+        return jsonify({'message': 'Error resuming import', 'error': str(e)}), 500
+
+
 @employee_bp.route('/api/employees', methods=['POST'])
 @token_required
 def create_employee(user_id):
@@ -637,91 +373,144 @@ def create_employee(user_id):
         return jsonify({'message': 'Error creating employee', 'error': str(e)}), 500
 
 
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+# حقول قائمة الموظفين: الاسم -> (الأعمدة المطلوبة، العلاقة المطلوبة، دالة القيمة)
+EMPLOYEE_LIST_FIELDS = {
+    'id': ((), None, lambda emp: emp.id),
+    'fingerprint_id': (('fingerprint_id',), None, lambda emp: emp.fingerprint_id),
+    'full_name': (('full_name',), None, lambda emp: emp.full_name),
+    'employee_type': (('employee_type',), None, lambda emp: emp.employee_type),
+    'position': (('position',), 'job_title', lambda emp: emp.job_title.title_name if emp.job_title else None),
+    'profession': (('profession_id',), 'profession', lambda emp: emp.profession.name if emp.profession else None),
+    'salary': (('salary',), None, lambda emp: float(emp.salary) if emp.salary else 0),
+    'allowances': (('allowances',), None, lambda emp: float(emp.allowances) if emp.allowances else 0),
+    'insurance_deduction': (('insurance_deduction',), None, lambda emp: float(emp.insurance_deduction) if emp.insurance_deduction else 0),
+    'insurance_start_date': (('insurance_start_date',), None, lambda emp: _iso(emp.insurance_start_date)),
+    'insurance_end_date': (('insurance_end_date',), None, lambda emp: _iso(emp.insurance_end_date)),
+    'advancePercentage': (('advancePercentage',), None, lambda emp: float(emp.advancePercentage) if emp.advancePercentage else 0),
+    'work_system': (('work_system',), None, lambda emp: emp.work_system),
+    'certificates': (('certificates',), None, lambda emp: emp.certificates),
+    'date_of_birth': (('date_of_birth',), None, lambda emp: _iso(emp.date_of_birth)),
+    'place_of_birth': (('place_of_birth',), None, lambda emp: emp.place_of_birth),
+    'date_of_joining': (('date_of_joining',), None, lambda emp: _iso(emp.date_of_joining)),
+    'id_card_number': (('id_card_number',), None, lambda emp: emp.id_card_number),
+    'national_id': (('national_id',), None, lambda emp: emp.national_id),
+    'residence': (('residence',), None, lambda emp: emp.residence),
+    'mobile_1': (('mobile_1',), None, lambda emp: emp.mobile_1),
+    'mobile_2': (('mobile_2',), None, lambda emp: emp.mobile_2),
+    'mobile_3': (('mobile_3',), None, lambda emp: emp.mobile_3),
+    'shift_id': (('shift_id',), None, lambda emp: emp.shift_id),
+    'worker_agreement': (('worker_agreement',), None, lambda emp: emp.worker_agreement),
+    'notes': (('notes',), None, lambda emp: emp.notes),
+    'created_at': (('created_at',), None, lambda emp: emp.created_at.isoformat()),
+    'updated_at': (('updated_at',), None, lambda emp: emp.updated_at.isoformat()),
+    'branch_id': (('branch_id',), None, lambda emp: emp.branch_id),
+    'branch_name': (('branch_id',), 'branch', lambda emp: emp.branch.name if emp.branch else None),
+    'department_id': (('department_id',), None, lambda emp: emp.department_id),
+    'department_name': (('department_id',), 'department', lambda emp: emp.department.name if emp.department else None),
+    'is_department_head': ((), 'user_account', lambda emp: emp.has_user_account() and emp.user_account.is_department_head()),
+    # الحقول الجديدة
+    'overtime_multiplier': (('overtime_multiplier',), None, lambda emp: float(emp.overtime_multiplier) if emp.overtime_multiplier else 1.5),
+    'daily_rate': (('daily_rate',), None, lambda emp: float(emp.daily_rate) if emp.daily_rate else None),
+    'hourly_rate': (('hourly_rate',), None, lambda emp: float(emp.hourly_rate) if emp.hourly_rate else None),
+    # حقول الصور والباركود
+    'barcode': (('barcode',), None, lambda emp: emp.barcode),
+    'barcode_image_path': (('barcode_image_path',), None, lambda emp: emp.barcode_image_path),
+    'logo_path': (('logo_path',), None, lambda emp: emp.logo_path),
+    'photo_path': (('photo_path',), None, lambda emp: emp.photo_path),
+    'contact_number': (('contact_number',), None, lambda emp: emp.contact_number),
+    'blood_type': (('blood_type',), None, lambda emp: emp.blood_type),
+    'card_expiry_date': (('card_expiry_date',), None, lambda emp: _iso(emp.card_expiry_date)),
+    # حقول مكان العمل والدائرة/الشعبة
+    'work_location': (('work_location',), None, lambda emp: emp.work_location),
+    'division_section': (('division_section',), None, lambda emp: emp.division_section),
+}
+
+# حجم الصفحة الأقصى في الترقيم بالمؤشر
+EMPLOYEES_MAX_PAGE_SIZE = 1000
+
+
 @employee_bp.route('/api/employees', methods=['GET'])
 @token_required
 def get_all_employees(user):
-    
+    """
+    قائمة الموظفين المتاحين للمستخدم
+    - ?fields=id,full_name,branch_name : إرجاع الحقول المطلوبة فقط
+    - ?limit=100&after_id=250 : ترقيم بالمؤشر (keyset) حسب id
+    بدون limit/after_id تُعاد القائمة كاملة كما في السابق
+    """
     user = user.query.get(user.id)
     if not user:
         return jsonify({'message': 'User not found'}), 404
 
-    accessible_employees = user.get_accessible_employees()
-    result = []
-    
-    for emp in accessible_employees:
-        branch_name = emp.branch.name if emp.branch else None
-        department_name = emp.department.name if emp.department else None
-
-        # الحصول على المسمى الوظيفي
-        job_title_name = None
-        if emp.position:
-            from app.models.job_title import JobTitle
-            job_title = JobTitle.query.get(emp.position)
-            if job_title:
-                job_title_name = job_title.title_name
-
-        # الحصول على المهنة
-        profession_name = None
-        if emp.profession_id:
-            from app.models.profession import Profession
-            profession = Profession.query.get(emp.profession_id)
-            if profession:
-                profession_name = profession.name
+    # الحقول المطلوبة
+    fields_param = request.args.get('fields')
+    if fields_param:
+        fields = [field.strip() for field in fields_param.split(',') if field.strip()]
+        unknown_fields = [field for field in fields if field not in EMPLOYEE_LIST_FIELDS]
+        if unknown_fields:
+            return jsonify({
+                'message': f'Unknown fields: {", ".join(unknown_fields)}',
+                'available_fields': list(EMPLOYEE_LIST_FIELDS.keys())
+            }), 400
+    else:
+        fields = list(EMPLOYEE_LIST_FIELDS.keys())
+
+    # الترقيم بالمؤشر
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', type=int)
+    paginated = after_id is not None or limit is not None
+    if limit is not None and (limit < 1 or limit > EMPLOYEES_MAX_PAGE_SIZE):
+        return jsonify({'message': f'limit must be between 1 and {EMPLOYEES_MAX_PAGE_SIZE}'}), 400
+
+    # تحميل الأعمدة والعلاقات التي تحتاجها الحقول المطلوبة فقط (عدد ثابت من الاستعلامات)
+    columns = {'id'}
+    relationships = set()
+    for field in fields:
+        field_columns, relationship, _ = EMPLOYEE_LIST_FIELDS[field]
+        columns.update(field_columns)
+        if relationship:
+            relationships.add(relationship)
+
+    options = [load_only(*[getattr(Employee, column) for column in columns])]
+    for relationship in ('job_title', 'profession', 'branch', 'department'):
+        if relationship in relationships:
+            options.append(joinedload(getattr(Employee, relationship)))
+    if 'user_account' in relationships:
+        options.append(selectinload(Employee.user_account))
+
+    query = user.accessible_employees_query().options(*options)
+
+    if paginated:
+        query = query.order_by(Employee.id)
+        if after_id is not None:
+            query = query.filter(Employee.id > after_id)
+        page_size = limit or EMPLOYEES_MAX_PAGE_SIZE
+        # جلب سجل إضافي لمعرفة وجود صفحة تالية
+        employees = query.limit(page_size + 1).all()
+        has_next = len(employees) > page_size
+        employees = employees[:page_size]
+    else:
+        employees = query.all()
 
-        is_dept_head = emp.has_user_account() and emp.user_account.is_department_head()
+    getters = [(field, EMPLOYEE_LIST_FIELDS[field][2]) for field in fields]
+    result = [{field: getter(emp) for field, getter in getters} for emp in employees]
 
-        result.append({
-            'id': emp.id,
-            'fingerprint_id': emp.fingerprint_id,
-            'full_name': emp.full_name,
-            'employee_type': emp.employee_type,
-            'position': job_title_name,
-            'profession': profession_name,
-            'salary': float(emp.salary) if emp.salary else 0,
-            'allowances': float(emp.allowances) if emp.allowances else 0,
-            'insurance_deduction': float(emp.insurance_deduction) if emp.insurance_deduction else 0,
-            'insurance_start_date': emp.insurance_start_date.isoformat() if emp.insurance_start_date else None,
-            'insurance_end_date': emp.insurance_end_date.isoformat() if emp.insurance_end_date else None,
-            'advancePercentage': float(emp.advancePercentage) if emp.advancePercentage else 0,
-            'work_system': emp.work_system,
-            'certificates': emp.certificates,
-            'date_of_birth': emp.date_of_birth.isoformat() if emp.date_of_birth else None,
-            'place_of_birth': emp.place_of_birth,
-            'date_of_joining': emp.date_of_joining.isoformat() if emp.date_of_joining else None,
-            'id_card_number': emp.id_card_number,
-            'national_id': emp.national_id,
-            'residence': emp.residence,
-            'mobile_1': emp.mobile_1,
-            'mobile_2': emp.mobile_2,
-            'mobile_3': emp.mobile_3,
-            'shift_id': emp.shift_id,
-            'worker_agreement': emp.worker_agreement,
-            'notes': emp.notes,
-            'created_at': emp.created_at.isoformat(),
-            'updated_at': emp.updated_at.isoformat(),
-            'branch_id': emp.branch_id,
-            'branch_name': branch_name,
-            'department_id': emp.department_id,
-            'department_name': department_name,
-            'is_department_head': is_dept_head,
-            # الحقول الجديدة
-            'overtime_multiplier': float(emp.overtime_multiplier) if emp.overtime_multiplier else 1.5,
-            'daily_rate': float(emp.daily_rate) if emp.daily_rate else None,
-            'hourly_rate': float(emp.hourly_rate) if emp.hourly_rate else None,
-            # حقول الصور والباركود
-            'barcode': emp.barcode,
-            'barcode_image_path': emp.barcode_image_path,
-            'logo_path': emp.logo_path,
-            'photo_path': emp.photo_path,
-            'contact_number': emp.contact_number,
-            'blood_type': emp.blood_type,
-            'card_expiry_date': emp.card_expiry_date.isoformat() if emp.card_expiry_date else None,
-            # حقول مكان العمل والدائرة/الشعبة
-            'work_location': emp.work_location,
-            'division_section': emp.division_section,
-        })
+    if not paginated:
+        return jsonify(result), 200
 
-    return jsonify(result), 200
+    return jsonify({
+        'employees': result,
+        'pagination': {
+            'after_id': after_id,
+            'limit': page_size,
+            'next_after_id': employees[-1].id if has_next and employees else None,
+            'has_next': has_next
+        }
+    }), 200
 
 
 
@@ -800,13 +589,13 @@ def get_employee(user_id, id):
 
     branch_name = None
     if employee.branch_id:
-        branch = Branch.query.get(employee.branch_id)
+        branch = reference_cache.get(Branch, employee.branch_id)
         if branch:
             branch_name = branch.name
     
     department_name = None
     if employee.department_id:
-        department = Department.query.get(employee.department_id)
+        department = reference_cache.get(Department, employee.department_id)
         if department:
             department_name = department.name
 
@@ -872,13 +661,13 @@ def get_employee_by_barcode(user_id, barcode):
     # جلب معلومات الفرع والقسم
     branch_name = None
     if employee.branch_id:
-        branch = Branch.query.get(employee.branch_id)
+        branch = reference_cache.get(Branch, employee.branch_id)
         if branch:
             branch_name = branch.name
 
     department_name = None
     if employee.department_id:
-        department = Department.query.get(employee.department_id)
+        department = reference_cache.get(Department, employee.department_id)
         if department:
             department_name = department.name
 
@@ -886,7 +675,7 @@ def get_employee_by_barcode(user_id, barcode):
     job_title_name = None
     if employee.position:
         from app.models.job_title import JobTitle
-        job_title = JobTitle.query.get(employee.position)
+        job_title = reference_cache.get(JobTitle, employee.position)
         if job_title:
             job_title_name = job_title.title_name
 
@@ -894,7 +683,7 @@ def get_employee_by_barcode(user_id, barcode):
     profession_name = None
     if employee.profession_id:
         from app.models.profession import Profession
-        profession = Profession.query.get(employee.profession_id)
+        profession = reference_cache.get(Profession, employee.profession_id)
         if profession:
             profession_name = profession.name
 
@@ -1290,79 +1079,52 @@ def get_absent_employees(current_user):
     try:
         
         # الحصول على الموظفين الذين يمكن للمستخدم الوصول إليهم حسب صلاحياته
-        accessible_employees = current_user.get_accessible_employees()
-        accessible_employee_ids = [emp.id for emp in accessible_employees]
-
-        if not accessible_employee_ids:
+        if not current_user.has_accessible_employees():
             return jsonify({
                 'message': 'لا توجد موظفين يمكن الوصول إليهم لهذا المستخدم',
                 'user_type': current_user.user_type,
                 'accessible_count': 0
             }), 200
 
+        from app.models.leave import Leave
+        from app.holiday_calendar import holiday_calendar
+        from datetime import datetime
+
+        selected_date_obj = datetime.strptime(selected_date, '%Y-%m-%d').date()
+
         # استعلام لجلب الموظفين الغائبين من الموظفين المسموح لهم فقط
-        # مع استثناء الموظفين في إجازة أو عطلة
+        # مع استثناء الموظفين في إجازة شخصية معتمدة في نفس الاستعلام
         absent_employees = db.session.query(Employee).filter(
-            Employee.id.in_(accessible_employee_ids),  # فلترة حسب الصلاحيات
+            Employee.id.in_(current_user.accessible_employee_ids_subquery()),  # فلترة حسب الصلاحيات
             ~Employee.id.in_(
                 db.session.query(Attendance.empId).filter(
-                    db.func.cast(Attendance.createdAt, db.Date) == selected_date
+                    on_date(Attendance.createdAt, selected_date)
                 )
-            )
-        ).all()
-
-        # فلترة إضافية لاستثناء الموظفين في إجازة أو عطلة
-        from app.models.holiday import Holiday
-        from app.models.leave import Leave
-        from datetime import datetime
-        
-        selected_date_obj = datetime.strptime(selected_date, '%Y-%m-%d').date()
-        
-        # التحقق من العطل العامة
-        general_holidays = Holiday.query.filter(
-            Holiday.is_active == True,
-            Holiday.branch_id.is_(None),
-            Holiday.department_id.is_(None),
-            Holiday.date == selected_date_obj
-        ).all()
-        
-        is_general_holiday = len(general_holidays) > 0
-        
-        # فلترة الموظفين الغائبين
-        filtered_absent_employees = []
-        
-        for emp in absent_employees:
-            # التحقق من الإجازات الشخصية
-            personal_leave = Leave.query.filter(
-                Leave.employee_id == emp.id,
+            ),
+            ~db.session.query(Leave.id).filter(
+                Leave.employee_id == Employee.id,
                 Leave.start_date <= selected_date_obj,
                 Leave.end_date >= selected_date_obj,
                 Leave.status == 'approved'
-            ).first()
-            
-            # التحقق من العطل الخاصة بالفرع أو القسم
-            branch_holiday = None
-            department_holiday = None
-            
-            if emp.branch_id:
-                branch_holiday = Holiday.query.filter(
-                    Holiday.is_active == True,
-                    Holiday.branch_id == emp.branch_id,
-                    Holiday.date == selected_date_obj
-                ).first()
-            
-            if emp.department_id:
-                department_holiday = Holiday.query.filter(
-                    Holiday.is_active == True,
-                    Holiday.department_id == emp.department_id,
-                    Holiday.date == selected_date_obj
-                ).first()
-            
-            # إذا كان الموظف في إجازة أو عطلة، لا نعتبره غائب
-            if personal_leave or is_general_holiday or branch_holiday or department_holiday:
-                continue
-                
-            filtered_absent_employees.append(emp)
+            ).exists()
+        ).all()
+
+        # استثناء الموظفين في عطلة من تقويم العطل في الذاكرة (بدون استعلام لكل موظف)
+        holidays = holiday_calendar.get_holidays_on(selected_date_obj)
+        is_general_holiday = any(
+            holiday.branch_id is None and holiday.department_id is None for holiday in holidays
+        )
+        holiday_branch_ids = {holiday.branch_id for holiday in holidays if holiday.branch_id is not None}
+        holiday_department_ids = {holiday.department_id for holiday in holidays if holiday.department_id is not None}
+
+        filtered_absent_employees = []
+        if not is_general_holiday:
+            for emp in absent_employees:
+                if emp.branch_id and emp.branch_id in holiday_branch_ids:
+                    continue
+                if emp.department_id and emp.department_id in holiday_department_ids:
+                    continue
+                filtered_absent_employees.append(emp)
 
         result = [
             {
@@ -1429,7 +1191,7 @@ def classify_employees(current_user):
         job_title_name = None
         if emp.position:
             from app.models.job_title import JobTitle
-            job_title = JobTitle.query.get(emp.position)
+            job_title = reference_cache.get(JobTitle, emp.position)
             if job_title:
                 job_title_name = job_title.title_name
 
@@ -1437,7 +1199,7 @@ def classify_employees(current_user):
         profession_name = None
         if emp.profession_id:
             from app.models.profession import Profession
-            profession = Profession.query.get(emp.profession_id)
+            profession = reference_cache.get(Profession, emp.profession_id)
             if profession:
                 profession_name = profession.name
 
@@ -1657,13 +1419,13 @@ def get_employee_public_info(barcode):
     # جلب معلومات الفرع والقسم
     branch_name = None
     if employee.branch_id:
-        branch = Branch.query.get(employee.branch_id)
+        branch = reference_cache.get(Branch, employee.branch_id)
         if branch:
             branch_name = branch.name
 
     department_name = None
     if employee.department_id:
-        department = Department.query.get(employee.department_id)
+        department = reference_cache.get(Department, employee.department_id)
         if department:
             department_name = department.name
 
@@ -1671,7 +1433,7 @@ def get_employee_public_info(barcode):
     job_title_name = None
     if employee.position:
         from app.models.job_title import JobTitle
-        job_title = JobTitle.query.get(employee.position)
+        job_title = reference_cache.get(JobTitle, employee.position)
         if job_title:
             job_title_name = job_title.title_name
 
@@ -1679,7 +1441,7 @@ def get_employee_public_info(barcode):
     profession_name = None
     if employee.profession_id:
         from app.models.profession import Profession
-        profession = Profession.query.get(employee.profession_id)
+        profession = reference_cache.get(Profession, employee.profession_id)
         if profession:
             profession_name = profession.name
 
@@ -31,7 +31,7 @@ def create_holiday(current_user):  # تغيير اسم المعامل
             return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
         
         # التحقق من عدم وجود عطلة في نفس التاريخ للفرع/القسم نفسه
-        existing_holiday = Holiday.is_holiday(
+        existing_holiday = Holiday.find_existing(
             holiday_date, 
             data.get('branch_id'),
             data.get('department_id')
@@ -271,7 +271,8 @@ def create_bulk_holidays(current_user):  # تغيير اسم المعامل
                 holiday_date = datetime.strptime(holiday_data['date'], '%Y-%m-%d').date()
                 
                 # التحقق من عدم وجود عطلة مسبقاً
-                existing_holiday = Holiday.is_holiday(
+                # من قاعدة البيانات (autoflush يشمل العطل المضافة سابقاً في نفس الطلب)
+                existing_holiday = Holiday.find_existing(
                     holiday_date,
                     holiday_data.get('branch_id'),
                     holiday_data.get('department_id')
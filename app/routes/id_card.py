@@ -8,6 +8,7 @@ from app import db
 from app.models.employee import Employee
 from app.models.job_title import JobTitle
 from app.utils import token_required
+from app.reference_cache import reference_cache
 import os
 
 id_card_bp = Blueprint('id_card', __name__)
@@ -47,7 +48,7 @@ def get_id_card_front(current_user, emp_id):
         # تحضير بيانات الموظف
         job_title_name = None
         if employee.position:
-            job_title = JobTitle.query.get(employee.position)
+            job_title = reference_cache.get(JobTitle, employee.position)
             if job_title:
                 job_title_name = job_title.title_name
 
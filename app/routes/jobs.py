@@ -0,0 +1,43 @@
+from flask import Blueprint, jsonify
+from app.jobs import job_queue
+from app.models.background_job import BackgroundJob
+from app.utils import token_required
+
+job_bp = Blueprint('jobs', __name__)
+
+
+def _get_job_for_user(user, job_id):
+    """جلب المهمة مع التحقق من صلاحية المستخدم عليها"""
+    job_queue.sweep()
+    job = BackgroundJob.query.get(job_id)
+    if not job:
+        return None, (jsonify({'message': 'المهمة غير موجودة'}), 404)
+
+    if not user.is_super_admin() and job.created_by != user.id:
+        return None, (jsonify({'message': 'ليس لديك صلاحية للوصول إلى هذه المهمة'}), 403)
+
+    return job, None
+
+
+@job_bp.route('/api/jobs/<job_id>', methods=['GET'])
+@token_required
+def get_job_status(user, job_id):
+    """حالة مهمة خلفية"""
+    job, error = _get_job_for_user(user, job_id)
+    if error:
+        return error
+    return jsonify(job.to_dict()), 200
+
+
+@job_bp.route('/api/jobs/<job_id>/result', methods=['GET'])
+@token_required
+def get_job_result(user, job_id):
+    """نتيجة مهمة خلفية - 202 إذا لم تنته بعد"""
+    job, error = _get_job_for_user(user, job_id)
+    if error:
+        return error
+
+    if job.status in ('queued', 'running'):
+        return jsonify(job.to_dict()), 202
+
+    return jsonify(job.to_dict(include_result=True)), 200
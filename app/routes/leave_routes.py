@@ -1,6 +1,8 @@
-from flask import Blueprint, request, jsonify
+import time
+from flask import Blueprint, current_app, request, jsonify
 from sqlalchemy import null
 from app import db
+from app.reference_cache import reference_cache
 from app.utils import token_required
 from app.models.leave import Leave
 from app.models.user import User
@@ -9,6 +11,11 @@ from datetime import datetime, date, timedelta
 
 leave_bp = Blueprint('leave', __name__)
 
+# إحصائيات الفترات المغلقة {(user_id, start, end): (نسخة جدول الإجازات، وقت الحفظ، النتيجة)}
+LEAVE_STATISTICS_CACHE_TTL = 600
+LEAVE_STATISTICS_CACHE_SIZE = 1024
+_statistics_cache = {}
+
 # =========================== إنشاء إجازة جديدة ===========================
 
 @leave_bp.route('/api/leaves', methods=['POST'])
@@ -187,9 +194,8 @@ def get_all_leaves(user):
         query = Leave.query
         
         if not current_user.is_super_admin():
-            accessible_employee_ids = [emp.id for emp in current_user.get_accessible_employees()]
-            if accessible_employee_ids:
-                query = query.filter(Leave.employee_id.in_(accessible_employee_ids))
+            if current_user.has_accessible_employees():
+                query = query.filter(Leave.employee_id.in_(current_user.accessible_employee_ids_subquery()))
             else:
                 query = query.filter(Leave.employee_id == current_user.employee_id)
 
@@ -272,8 +278,7 @@ def get_leave(user, leave_id):
         
         # التحقق من صلاحية الوصول
         if not current_user.is_super_admin():
-            accessible_employee_ids = [emp.id for emp in current_user.get_accessible_employees()]
-            if leave.employee_id not in accessible_employee_ids and leave.employee_id != current_user.employee_id:
+            if leave.employee_id != current_user.employee_id and not current_user.can_access_employee(leave.employee_id):
                 return jsonify({'message': 'ليس لديك صلاحية للوصول إلى هذه الإجازة'}), 403
 
         return jsonify(leave.get_leave_details()), 200
@@ -293,8 +298,7 @@ def get_employee_leaves(user, employee_id):
 
         # التحقق من صلاحية الوصول للموظف
         if not current_user.is_super_admin():
-            accessible_employee_ids = [emp.id for emp in current_user.get_accessible_employees()]
-            if employee_id not in accessible_employee_ids and employee_id != current_user.employee_id:
+            if employee_id != current_user.employee_id and not current_user.can_access_employee(employee_id):
                 return jsonify({'message': 'ليس لديك صلاحية للوصول إلى إجازات هذا الموظف'}), 403
 
         employee = Employee.query.get(employee_id)
@@ -399,6 +403,25 @@ def update_leave_status(user, leave_id):
 
 # =========================== إحصائيات الإجازات ===========================
 
+def _statistics_cache_get(key):
+    """إحصائيات محفوظة لفترة مغلقة إذا لم تتغير الإجازات ولم تنته صلاحيتها - وإلا None"""
+    entry = _statistics_cache.get(key)
+    if entry is None:
+        return None
+    version, stored_at, result = entry
+    ttl = current_app.config.get('LEAVE_STATISTICS_CACHE_TTL', LEAVE_STATISTICS_CACHE_TTL)
+    if version != reference_cache.version(Leave.__table__.name) or time.monotonic() - stored_at >= ttl:
+        _statistics_cache.pop(key, None)
+        return None
+    return result
+
+
+def _statistics_cache_set(key, result):
+    if len(_statistics_cache) >= LEAVE_STATISTICS_CACHE_SIZE:
+        _statistics_cache.clear()
+    _statistics_cache[key] = (reference_cache.version(Leave.__table__.name), time.monotonic(), result)
+
+
 @leave_bp.route('/api/leaves/statistics', methods=['GET'])
 @token_required
 def get_leave_statistics(user):
@@ -407,24 +430,22 @@ def get_leave_statistics(user):
         if not current_user:
             return jsonify({'message': 'المستخدم غير موجود'}), 404
 
-        # فلترة الإجازات حسب صلاحيات المستخدم
+        # فلترة الإجازات حسب صلاحيات المستخدم (استعلام فرعي بدلاً من تحميل الموظفين)
         query = Leave.query
         
         if not current_user.is_super_admin():
-            accessible_employee_ids = [emp.id for emp in current_user.get_accessible_employees()]
-            if accessible_employee_ids:
-                query = query.filter(Leave.employee_id.in_(accessible_employee_ids))
+            if current_user.has_accessible_employees():
+                query = query.filter(Leave.employee_id.in_(current_user.accessible_employee_ids_subquery()))
             else:
                 query = query.filter(Leave.employee_id == current_user.employee_id)
 
         # فلترة حسب فترة زمنية إذا تم تحديدها
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        if start_date and end_date:
+        start_date = None
+        end_date = None
+        if request.args.get('start_date') and request.args.get('end_date'):
             try:
-                start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-                end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+                start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+                end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date()
                 query = query.filter(
                     Leave.start_date <= end_date,
                     db.or_(
@@ -435,65 +456,66 @@ def get_leave_statistics(user):
             except ValueError:
                 return jsonify({'message': 'تنسيق التاريخ غير صحيح. استخدم YYYY-MM-DD'}), 400
 
-        # إحصائيات عامة
-        total_leaves = query.count()
-        active_leaves = query.filter(Leave.status == 'active').count()
-        cancelled_leaves = query.filter(Leave.status == 'cancelled').count()
-        expired_leaves = query.filter(Leave.status == 'expired').count()
-
-        # إحصائيات حسب النوع
-        hourly_leaves = query.filter(Leave.leave_type == 'hourly_leave').count()
-        daily_leaves = query.filter(Leave.leave_type == 'daily_leave').count()
-
-        # إحصائيات تفصيلية
-        hourly_leaves_active = query.filter(
-            Leave.leave_type == 'hourly_leave',
-            Leave.status == 'active'
-        ).count()
-        
-        daily_leaves_active = query.filter(
-            Leave.leave_type == 'daily_leave',
-            Leave.status == 'active'
-        ).count()
-
-        # حساب إجمالي الساعات والأيام
-        hourly_leaves_list = query.filter(
-            Leave.leave_type == 'hourly_leave',
-            Leave.status == 'active'
-        ).all()
-        
-        daily_leaves_list = query.filter(
-            Leave.leave_type == 'daily_leave',
-            Leave.status == 'active'
-        ).all()
-
-        total_hours = sum(leave.hours or 0 for leave in hourly_leaves_list)
-        total_days = sum(leave.days or 0 for leave in daily_leaves_list)
-
-        return jsonify({
+        # الفترات المنتهية لا تتغير إلا بتعديل الإجازات - تُحفظ نتيجتها لكل مستخدم
+        cache_key = None
+        if end_date is not None and end_date < date.today():
+            cache_key = (current_user.id, start_date, end_date)
+            cached = _statistics_cache_get(cache_key)
+            if cached is not None:
+                return jsonify(cached), 200
+
+        # استعلام تجميعي واحد: العدد والمجاميع لكل (الحالة، النوع)
+        rows = query.with_entities(
+            Leave.status,
+            Leave.leave_type,
+            db.func.count(Leave.id),
+            db.func.sum(Leave.hours),
+            db.func.sum(Leave.days)
+        ).group_by(Leave.status, Leave.leave_type).all()
+
+        counts = {}
+        hours = {}
+        days = {}
+        for status, leave_type, count, hours_sum, days_sum in rows:
+            counts[(status, leave_type)] = count
+            hours[(status, leave_type)] = int(hours_sum or 0)
+            days[(status, leave_type)] = int(days_sum or 0)
+
+        def count_where(status=None, leave_type=None):
+            return sum(
+                count for (row_status, row_type), count in counts.items()
+                if (status is None or row_status == status) and (leave_type is None or row_type == leave_type)
+            )
+
+        result = {
             'overview': {
-                'total': total_leaves,
-                'active': active_leaves,
-                'cancelled': cancelled_leaves,
-                'expired': expired_leaves
+                'total': count_where(),
+                'active': count_where(status='active'),
+                'cancelled': count_where(status='cancelled'),
+                'expired': count_where(status='expired')
             },
             'by_type': {
                 'hourly_leave': {
-                    'total': hourly_leaves,
-                    'active': hourly_leaves_active,
-                    'total_hours': total_hours
+                    'total': count_where(leave_type='hourly_leave'),
+                    'active': count_where('active', 'hourly_leave'),
+                    'total_hours': hours.get(('active', 'hourly_leave'), 0)
                 },
                 'daily_leave': {
-                    'total': daily_leaves,
-                    'active': daily_leaves_active,
-                    'total_days': total_days
+                    'total': count_where(leave_type='daily_leave'),
+                    'active': count_where('active', 'daily_leave'),
+                    'total_days': days.get(('active', 'daily_leave'), 0)
                 }
             },
             'period': {
                 'start_date': start_date.strftime('%Y-%m-%d') if start_date else None,
                 'end_date': end_date.strftime('%Y-%m-%d') if end_date else None
             }
-        }), 200
+        }
+
+        if cache_key is not None:
+            _statistics_cache_set(cache_key, result)
+
+        return jsonify(result), 200
 
     except Exception as e:
         return jsonify({'message': f'حدث خطأ أثناء جلب إحصائيات الإجازات: {str(e)}'}), 500
\ No newline at end of file
@@ -1,10 +1,20 @@
-from flask import Blueprint, render_template_string, request, jsonify
+from flask import Blueprint, render_template_string, request, jsonify, current_app, Response, stream_with_context
+from markupsafe import escape
 from datetime import datetime, date, timedelta
 from sqlalchemy import extract, and_
 from decimal import Decimal
 from app import db
 from app.models import AttendanceType, Employee, JobTitle, MonthlyAttendance, Attendance, ProductionMonitoring, Advance, Shift, user
+from app.models.user import User
 from app.utils import token_required
+from app.date_ranges import date_range
+from app.reference_cache import reference_cache
+from app.shift_calendar import SLOT_ACTIVE, SLOT_END, SLOT_START, get_day_name_english
+from app.attendance_engine import (
+    evaluate_attendances, overtime_seconds, seconds_to_minutes, shift_week, time_to_minutes
+)
+from app.jobs import job_queue, job_handler, is_async_request, job_accepted_response
+from app.controllers.payroll_snapshot_controller import PayrollSnapshotController
 
 payroll_bp = Blueprint('payroll', __name__)
 
@@ -40,127 +50,175 @@ def calculate_period_payroll(user):
         if end_date > date.today():
             return jsonify({'message': 'End date cannot be in the future'}), 400
 
-        # حساب عدد الأيام في الفترة
-        period_days = (end_date - start_date).days + 1
+        if is_async_request(data):
+            job = job_queue.enqueue('payroll_period', {
+                'user_id': user.id,
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat()
+            }, created_by=user.id)
+            result, status = job_accepted_response(job, f'/api/jobs/{job.id}')
+            return jsonify(result), status
 
-        # جلب جميع الموظفين
-        employees = user.get_accessible_employees()
-
-        # تهيئة المتغيرات لتجميع النتائج
-        monthly_system_employees = []
-        production_system_employees = []
-        shift_system_employees = []
-        hourly_employees = []
-
-        # إحصائيات عامة
-        general_statistics = {
-            'total_employees': len(employees),
-            'total_payroll': Decimal('0'),
-            'total_basic_salaries': Decimal('0'),
-            'total_allowances': Decimal('0'),
-            'total_additions': Decimal('0'),
-            'total_deductions': Decimal('0'),
-            'calculation_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'period': {
-                'start_date': start_date.strftime('%Y-%m-%d'),
-                'end_date': end_date.strftime('%Y-%m-%d'),
-                'total_days': period_days
-            }
-        }
+        result = build_period_payroll(user, start_date, end_date)
 
-        # إحصائيات لكل نظام
-        systems_statistics = {
-            'monthly_system': {
-                'employee_count': 0,
-                'total_salaries': Decimal('0'),
-                'total_additions': Decimal('0'),
-                'total_deductions': Decimal('0'),
-                'attendance_summary': {
-                    'full_days': 0,
-                    'half_days': 0,
-                    'online_days': 0,
-                    'excused_absences': 0,
-                    'unexcused_absences': 0
-                }
-            },
-            'production_system': {
-                'employee_count': 0,
-                'total_salaries': Decimal('0'),
-                'total_production_value': Decimal('0'),
-                'total_pieces': 0,
-                'quality_summary': {
-                    'A': {'count': 0, 'value': Decimal('0')},
-                    'B': {'count': 0, 'value': Decimal('0')},
-                    'C': {'count': 0, 'value': Decimal('0')},
-                    'D': {'count': 0, 'value': Decimal('0')},
-                    'E': {'count': 0, 'value': Decimal('0')}
-                }
-            },
-            'shift_system': {
-                'employee_count': 0,
-                'total_salaries': Decimal('0'),
-                'total_working_hours': 0,
-                'total_overtime_hours': 0,
-                'total_delay_minutes': 0,
-                'total_break_minutes': 0
-            }
-        }
+        return jsonify(result), 200
 
-        # معالجة كل موظف
-        for employee in employees:
-            salary_result = calculate_employee_salary_period(employee, start_date, end_date)
-            
-            # تحديث الإحصائيات العامة
-            general_statistics['total_basic_salaries'] += Decimal(salary_result['basic_salary'])
-            general_statistics['total_allowances'] += Decimal(salary_result['allowances'])
-            general_statistics['total_additions'] += Decimal(salary_result['additions'])
-            general_statistics['total_deductions'] += Decimal(salary_result['deductions'])
-            general_statistics['total_payroll'] += Decimal(salary_result['net_salary'])
-
-            # تصنيف الموظف حسب نظام عمله
-            if not employee.job_title:
-               hourly_employees.append(salary_result)
-            elif employee.job_title.month_system:
-                monthly_system_employees.append(salary_result)
-                update_monthly_system_statistics(systems_statistics['monthly_system'], salary_result)
-            elif employee.job_title.production_system:
-                production_system_employees.append(salary_result)
-                update_production_system_statistics(systems_statistics['production_system'], salary_result)
-            elif employee.job_title.shift_system:
-                shift_system_employees.append(salary_result)
-                update_shift_system_statistics(systems_statistics['shift_system'], salary_result)
-            else:
-                hourly_employees.append(salary_result)
+    except Exception as e:
+        print(f"Error in calculate_period_payroll: {str(e)}")
+        return jsonify({'message': f'Error calculating payroll: {str(e)}'}), 500
 
-        # تحديث عدد الموظفين في كل نظام
-        systems_statistics['monthly_system']['employee_count'] = len(monthly_system_employees)
-        systems_statistics['production_system']['employee_count'] = len(production_system_employees)
-        systems_statistics['shift_system']['employee_count'] = len(shift_system_employees)
+def build_period_payroll(user, start_date, end_date):
+    """
+    تجميع رواتب الموظفين المتاحين للمستخدم لفترة محددة
+    (تستخدم من الطلب المباشر ومن المهمة الخلفية)
+    """
+    # حساب عدد الأيام في الفترة
+    period_days = (end_date - start_date).days + 1
 
-        # تنسيق القيم العشرية إلى نصوص
-        format_decimal_values(general_statistics)
-        format_system_statistics(systems_statistics)
+    # جلب جميع الموظفين
+    employees = user.get_accessible_employees()
+
+    # تهيئة المتغيرات لتجميع النتائج
+    monthly_system_employees = []
+    production_system_employees = []
+    shift_system_employees = []
+    hourly_employees = []
+
+    # إحصائيات عامة
+    general_statistics = {
+        'total_employees': len(employees),
+        'total_payroll': Decimal('0'),
+        'total_basic_salaries': Decimal('0'),
+        'total_allowances': Decimal('0'),
+        'total_additions': Decimal('0'),
+        'total_deductions': Decimal('0'),
+        'calculation_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'period': {
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': end_date.strftime('%Y-%m-%d'),
+            'total_days': period_days
+        }
+    }
 
-        # تجميع النتيجة النهائية
-        result = {
-            'general_statistics': general_statistics,
-            'systems_statistics': systems_statistics,
-            'employees_by_system': {
-                'monthly_system': monthly_system_employees,
-                'production_system': production_system_employees,
-                'shift_system': shift_system_employees,
-                'hourly_employees': hourly_employees
+    # إحصائيات لكل نظام
+    systems_statistics = {
+        'monthly_system': {
+            'employee_count': 0,
+            'total_salaries': Decimal('0'),
+            'total_additions': Decimal('0'),
+            'total_deductions': Decimal('0'),
+            'attendance_summary': {
+                'full_days': 0,
+                'half_days': 0,
+                'online_days': 0,
+                'excused_absences': 0,
+                'unexcused_absences': 0
             }
+        },
+        'production_system': {
+            'employee_count': 0,
+            'total_salaries': Decimal('0'),
+            'total_production_value': Decimal('0'),
+            'total_pieces': 0,
+            'quality_summary': {
+                'A': {'count': 0, 'value': Decimal('0')},
+                'B': {'count': 0, 'value': Decimal('0')},
+                'C': {'count': 0, 'value': Decimal('0')},
+                'D': {'count': 0, 'value': Decimal('0')},
+                'E': {'count': 0, 'value': Decimal('0')}
+            }
+        },
+        'shift_system': {
+            'employee_count': 0,
+            'total_salaries': Decimal('0'),
+            'total_working_hours': 0,
+            'total_overtime_hours': 0,
+            'total_delay_minutes': 0,
+            'total_break_minutes': 0
         }
+    }
 
-        return jsonify(result), 200
-
-    except Exception as e:
-        print(f"Error in calculate_period_payroll: {str(e)}")
-        return jsonify({'message': f'Error calculating payroll: {str(e)}'}), 500
+    # نظام عمل كل موظف (يُحدد قبل الحساب لأن حفظ اللقطات ينهي صلاحية كائنات الجلسة)
+    employee_groups = [get_payroll_group(employee) for employee in employees]
+
+    # الرواتب من اللقطات المحفوظة، ويُعاد حساب من تغيرت مدخلاتهم فقط (بمدخلات محملة مسبقاً)
+    salary_results = PayrollSnapshotController.get_salary_results(employees, start_date, end_date)
+
+    # تجميع الإحصائيات
+    for employee, group in zip(employees, employee_groups):
+        salary_result = salary_results[employee.id]
+
+        # تحديث الإحصائيات العامة
+        general_statistics['total_basic_salaries'] += Decimal(salary_result['basic_salary'])
+        general_statistics['total_allowances'] += Decimal(salary_result['allowances'])
+        general_statistics['total_additions'] += Decimal(salary_result['additions'])
+        general_statistics['total_deductions'] += Decimal(salary_result['deductions'])
+        general_statistics['total_payroll'] += Decimal(salary_result['net_salary'])
+
+        # تصنيف الموظف حسب نظام عمله
+        if group == 'monthly':
+            monthly_system_employees.append(salary_result)
+            update_monthly_system_statistics(systems_statistics['monthly_system'], salary_result)
+        elif group == 'production':
+            production_system_employees.append(salary_result)
+            update_production_system_statistics(systems_statistics['production_system'], salary_result)
+        elif group == 'shift':
+            shift_system_employees.append(salary_result)
+            update_shift_system_statistics(systems_statistics['shift_system'], salary_result)
+        else:
+            hourly_employees.append(salary_result)
+
+    # تحديث عدد الموظفين في كل نظام
+    systems_statistics['monthly_system']['employee_count'] = len(monthly_system_employees)
+    systems_statistics['production_system']['employee_count'] = len(production_system_employees)
+    systems_statistics['shift_system']['employee_count'] = len(shift_system_employees)
+
+    # تنسيق القيم العشرية إلى نصوص
+    format_decimal_values(general_statistics)
+    format_system_statistics(systems_statistics)
+
+    # تجميع النتيجة النهائية
+    result = {
+        'general_statistics': general_statistics,
+        'systems_statistics': systems_statistics,
+        'employees_by_system': {
+            'monthly_system': monthly_system_employees,
+            'production_system': production_system_employees,
+            'shift_system': shift_system_employees,
+            'hourly_employees': hourly_employees
+        }
+    }
 
-def calculate_employee_salary_period(employee, start_date, end_date):
-    """حساب راتب موظف واحد لفترة محددة"""
+    return result
+
+def get_payroll_group(employee):
+    """مجموعة الموظف في تقرير الرواتب: monthly / production / shift / hourly"""
+    if not employee.job_title:
+        return 'hourly'
+    if employee.job_title.month_system:
+        return 'monthly'
+    if employee.job_title.production_system:
+        return 'production'
+    if employee.job_title.shift_system:
+        return 'shift'
+    return 'hourly'
+
+@job_handler('payroll_period')
+def run_payroll_period_job(payload):
+    """تنفيذ مهمة حساب الرواتب لفترة في الخلفية"""
+    user = User.query.get(payload['user_id'])
+    if not user:
+        return {'message': 'User not found'}, 404
+
+    start_date = datetime.strptime(payload['start_date'], '%Y-%m-%d').date()
+    end_date = datetime.strptime(payload['end_date'], '%Y-%m-%d').date()
+    return build_period_payroll(user, start_date, end_date), 200
+
+def calculate_employee_salary_period(employee, start_date, end_date, inputs=None):
+    """
+    حساب راتب موظف واحد لفترة محددة
+    inputs: مدخلات محملة مسبقاً (PayrollInputs) لتجنب الاستعلامات لكل موظف
+    """
     try:
         # حساب عدد الأيام في الفترة
         period_days = (end_date - start_date).days + 1
@@ -189,7 +247,7 @@ def calculate_employee_salary_period(employee, start_date, end_date):
         # التحقق من نوع الموظف وحساب الراتب حسب النظام
         if employee.profession and not employee.job_title:
             # موظف بنظام الساعات
-            hourly_result = calculate_hourly_system_period(employee, start_date, end_date)
+            hourly_result = calculate_hourly_system_period(employee, start_date, end_date, inputs)
             total_additions += Decimal(str(hourly_result.get('additions', '0')))
             total_deductions += Decimal(str(hourly_result.get('deductions', '0')))
             system_details = hourly_result.get('details', {})
@@ -198,20 +256,20 @@ def calculate_employee_salary_period(employee, start_date, end_date):
         elif employee.job_title:
             # موظف بمسمى وظيفي - حساب حسب نوع النظام
             if employee.job_title.month_system:
-                monthly_result = calculate_monthly_system_period(employee, start_date, end_date)
+                monthly_result = calculate_monthly_system_period(employee, start_date, end_date, inputs)
                 total_additions += Decimal(str(monthly_result.get('additions', '0')))
                 total_deductions += Decimal(str(monthly_result.get('deductions', '0')))
                 system_details = monthly_result.get('details', {})
                 system_type = 'monthly'
                 notes.append(monthly_result.get('notes', ''))
             elif employee.job_title.production_system:
-                production_result = calculate_production_system_period(employee, start_date, end_date)
+                production_result = calculate_production_system_period(employee, start_date, end_date, inputs)
                 total_additions += Decimal(str(production_result.get('additions', '0')))
                 system_details = production_result.get('details', {})
                 system_type = 'production'
                 notes.append(production_result.get('notes', ''))
             elif employee.job_title.shift_system:
-                shift_result = calculate_shift_system_period(employee, start_date, end_date)
+                shift_result = calculate_shift_system_period(employee, start_date, end_date, inputs)
                 total_additions += Decimal(str(shift_result.get('additions', '0')))
                 total_deductions += Decimal(str(shift_result.get('deductions', '0')))
                 system_details = shift_result.get('details', {})
@@ -219,7 +277,7 @@ def calculate_employee_salary_period(employee, start_date, end_date):
                 notes.append(shift_result.get('notes', ''))
 
         # حساب السلف للفترة
-        advances_result = calculate_advances_period(employee, start_date, end_date)
+        advances_result = calculate_advances_period(employee, start_date, end_date, inputs)
         advance_amount = Decimal(str(advances_result.get('amount', '0')))
         total_deductions += advance_amount
 
@@ -341,13 +399,16 @@ def calculate_insurance_for_period(employee, start_date, end_date):
         print(f"Error calculating insurance for period: {str(e)}")
         return Decimal('0')
 
-def calculate_monthly_system_period(employee, start_date, end_date):
+def calculate_monthly_system_period(employee, start_date, end_date, inputs=None):
     """حساب راتب النظام الشهري لفترة محددة"""
     try:
-        attendances = MonthlyAttendance.query.filter(
-            MonthlyAttendance.employee_id == employee.id,
-            MonthlyAttendance.date.between(start_date, end_date)
-        ).all()
+        if inputs is not None:
+            attendances = inputs.monthly_attendances.get(employee.id, [])
+        else:
+            attendances = MonthlyAttendance.query.filter(
+                MonthlyAttendance.employee_id == employee.id,
+                date_range(MonthlyAttendance.date, start_date, end_date)
+            ).all()
 
         # حساب المعدل اليومي بناءً على الراتب الشهري
         monthly_salary = Decimal(str(employee.salary or 0))
@@ -425,14 +486,17 @@ def calculate_monthly_system_period(employee, start_date, end_date):
     except Exception as e:
         raise Exception(f"Error in monthly system period calculation: {str(e)}")
 
-def calculate_production_system_period(employee, start_date, end_date):
+def calculate_production_system_period(employee, start_date, end_date, inputs=None):
     """حساب راتب نظام الإنتاج لفترة محددة"""
     try:
         # جلب سجلات الإنتاج للفترة المحددة
-        production_records = ProductionMonitoring.query.filter(
-            ProductionMonitoring.employee_id == employee.id,
-            ProductionMonitoring.date.between(start_date, end_date)
-        ).all()
+        if inputs is not None:
+            production_records = inputs.production_records.get(employee.id, [])
+        else:
+            production_records = ProductionMonitoring.query.filter(
+                ProductionMonitoring.employee_id == employee.id,
+                date_range(ProductionMonitoring.date, start_date, end_date)
+            ).all()
 
         # تهيئة المتغيرات للحساب
         total_production_value = Decimal('0')
@@ -543,7 +607,7 @@ def calculate_production_system_period(employee, start_date, end_date):
         raise Exception(f"Error in production system period calculation: {str(e)}")
 
 
-def calculate_shift_system_period(employee, start_date, end_date):
+def calculate_shift_system_period(employee, start_date, end_date, inputs=None):
     """حساب راتب نظام الورديات لفترة محددة مع دعم الإجازات المعتمدة"""
     try:
         # التحقق من وجود المسمى الوظيفي
@@ -558,7 +622,10 @@ def calculate_shift_system_period(employee, start_date, end_date):
         # التحقق من وجود الوردية
         shift = None
         if hasattr(employee, 'shift_id') and employee.shift_id:
-            shift = Shift.query.get(employee.shift_id)
+            if inputs is not None:
+                shift = inputs.shifts.get(employee.shift_id)
+            else:
+                shift = reference_cache.get(Shift, employee.shift_id)
         
         if not shift:
             return {
@@ -569,18 +636,30 @@ def calculate_shift_system_period(employee, start_date, end_date):
             }
 
         # جلب سجلات الحضور للفترة المحددة
-        attendances = (Attendance.query
-            .filter(
-                Attendance.empId == employee.id,
-                Attendance.checkInTime.isnot(None),
-                db.func.date(Attendance.checkInTime).between(start_date, end_date)
-            )
-            .order_by(db.func.date(Attendance.checkInTime), Attendance.checkInTime)
-            .all())
+        if inputs is not None:
+            attendances = inputs.attendances.get(employee.id, [])
+        else:
+            attendances = (Attendance.query
+                .filter(
+                    Attendance.empId == employee.id,
+                    Attendance.checkInTime.isnot(None),
+                    date_range(Attendance.createdAt, start_date, end_date)
+                )
+                .order_by(Attendance.createdAt, Attendance.checkInTime)
+                .all())
+
+        # تقييم أيام الفترة بمحرك الحضور (محسوبة مسبقاً لكل الموظفين عند وجود inputs)
+        if inputs is not None:
+            attendance_days = inputs.attendance_days
+        else:
+            attendance_days = evaluate_attendances(attendances, {employee.id: shift_week(shift)})
 
         # جلب الإجازات المعتمدة للفترة المحددة
         from app.models.leave import Leave
-        approved_leaves = Leave.get_employee_leaves_for_period(employee.id, start_date, end_date)
+        if inputs is not None:
+            approved_leaves = inputs.leaves.get(employee.id, [])
+        else:
+            approved_leaves = Leave.get_employee_leaves_for_period(employee.id, start_date, end_date)
 
         # إنشاء مصفوفة الإجازات مفهرسة بالتاريخ
         leaves_dict = {}
@@ -616,7 +695,8 @@ def calculate_shift_system_period(employee, start_date, end_date):
                     if isinstance(attendance.checkInTime, datetime):
                         date = attendance.checkInTime.date()
                     else:
-                        continue
+                        # checkInTime وقت فقط - اليوم هو تاريخ السجل
+                        date = attendance.createdAt
 
                     if start_date <= date <= end_date:
                         if date not in daily_records:
@@ -635,14 +715,18 @@ def calculate_shift_system_period(employee, start_date, end_date):
         period_details = []
         leave_summary = []
 
+        # جدول الوردية لكل أيام الفترة من التقويم المجمّع (بدون قراءة JSON داخل الحلقة)
+        schedule = shift.compiled_calendar().expand(start_date, end_date)
+
         # معالجة كل يوم على حدة
         current_date = start_date
         while current_date <= end_date:
             try:
                 day_name = get_day_name_english(current_date)
+                day_schedule = schedule[(current_date - start_date).days]
                 
                 # التحقق من كونه يوم عمل في الوردية
-                if not shift.is_working_day(day_name):
+                if not day_schedule[SLOT_ACTIVE]:
                     period_details.append({
                         'date': current_date.strftime('%Y-%m-%d'),
                         'day_name': day_name,
@@ -657,10 +741,11 @@ def calculate_shift_system_period(employee, start_date, end_date):
                     current_date += timedelta(days=1)
                     continue
 
-                # الحصول على أوقات العمل لهذا اليوم
-                day_start_time, day_end_time = shift.get_day_times(day_name)
+                # الحصول على أوقات العمل لهذا اليوم (بالدقائق، -1 إذا لم تُحدد)
+                day_start_minutes = int(day_schedule[SLOT_START])
+                day_end_minutes = int(day_schedule[SLOT_END])
                 
-                if not day_start_time or not day_end_time:
+                if day_start_minutes < 0 or day_end_minutes < 0:
                     period_details.append({
                         'date': current_date.strftime('%Y-%m-%d'),
                         'day_name': day_name,
@@ -716,10 +801,7 @@ def calculate_shift_system_period(employee, start_date, end_date):
                     # حساب الحضور مع مراعاة الإجازات الساعية
                     day_result = process_shift_day_with_approved_leaves(
                         day_attendances,
-                        day_start_time,
-                        day_end_time,
-                        shift.allowed_delay_minutes,
-                        shift.allowed_exit_minutes,
+                        attendance_days[(employee.id, current_date)],
                         allowed_break_minutes,
                         day_leave_hours
                     )
@@ -733,8 +815,8 @@ def calculate_shift_system_period(employee, start_date, end_date):
                         'date': current_date.strftime('%Y-%m-%d'),
                         'day_name': day_name,
                         'is_working_day': True,
-                        'scheduled_start': day_start_time.strftime('%H:%M'),
-                        'scheduled_end': day_end_time.strftime('%H:%M'),
+                        'scheduled_start': minutes_to_time_str(day_start_minutes),
+                        'scheduled_end': minutes_to_time_str(day_end_minutes),
                         'approved_leave_hours': day_leave_hours,
                         'leave_notes': leave_notes,
                         **day_result
@@ -747,8 +829,8 @@ def calculate_shift_system_period(employee, start_date, end_date):
                             'date': current_date.strftime('%Y-%m-%d'),
                             'day_name': day_name,
                             'is_working_day': True,
-                            'scheduled_start': day_start_time.strftime('%H:%M'),
-                            'scheduled_end': day_end_time.strftime('%H:%M'),
+                            'scheduled_start': minutes_to_time_str(day_start_minutes),
+                            'scheduled_end': minutes_to_time_str(day_end_minutes),
                             'working_minutes': 0,
                             'overtime_minutes': 0,
                             'delay_minutes': 0,
@@ -764,8 +846,8 @@ def calculate_shift_system_period(employee, start_date, end_date):
                             'date': current_date.strftime('%Y-%m-%d'),
                             'day_name': day_name,
                             'is_working_day': True,
-                            'scheduled_start': day_start_time.strftime('%H:%M'),
-                            'scheduled_end': day_end_time.strftime('%H:%M'),
+                            'scheduled_start': minutes_to_time_str(day_start_minutes),
+                            'scheduled_end': minutes_to_time_str(day_end_minutes),
                             'working_minutes': 0,
                             'overtime_minutes': 0,
                             'delay_minutes': 0,
@@ -837,63 +919,40 @@ def calculate_shift_system_period(employee, start_date, end_date):
         print(f"Error in shift period calculation: {str(e)}")
         raise Exception(f"Error in shift system period calculation: {str(e)}")
 
-def process_shift_day_with_approved_leaves(attendances, day_start_time, day_end_time, 
-                                         allowed_delay_minutes, allowed_exit_minutes, 
-                                         allowed_break_minutes, approved_leave_hours):
-    """معالجة سجلات الحضور ليوم واحد مع مراعاة الإجازات الساعية المعتمدة"""
+def process_shift_day_with_approved_leaves(attendances, day, allowed_break_minutes, approved_leave_hours):
+    """
+    معالجة سجلات الحضور ليوم واحد مع مراعاة الإجازات الساعية المعتمدة
+    day: نتيجة محرك الحضور لهذا اليوم (بالثواني) - نفس القيم التي يعرضها تقرير الحضور
+    """
     try:
-        day_start_minutes = time_to_minutes(day_start_time)
-        day_end_minutes = time_to_minutes(day_end_time)
-        day_duration = day_end_minutes - day_start_minutes
-        
         # تحويل ساعات الإجازة المعتمدة إلى دقائق
         approved_leave_minutes = approved_leave_hours * 60
-        
-        working_periods = []
-        total_break_minutes = 0
-        first_check_in = None
-        last_check_out = None
 
-        for i, attendance in enumerate(attendances):
+        working_periods = []
+        for attendance in attendances:
             if not attendance.checkInTime or not attendance.checkOutTime:
                 continue
-
             check_in_minutes = time_to_minutes(attendance.checkInTime)
             check_out_minutes = time_to_minutes(attendance.checkOutTime)
-
-            if first_check_in is None:
-                first_check_in = check_in_minutes
-            last_check_out = check_out_minutes
-
-            period_duration = check_out_minutes - check_in_minutes
-            if period_duration > 0:
+            if check_out_minutes > check_in_minutes:
                 working_periods.append({
                     'start': check_in_minutes,
                     'end': check_out_minutes,
-                    'duration': period_duration
+                    'duration': check_out_minutes - check_in_minutes
                 })
 
-            # حساب فترات الاستراحة
-            if i < len(attendances) - 1 and attendances[i+1].checkInTime:
-                next_check_in = time_to_minutes(attendances[i+1].checkInTime)
-                break_duration = next_check_in - check_out_minutes
-                if break_duration > 0:
-                    total_break_minutes += break_duration
+        total_working_minutes = int(day['worked'] // 60)
+        total_break_minutes = int(day['break_time'] // 60)
 
-        total_working_minutes = sum(period['duration'] for period in working_periods)
-        
         # إضافة دقائق الإجازة المعتمدة لإجمالي العمل
         effective_working_minutes = total_working_minutes + approved_leave_minutes
-        
-        # حساب التأخير (مع مراعاة الإجازات المعتمدة)
-        delay_minutes = max(0, first_check_in - day_start_minutes - allowed_delay_minutes) if first_check_in else 0
-        
-        # حساب الخروج المبكر
-        early_exit_minutes = max(0, day_end_minutes - last_check_out - allowed_exit_minutes) if last_check_out else 0
-        
+
+        # التأخير والخروج المبكر: الجزء الزائد عن السماح فقط
+        delay_minutes = int((day['late_excess'] + day['early_excess']) // 60)
+
         # حساب الساعات الإضافية (بناءً على العمل الفعلي + الإجازة المعتمدة)
-        overtime_minutes = max(0, effective_working_minutes - day_duration)
-        
+        overtime_minutes = int(overtime_seconds(day, approved_leave_minutes * 60) // 60)
+
         # حساب الاستراحة الزائدة
         excess_break_minutes = max(0, total_break_minutes - allowed_break_minutes)
 
@@ -902,12 +961,12 @@ def process_shift_day_with_approved_leaves(attendances, day_start_time, day_end_
             'effective_working_minutes': effective_working_minutes,
             'approved_leave_minutes': approved_leave_minutes,
             'overtime_minutes': overtime_minutes,
-            'delay_minutes': delay_minutes + early_exit_minutes,
+            'delay_minutes': delay_minutes,
             'break_minutes': total_break_minutes,
             'excess_break_minutes': excess_break_minutes,
             'periods': working_periods,
-            'first_check_in': minutes_to_time_str(first_check_in),
-            'last_check_out': minutes_to_time_str(last_check_out),
+            'first_check_in': minutes_to_time_str(seconds_to_minutes(day['first_in'])),
+            'last_check_out': minutes_to_time_str(seconds_to_minutes(day['last_out'])),
             'notes': f'يوم عمل - عمل فعلي: {total_working_minutes} دقيقة + إجازة معتمدة: {approved_leave_minutes} دقيقة'
         }
 
@@ -985,12 +1044,6 @@ def process_shift_day_with_schedule(attendances, day_start_time, day_end_time,
         raise
 
 
-def get_day_name_english(date):
-    """الحصول على اسم اليوم بالإنجليزية"""
-    days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-    return days[date.weekday()]
-
-
 def calculate_day_duration_minutes(start_time, end_time):
     """حساب مدة اليوم بالدقائق"""
     start_minutes = time_to_minutes(start_time)
@@ -998,7 +1051,7 @@ def calculate_day_duration_minutes(start_time, end_time):
     return end_minutes - start_minutes
 
 
-def calculate_hourly_system_period(employee, start_date, end_date):
+def calculate_hourly_system_period(employee, start_date, end_date, inputs=None):
     """حساب راتب نظام الساعات لفترة محددة"""
     try:
         # التحقق من وجود المهنة
@@ -1010,15 +1063,18 @@ def calculate_hourly_system_period(employee, start_date, end_date):
                 'notes': "لا توجد مهنة محددة للموظف"
             }
 
-        # جلب سجلات الحضور للفترة المحددة حسب checkInTime
-        attendances = (Attendance.query
-            .filter(
-                Attendance.empId == employee.id,
-                Attendance.checkInTime.isnot(None),
-                db.func.date(Attendance.checkInTime).between(start_date, end_date)
-            )
-            .order_by(db.func.date(Attendance.checkInTime), Attendance.checkInTime)
-            .all())
+        # جلب سجلات الحضور للفترة المحددة حسب تاريخ السجل
+        if inputs is not None:
+            attendances = inputs.attendances.get(employee.id, [])
+        else:
+            attendances = (Attendance.query
+                .filter(
+                    Attendance.empId == employee.id,
+                    Attendance.checkInTime.isnot(None),
+                    date_range(Attendance.createdAt, start_date, end_date)
+                )
+                .order_by(Attendance.createdAt, Attendance.checkInTime)
+                .all())
 
         if not attendances:
             return {
@@ -1043,16 +1099,16 @@ def calculate_hourly_system_period(employee, start_date, end_date):
         hourly_rate = Decimal(str(employee.profession.hourly_rate))
         daily_rate = Decimal(str(employee.profession.daily_rate))
 
-        # تجميع السجلات حسب اليوم بناءً على checkInTime
+        # تجميع السجلات حسب اليوم
         daily_records = {}
         for attendance in attendances:
             try:
-                # استخراج التاريخ من checkInTime
+                # استخراج التاريخ من checkInTime أو من تاريخ السجل
                 if attendance.checkInTime:
                     if isinstance(attendance.checkInTime, datetime):
                         date = attendance.checkInTime.date()
                     else:
-                        continue
+                        date = attendance.createdAt
 
                     # التأكد من أن التاريخ ضمن الفترة المطلوبة
                     if start_date <= date <= end_date:
@@ -1136,13 +1192,16 @@ def calculate_hourly_system_period(employee, start_date, end_date):
         print(f"Error in hourly system period calculation: {str(e)}")
         raise Exception(f"Error in hourly system period calculation: {str(e)}")
     
-def calculate_advances_period(employee, start_date, end_date):
+def calculate_advances_period(employee, start_date, end_date, inputs=None):
     """حساب السلف للفترة المحددة"""
     try:
-        advances = Advance.query.filter(
-            Advance.employee_id == employee.id,
-            Advance.date.between(start_date, end_date)
-        ).all()
+        if inputs is not None:
+            advances = inputs.advances.get(employee.id, [])
+        else:
+            advances = Advance.query.filter(
+                Advance.employee_id == employee.id,
+                date_range(Advance.date, start_date, end_date)
+            ).all()
 
         total_advances = sum(Decimal(str(advance.amount)) for advance in advances)
         
@@ -1355,10 +1414,6 @@ def process_shift_day(attendances, shift, allowed_break_minutes, delay_minute_va
         print(f"Error processing shift day: {str(e)}")
         raise
 
-def time_to_minutes(time_obj):
-    """تحويل كائن الوقت إلى دقائق"""
-    return time_obj.hour * 60 + time_obj.minute
-
 def minutes_to_time_str(minutes):
     """تحويل الدقائق إلى نص يمثل الوقت"""
     if minutes is None:
@@ -2070,34 +2125,11 @@ def generate_payslip_html(user, employee_id):
                 'message': f'Employee with ID {employee_id} not found'
             }), 404
         
-        # حساب الراتب
-        salary_result = calculate_employee_salary_period(employee, start_date, end_date)
+        # الراتب من اللقطة المحفوظة أو بإعادة الحساب عند تغير المدخلات
+        salary_result = PayrollSnapshotController.get_salary_result(employee, start_date, end_date)
         
         # تجهيز البيانات للنموذج
-        system_type = salary_result.get('system_type', 'none')
-        breakdown_details = get_breakdown_details(salary_result, system_type)
-        
-        context = {
-            'employee_name': employee.full_name,
-            'employee_id': employee.id,
-            'fingerprint_id': employee.fingerprint_id or '-',
-            'position': salary_result.get('position', '-'),
-            'system_type': get_system_type_display(system_type),
-            'period_start': start_date.strftime('%Y-%m-%d'),
-            'period_end': end_date.strftime('%Y-%m-%d'),
-            'period_days': salary_result['period_info']['total_days'],
-            'basic_salary': float(salary_result['basic_salary']),
-            'allowances': float(salary_result['allowances']),
-            'additions': float(salary_result['additions']),
-            'deductions': float(salary_result['deductions']),
-            'net_salary': float(salary_result['net_salary']),
-            'system_details': bool(breakdown_details),
-            'breakdown_title': f"تفاصيل {get_system_type_display(system_type)}",
-            'breakdown_details': breakdown_details,
-            'notes': salary_result.get('notes', ''),
-            'current_date': datetime.now().strftime('%Y-%m-%d'),
-            'generated_at': f"تم التوليد في: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        }
+        context = build_payslip_context(salary_result, start_date, end_date)
         
         # توليد HTML
         html_content = render_template_string(PAYSLIP_HTML_TEMPLATE, **context)
@@ -2150,8 +2182,8 @@ def preview_payslip_data(user, employee_id):
                 'message': f'Employee with ID {employee_id} not found'
             }), 404
         
-        # حساب الراتب
-        salary_result = calculate_employee_salary_period(employee, start_date, end_date)
+        # الراتب من اللقطة المحفوظة أو بإعادة الحساب عند تغير المدخلات
+        salary_result = PayrollSnapshotController.get_salary_result(employee, start_date, end_date)
         
         # تحضير البيانات
         preview_data = {
@@ -2174,6 +2206,124 @@ def preview_payslip_data(user, employee_id):
             'error': str(e)
         }), 500
 
+# رأس وذيل صفحة الوصلات المتعددة
+BATCH_PAYSLIPS_HTML_HEADER = """
+        <!DOCTYPE html>
+        <html lang="ar" dir="rtl">
+        <head>
+            <meta charset="UTF-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>وصلات الراتب - دفعة متعددة</title>
+            <style>
+                body {
+                    font-family: Arial, sans-serif;
+                    background-color: #f5f5f5;
+                    padding: 20px;
+                }
+                .batch-controls {
+                    text-align: center;
+                    margin-bottom: 20px;
+                    display: flex;
+                    gap: 10px;
+                    justify-content: center;
+                    flex-wrap: wrap;
+                }
+                .btn {
+                    padding: 10px 20px;
+                    border: none;
+                    border-radius: 4px;
+                    cursor: pointer;
+                    font-size: 14px;
+                    font-weight: bold;
+                }
+                .btn-print {
+                    background-color: #27ae60;
+                    color: white;
+                }
+                .btn-print:hover {
+                    background-color: #229954;
+                }
+                @media print {
+                    .batch-controls { display: none !important; }
+                    .page-separator { page-break-after: always; }
+                }
+            </style>
+        </head>
+        <body>
+            <div class="batch-controls">
+                <button class="btn btn-print" onclick="window.print()">🖨️ طباعة الكل</button>
+            </div>
+        """
+
+BATCH_PAYSLIPS_HTML_FOOTER = """
+        </body>
+        </html>
+        """
+
+# عدد الموظفين الذين تُحسب رواتبهم معاً في كل دفعة عند توليد الوصلات المتعددة
+PAYSLIP_BATCH_CHUNK_SIZE = 100
+
+def build_payslip_context(salary_result, start_date, end_date):
+    """تجهيز بيانات نموذج الوصل من نتيجة الراتب"""
+    system_type = salary_result.get('system_type', 'none')
+    breakdown_details = get_breakdown_details(salary_result, system_type)
+
+    return {
+        'employee_name': salary_result['employee_name'],
+        'employee_id': salary_result['employee_id'],
+        'fingerprint_id': salary_result['fingerprint_id'] or '-',
+        'position': salary_result.get('position', '-'),
+        'system_type': get_system_type_display(system_type),
+        'period_start': start_date.strftime('%Y-%m-%d'),
+        'period_end': end_date.strftime('%Y-%m-%d'),
+        'period_days': salary_result['period_info']['total_days'],
+        'basic_salary': float(salary_result['basic_salary']),
+        'allowances': float(salary_result['allowances']),
+        'additions': float(salary_result['additions']),
+        'deductions': float(salary_result['deductions']),
+        'net_salary': float(salary_result['net_salary']),
+        'system_details': bool(breakdown_details),
+        'breakdown_title': f"تفاصيل {get_system_type_display(system_type)}",
+        'breakdown_details': breakdown_details,
+        'notes': salary_result.get('notes', ''),
+        'current_date': datetime.now().strftime('%Y-%m-%d'),
+        'generated_at': f"تم التوليد في: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    }
+
+def iter_batch_payslips_html(employee_ids, start_date, end_date, errors):
+    """
+    توليد وصلات HTML لعدة موظفين واحداً تلو الآخر
+    - النموذج يُترجم مرة واحدة
+    - الرواتب تُجلب على دفعات (PAYSLIP_BATCH_CHUNK_SIZE) حتى تبقى الذاكرة ثابتة
+    - الأخطاء تُضاف إلى errors
+    """
+    template = current_app.jinja_env.from_string(PAYSLIP_HTML_TEMPLATE)
+    chunk_size = current_app.config.get('PAYSLIP_BATCH_CHUNK_SIZE', PAYSLIP_BATCH_CHUNK_SIZE)
+
+    for chunk_start in range(0, len(employee_ids), chunk_size):
+        chunk = employee_ids[chunk_start:chunk_start + chunk_size]
+
+        # جلب الموظفين والرواتب للدفعة (من اللقطات المحفوظة أو بإعادة الحساب)
+        valid_ids = [int(emp_id) for emp_id in chunk if str(emp_id).isdigit()]
+        employees = Employee.query.filter(Employee.id.in_(valid_ids)).all() if valid_ids else []
+        salary_results = PayrollSnapshotController.get_salary_results(employees, start_date, end_date)
+
+        for emp_id in chunk:
+            try:
+                salary_result = salary_results.get(int(emp_id)) if str(emp_id).isdigit() else None
+                if not salary_result:
+                    errors.append(f"Employee {emp_id} not found")
+                    continue
+
+                yield template.render(**build_payslip_context(salary_result, start_date, end_date))
+
+            except Exception as e:
+                errors.append(f"Error processing employee {emp_id}: {str(e)}")
+                continue
+
+        # تحرير كائنات الدفعة من الجلسة قبل الانتقال للدفعة التالية
+        db.session.expunge_all()
+
 @payroll_bp.route('/api/payslip/batch/html', methods=['POST'])
 @token_required
 def generate_batch_payslips_html(user):
@@ -2211,50 +2361,27 @@ def generate_batch_payslips_html(user):
                 'message': 'employee_ids must be a non-empty list'
             }), 400
         
-        # توليد وصلات متعددة
-        payslips_html_parts = []
+        stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes') or data.get('stream') is True
         errors = []
-        
-        for emp_id in employee_ids:
-            try:
-                employee = Employee.query.get(emp_id)
-                if not employee:
-                    errors.append(f"Employee {emp_id} not found")
-                    continue
-                
-                salary_result = calculate_employee_salary_period(employee, start_date, end_date)
-                
-                system_type = salary_result.get('system_type', 'none')
-                breakdown_details = get_breakdown_details(salary_result, system_type)
-                
-                context = {
-                    'employee_name': employee.full_name,
-                    'employee_id': employee.id,
-                    'fingerprint_id': employee.fingerprint_id or '-',
-                    'position': salary_result.get('position', '-'),
-                    'system_type': get_system_type_display(system_type),
-                    'period_start': start_date.strftime('%Y-%m-%d'),
-                    'period_end': end_date.strftime('%Y-%m-%d'),
-                    'period_days': salary_result['period_info']['total_days'],
-                    'basic_salary': float(salary_result['basic_salary']),
-                    'allowances': float(salary_result['allowances']),
-                    'additions': float(salary_result['additions']),
-                    'deductions': float(salary_result['deductions']),
-                    'net_salary': float(salary_result['net_salary']),
-                    'system_details': bool(breakdown_details),
-                    'breakdown_title': f"تفاصيل {get_system_type_display(system_type)}",
-                    'breakdown_details': breakdown_details,
-                    'notes': salary_result.get('notes', ''),
-                    'current_date': datetime.now().strftime('%Y-%m-%d'),
-                    'generated_at': f"تم التوليد في: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                }
-                
-                payslip_html = render_template_string(PAYSLIP_HTML_TEMPLATE, **context)
-                payslips_html_parts.append(payslip_html)
-                
-            except Exception as e:
-                errors.append(f"Error processing employee {emp_id}: {str(e)}")
-                continue
+
+        if stream:
+            # وضع الدفق: ذاكرة ثابتة مهما كان عدد الموظفين، والأخطاء تُعرض في نهاية الصفحة
+            def generate():
+                yield BATCH_PAYSLIPS_HTML_HEADER
+                for i, payslip_html in enumerate(iter_batch_payslips_html(employee_ids, start_date, end_date, errors)):
+                    if i > 0:
+                        yield '<div class="page-separator"></div>'
+                    yield payslip_html
+                if errors:
+                    yield '<div class="batch-controls">' + '<br>'.join(str(escape(error)) for error in errors) + '</div>'
+                yield BATCH_PAYSLIPS_HTML_FOOTER
+
+            return Response(stream_with_context(generate()), mimetype='text/html', headers={
+                'Content-Disposition': 'inline; filename="payslips_batch.html"'
+            })
+
+        # توليد وصلات متعددة
+        payslips_html_parts = list(iter_batch_payslips_html(employee_ids, start_date, end_date, errors))
         
         if not payslips_html_parts:
             return jsonify({
@@ -2263,63 +2390,14 @@ def generate_batch_payslips_html(user):
             }), 400
         
         # دمج جميع الوصلات
-        batch_html = f"""
-        <!DOCTYPE html>
-        <html lang="ar" dir="rtl">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>وصلات الراتب - دفعة متعددة</title>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    background-color: #f5f5f5;
-                    padding: 20px;
-                }}
-                .batch-controls {{
-                    text-align: center;
-                    margin-bottom: 20px;
-                    display: flex;
-                    gap: 10px;
-                    justify-content: center;
-                    flex-wrap: wrap;
-                }}
-                .btn {{
-                    padding: 10px 20px;
-                    border: none;
-                    border-radius: 4px;
-                    cursor: pointer;
-                    font-size: 14px;
-                    font-weight: bold;
-                }}
-                .btn-print {{
-                    background-color: #27ae60;
-                    color: white;
-                }}
-                .btn-print:hover {{
-                    background-color: #229954;
-                }}
-                @media print {{
-                    .batch-controls {{ display: none !important; }}
-                    .page-separator {{ page-break-after: always; }}
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="batch-controls">
-                <button class="btn btn-print" onclick="window.print()">🖨️ طباعة الكل</button>
-            </div>
-        """
+        batch_html = BATCH_PAYSLIPS_HTML_HEADER
         
         for i, payslip in enumerate(payslips_html_parts):
             if i > 0:
                 batch_html += '<div class="page-separator"></div>'
             batch_html += payslip
         
-        batch_html += """
-        </body>
-        </html>
-        """
+        batch_html += BATCH_PAYSLIPS_HTML_FOOTER
         
         return batch_html, 200, {
             'Content-Type': 'text/html; charset=utf-8',
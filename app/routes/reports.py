@@ -17,7 +17,11 @@ from app import db
 from app.models import Attendance, Employee, Shift, JobTitle, Profession
 from app.models.user import User
 from app.routes.payroll import calculate_employee_salary_period
+from app.controllers.payroll_snapshot_controller import PayrollSnapshotController
 from app.utils import token_required
+from app.date_ranges import date_range
+from app.reference_cache import reference_cache
+from app.attendance_engine import time_to_seconds
 from reportlab.lib.colors import HexColor
 # استيراد دوال حساب الراتب
 from app.routes.payroll import calculate_employee_salary_period
@@ -216,12 +220,6 @@ def process_table_data(data):
         processed_data.append(processed_row)
     return processed_data
 
-def time_to_seconds(t):
-    """تحويل كائن الوقت إلى ثوان منذ منتصف الليل"""
-    if t is None:
-        return 0
-    return t.hour * 3600 + t.minute * 60 + t.second
-
 def seconds_to_time_string(seconds):
     """تحويل الثوان إلى نص وقت قابل للقراءة"""
     hours = seconds // 3600
@@ -328,7 +326,7 @@ def process_daily_attendance(employee, date, attendances):
     # التحقق من الالتزام بالوردية
     shift_note = ""
     if employee.work_system == 'shift' and employee.shift_id:
-        shift = Shift.query.get(employee.shift_id)
+        shift = reference_cache.get(Shift, employee.shift_id)
         if shift and attendances:
             first_checkin = min(att.checkInTime for att in attendances if att.checkInTime)
             allowed_delay = timedelta(minutes=shift.allowed_delay_minutes)
@@ -400,7 +398,7 @@ def create_employee_report_pdf(employee, start_date, end_date, daily_data, summa
     
     # إضافة معلومات الوردية إذا كان نظام ورديات
     if employee.work_system == 'shift' and employee.shift_id:
-        shift = Shift.query.get(employee.shift_id)
+        shift = reference_cache.get(Shift, employee.shift_id)
         if shift:
             employee_info.extend([
                 [process_arabic_text('بداية الوردية:'), shift.start_time.strftime('%H:%M')],
@@ -741,8 +739,7 @@ def generate_employee_report(user_id, employee_id):
         # الحصول على سجلات الحضور - تم تصحيح الاستعلام
         attendances = Attendance.query.filter(
             Attendance.empId == employee_id,
-            Attendance.createdAt >= start_date,
-            Attendance.createdAt <= end_date
+            date_range(Attendance.createdAt, start_date, end_date)
         ).order_by(Attendance.createdAt).all()
         
         # معالجة البيانات اليومية
@@ -853,8 +850,7 @@ def generate_general_report(user_id):
             # الحصول على سجلات الحضور للموظف - تم إصلاح التحويل هنا
             attendances = Attendance.query.filter(
                 Attendance.empId == employee.id,
-                Attendance.createdAt >= start_date,
-                Attendance.createdAt <= end_date
+                date_range(Attendance.createdAt, start_date, end_date)
             ).order_by(Attendance.createdAt).all()
             
             # معالجة البيانات اليومية للموظف
@@ -997,8 +993,8 @@ def generate_payslip_pdf(user, employee_id):
         if employee not in accessible_employees:
             return jsonify({'message': 'Access denied to this employee'}), 403
 
-        # حساب راتب الموظف للفترة المحددة
-        salary_result = calculate_employee_salary_period(employee, start_date, end_date)
+        # راتب الموظف للفترة من اللقطة المحفوظة أو بإعادة الحساب عند تغير المدخلات
+        salary_result = PayrollSnapshotController.get_salary_result(employee, start_date, end_date)
         
         # إنشاء ملف PDF
         pdf_buffer = create_payslip_pdf(employee, salary_result)
@@ -1117,7 +1113,7 @@ def preview_payslip(user, employee_id):
             return jsonify({'message': f'Employee with ID {employee_id} not found'}), 404
 
         # حساب راتب الموظف
-        salary_result = calculate_employee_salary_period(employee, start_date, end_date)
+        salary_result = PayrollSnapshotController.get_salary_result(employee, start_date, end_date)
         
         # إضافة معلومات إضافية للمعاينة
         preview_data = {
@@ -1,6 +1,8 @@
 # routes/transaction_routes.py
 
 from flask import Blueprint, request, jsonify
+from sqlalchemy import case, func
+from sqlalchemy.orm import joinedload
 from app import db
 from app.utils import token_required
 from app.models.transaction import Transaction, TransactionApproval
@@ -189,15 +191,34 @@ def get_transactions(user):
         if not current_user:
             return jsonify({'message': 'المستخدم غير موجود'}), 404
         
+        # عدد الموافقات لكل حالة في استعلام فرعي مجمّع واحد بدلاً من أربعة استعلامات لكل معاملة
+        approval_counts = db.session.query(
+            TransactionApproval.transaction_id.label('transaction_id'),
+            func.count(TransactionApproval.id).label('total'),
+            func.sum(case((TransactionApproval.status == 'approved', 1), else_=0)).label('approved'),
+            func.sum(case((TransactionApproval.status == 'rejected', 1), else_=0)).label('rejected'),
+            func.sum(case((TransactionApproval.status == 'pending', 1), else_=0)).label('pending')
+        ).group_by(TransactionApproval.transaction_id).subquery()
+
         # فلترة المعاملات حسب صلاحيات المستخدم
-        query = Transaction.query
+        query = db.session.query(
+            Transaction,
+            approval_counts.c.total,
+            approval_counts.c.approved,
+            approval_counts.c.rejected,
+            approval_counts.c.pending
+        ).outerjoin(
+            approval_counts, approval_counts.c.transaction_id == Transaction.id
+        ).options(
+            # الموظف وطالب المعاملة في نفس الاستعلام
+            joinedload(Transaction.employee),
+            joinedload(Transaction.requester)
+        )
         
         if not current_user.is_super_admin():
-            # إظهار المعاملات التي يمكن للمستخدم الوصول إليها
-            accessible_employee_ids = [emp.id for emp in current_user.get_accessible_employees()]
-            
-            if accessible_employee_ids:
-                query = query.filter(Transaction.employee_id.in_(accessible_employee_ids))
+            # إظهار المعاملات التي يمكن للمستخدم الوصول إليها (استعلام فرعي بدلاً من تحميل الموظفين)
+            if current_user.has_accessible_employees():
+                query = query.filter(Transaction.employee_id.in_(current_user.accessible_employee_ids_subquery()))
             else:
                 # إذا لم يكن له صلاحية على أي موظف، إظهار المعاملات التي طلبها فقط
                 query = query.filter(Transaction.requested_by == user.id)
@@ -231,12 +252,7 @@ def get_transactions(user):
         )
         
         result = []
-        for transaction in transactions.items:
-            # حساب عدد الموافقات
-            total_approvals = transaction.approvals.count()
-            approved_count = transaction.approvals.filter_by(status='approved').count()
-            rejected_count = transaction.approvals.filter_by(status='rejected').count()
-            pending_count = transaction.approvals.filter_by(status='pending').count()
+        for transaction, total_approvals, approved_count, rejected_count, pending_count in transactions.items:
             
             # معلومات الموظف
             employee_data = {
@@ -263,10 +279,10 @@ def get_transactions(user):
                 'notes': transaction.notes,
                 'reason_for_rejection': transaction.reason_for_rejection,
                 'approvals': {
-                    'total': total_approvals,
-                    'approved': approved_count,
-                    'rejected': rejected_count,
-                    'pending': pending_count
+                    'total': total_approvals or 0,
+                    'approved': int(approved_count or 0),
+                    'rejected': int(rejected_count or 0),
+                    'pending': int(pending_count or 0)
                 },
                 'created_at': transaction.created_at.isoformat(),
                 'updated_at': transaction.updated_at.isoformat(),
@@ -303,8 +319,7 @@ def get_transaction(user, transaction_id):
         
         # التحقق من صلاحية الوصول
         if not current_user.is_super_admin():
-            accessible_employee_ids = [emp.id for emp in current_user.get_accessible_employees()]
-            if transaction.employee_id not in accessible_employee_ids and transaction.requested_by != user.id:
+            if transaction.requested_by != user.id and not current_user.can_access_employee(transaction.employee_id):
                 return jsonify({'message': 'ليس لديك صلاحية للوصول إلى هذه المعاملة'}), 403
         
         # معلومات التفصيلية للموافقات
@@ -534,9 +549,8 @@ def get_transaction_statistics(user):
         query = Transaction.query
         
         if not current_user.is_super_admin():
-            accessible_employee_ids = [emp.id for emp in current_user.get_accessible_employees()]
-            if accessible_employee_ids:
-                query = query.filter(Transaction.employee_id.in_(accessible_employee_ids))
+            if current_user.has_accessible_employees():
+                query = query.filter(Transaction.employee_id.in_(current_user.accessible_employee_ids_subquery()))
             else:
                 query = query.filter(Transaction.requested_by == user.id)
         
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from app import db
 from app.models.user import UserBranchHead, UserDepartmentHead
 from app.utils import token_required
+from app.principal_cache import principal_cache
 from app.models import Branch, Department, User, Employee, JobTitle
 from sqlalchemy import or_, and_, not_, func
 from werkzeug.security import generate_password_hash
@@ -375,6 +376,7 @@ def update_user(current_user_id, id):
             user.user_type = new_user_type
         
         db.session.commit()
+        principal_cache.invalidate(id)
         
         return jsonify({
             'message': 'تم تحديث المستخدم بنجاح',
@@ -488,6 +490,7 @@ def delete_user(current_user, id):
         # 7. حذف المستخدم نفسه
         db.session.delete(user)
         db.session.commit()
+        principal_cache.invalidate(id)
         
         print(f"Successfully deleted user: {username}")
         
@@ -559,6 +562,7 @@ def toggle_user_status(current_user_id, id):
         # تغيير حالة المستخدم
         user.is_active = not user.is_active
         db.session.commit()
+        principal_cache.invalidate(id)
         
         status = 'تفعيل' if user.is_active else 'تعطيل'
         
@@ -0,0 +1,122 @@
+# app/shift_calendar.py
+"""
+تقويم الوردية المجمّع:
+- يُبنى من daily_schedule مرة واحدة لكل (shift_id, updated_at) ويُحفظ في ذاكرة العملية
+- مصفوفة 7 أيام حسب date.weekday(): (نشط، دقيقة البداية، دقيقة النهاية، سماح الدخول، سماح الخروج)
+  والوقت غير المحدد أو غير الصالح قيمته -1
+- expand يحوّل نطاق تاريخ إلى مصفوفة جدول جاهزة حتى لا تقرأ حلقات الرواتب والتقارير JSON
+"""
+import threading
+from datetime import time
+import numpy as np
+
+# ترتيب أيام الأسبوع حسب date.weekday()
+DAY_NAMES = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+# أعمدة صف اليوم
+SLOT_ACTIVE, SLOT_START, SLOT_END, SLOT_GRACE_IN, SLOT_GRACE_OUT = range(5)
+
+
+def get_day_name_english(date):
+    """اسم اليوم بالإنجليزية بأحرف صغيرة كما في مفاتيح daily_schedule"""
+    return DAY_NAMES[date.weekday()]
+
+
+def _parse_time(value):
+    try:
+        return time.fromisoformat(value) if value else None
+    except (ValueError, TypeError):
+        return None
+
+
+class ShiftCalendar:
+    """
+    جدول وردية مجمّع - للقراءة فقط ومشترك بين الطلبات
+    """
+
+    def __init__(self, week, start_times, end_times):
+        self.week = week
+        self.start_times = start_times
+        self.end_times = end_times
+
+        self.active = week[:, SLOT_ACTIVE] > 0
+        # يوم عمل فعلي: نشط وله وقتا بداية ونهاية صالحان
+        self.working = self.active & (week[:, SLOT_START] >= 0) & (week[:, SLOT_END] >= 0)
+
+        # نفس المصفوفة بالثواني لمحرك الحضور، وأيام غير العمل أصفار
+        self.week_seconds = np.where(self.working[:, None], week * 60, 0).astype(np.float64)
+        self.week_seconds[self.working, SLOT_ACTIVE] = 1
+
+    @classmethod
+    def from_shift(cls, shift):
+        week = np.full((7, 5), -1, dtype=np.int32)
+        week[:, SLOT_ACTIVE] = 0
+        week[:, SLOT_GRACE_IN] = shift.allowed_delay_minutes or 0
+        week[:, SLOT_GRACE_OUT] = shift.allowed_exit_minutes or 0
+        start_times = [None] * 7
+        end_times = [None] * 7
+
+        schedule = shift.daily_schedule or {}
+        for weekday, day_name in enumerate(DAY_NAMES):
+            day_schedule = schedule.get(day_name) or {}
+            if not day_schedule.get('is_active', False):
+                continue
+            week[weekday, SLOT_ACTIVE] = 1
+
+            start_time = _parse_time(day_schedule.get('start_time'))
+            end_time = _parse_time(day_schedule.get('end_time'))
+            if not start_time or not end_time:
+                continue
+            week[weekday, SLOT_START] = start_time.hour * 60 + start_time.minute
+            week[weekday, SLOT_END] = end_time.hour * 60 + end_time.minute
+            start_times[weekday] = start_time
+            end_times[weekday] = end_time
+
+        week.setflags(write=False)
+        return cls(week, tuple(start_times), tuple(end_times))
+
+    def is_active(self, weekday):
+        """اليوم مفعّل في جدول الوردية (حتى لو لم تُحدد أوقاته)"""
+        return bool(self.active[weekday])
+
+    def is_working_day(self, weekday):
+        """اليوم مفعّل وله أوقات صالحة"""
+        return bool(self.working[weekday])
+
+    def day_times(self, weekday):
+        """(وقت البداية، وقت النهاية) لليوم أو (None, None)"""
+        return self.start_times[weekday], self.end_times[weekday]
+
+    def expand(self, start_date, end_date):
+        """
+        جدول كل يوم من start_date إلى end_date (شامل): مصفوفة (عدد الأيام، 5)
+        الصف i هو يوم start_date + i
+        """
+        days = (end_date - start_date).days + 1
+        if days <= 0:
+            return self.week[:0]
+        weekdays = (np.arange(days) + start_date.weekday()) % 7
+        return self.week[weekdays]
+
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def compile_shift(shift):
+    """
+    التقويم المجمّع للوردية من الذاكرة، ويُعاد بناؤه فقط عند تغير updated_at أو فترات السماح
+    """
+    if shift.id is None:
+        return ShiftCalendar.from_shift(shift)
+
+    version = (shift.updated_at, shift.allowed_delay_minutes, shift.allowed_exit_minutes)
+    with _lock:
+        entry = _cache.get(shift.id)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    calendar = ShiftCalendar.from_shift(shift)
+    with _lock:
+        _cache[shift.id] = (version, calendar)
+    return calendar
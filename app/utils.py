@@ -25,8 +25,9 @@ def verify_token(token):
 
 
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
 from app.models.user import User
+from app.principal_cache import principal_cache
 
 def token_required(f):
     @wraps(f)
@@ -48,8 +49,8 @@ def token_required(f):
         if not payload:
             return jsonify({'message': 'رمز غير صالح أو منتهي الصلاحية'}), 401
 
-        # الحصول على المستخدم من قاعدة البيانات
-        user = User.query.get(payload['user_id'])
+        # الحصول على المستخدم من الذاكرة المؤقتة (أو من قاعدة البيانات عند انتهاء صلاحيتها)
+        user = principal_cache.get_user(payload['user_id'])
         if not user:
             return jsonify({'message': 'المستخدم غير موجود'}), 404
         
@@ -71,4 +72,32 @@ def permission_required(action, resource):
             
             return f(user, *args, **kwargs)
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
+
+
+def stream_json_array(items):
+    """
+    إرسال قائمة JSON على شكل دفق (streaming) عنصراً بعنصر
+    بدلاً من بناء الرد كاملاً في الذاكرة
+    """
+    def generate():
+        yield '['
+        first = True
+        for item in items:
+            yield ('' if first else ',') + current_app.json.dumps(item)
+            first = False
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def stream_ndjson(items):
+    """
+    إرسال العناصر بصيغة NDJSON: كائن JSON واحد في كل سطر
+    يستطيع العميل معالجة كل سطر فور وصوله
+    """
+    def generate():
+        for item in items:
+            yield current_app.json.dumps(item) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')